@@ -0,0 +1,13 @@
+import sys
+
+from src.game import MapType, build_radar_table
+from src.game.radar_table import builtin_radar_table_path
+
+
+if __name__ == "__main__":
+    # usage: python build_radar_tables.py [map type, e.g. PWR] - all built-in maps by default, for DEFAULT_RADARS
+    # a one-off job of a few minutes per map, see use_radar_table
+    map_types = [MapType[name] for name in sys.argv[1:]] or [MapType.CIRCLE, MapType.W_SHAPED, MapType.PWR]
+    for map_type in map_types:
+        build_radar_table(map_type, builtin_radar_table_path(map_type))
+        print(f"{map_type.name}: {builtin_radar_table_path(map_type)}")
@@ -0,0 +1,32 @@
+import sys
+
+from src.game import MapMeta, MapType, compile_track
+from src.game.tracks import builtin_bundle_path
+
+
+if __name__ == "__main__":
+    # usage: python compile_track.py - compiles built-in maps into tracks/, so that every process maps them instantly
+    #        python compile_track.py <track.png> <finish_line.png> <bundle> <start x> <start y> <start angle>
+    if len(sys.argv) == 1:
+        for map_type in (MapType.CIRCLE, MapType.W_SHAPED, MapType.PWR):
+            path = builtin_bundle_path(map_type.name)
+            path.unlink(missing_ok=True)  # built-in metadata comes from the code, not from an outdated bundle
+            meta = MapMeta(map_type)
+            bundle = compile_track(
+                meta.track,
+                meta.finish_line,
+                path,
+                meta.car_initial_pos,
+                meta.car_initial_angle,
+                crossing_point=meta.finish_line_crossing_point,
+                checkpoints=[checkpoint.rect for checkpoint in meta.checkpoints],
+                name=map_type.name
+            )
+            print(f"{map_type.name}: {bundle.path}, lap of {bundle.lap_length:.0f} px")
+    else:
+        track, finish_line, path, x, y, angle = sys.argv[1:7]
+        bundle = compile_track(track, finish_line, path, (int(x), int(y)), float(angle))
+        print(
+            f"{bundle.name}: {bundle.path}, lap of {bundle.lap_length:.0f} px, {len(bundle.checkpoints)} checkpoints, "
+            f"crossing point {bundle.crossing_point}"
+        )
@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import neat
+from dill import loads
+
+from src.ai.neat import export_genome
+
+
+if __name__ == "__main__":
+    CONFIG_PATH = Path("src/ai/neat/configs/pwr.ini")
+    BEST_GENOME = Path("checkopoints/pwr/best_genome")
+    config = neat.Config(
+        genome_type=neat.DefaultGenome,
+        stagnation_type=neat.DefaultStagnation,
+        reproduction_type=neat.DefaultReproduction,
+        species_set_type=neat.DefaultSpeciesSet,
+        filename=str(CONFIG_PATH.resolve())
+    )
+    with open(BEST_GENOME, 'rb') as fh:
+        genome = loads(fh.read())
+    network = export_genome(genome, config, str(BEST_GENOME.with_suffix(".net")))
+    print(f"Exported {network.n_nodes} nodes to {BEST_GENOME.with_suffix('.net')}")
@@ -1,34 +1,31 @@
 import os
 
-import neat
 from pathlib import Path
 from bullet import Bullet, Check, styles, YesNo
 
-from src.game import OnePlayerController, MapType, PlayerVersusNeatController, PlayerVersusDqnController
-from src.ai.dqn import CarRacingEnv
+from src.game import (
+    OnePlayerController,
+    MapType,
+    PlayerVersusNeatController,
+    PlayerVersusDqnController,
+    PlayerVersusFieldController
+)
 
 
 if __name__ == "__main__":
     CHECKPOINT = Path("dqn_best")
-    CONFIG_PATH = Path("src/ai/neat/configs/pwr.ini")
-    BEST_GENOME = Path("checkopoints/pwr/best_genome")
-    config = neat.Config(
-        genome_type=neat.DefaultGenome,
-        stagnation_type=neat.DefaultStagnation,
-        reproduction_type=neat.DefaultReproduction,
-        species_set_type=neat.DefaultSpeciesSet,
-        filename=str(CONFIG_PATH.resolve())
-    )
+    BEST_NETWORK = Path("checkopoints/pwr/best_genome.net")  # see export_genome.py
+    FIELD_NETWORKS = Path("checkopoints")  # every exported network found here races in the field
     os.system("clear")
     maps = ['Circle', 'W', 'PWR']
-    options = ['Draw radars', 'Hardcore mode']
+    options = ['Draw radars', 'Hardcore mode', 'Car collisions']
 
     prompt = YesNo("Would U like to play against AI?", default='y')
     multiplayer = prompt.launch()
     if multiplayer:
         prompt = Bullet(
-            prompt="NEAT or DQN? ",
-            choices=["NEAT", "DQN"],
+            prompt="NEAT, DQN or the whole field? ",
+            choices=["NEAT", "DQN", "Field"],
             indent=0,
             align=5,
             margin=2,
@@ -59,20 +56,32 @@ if __name__ == "__main__":
             print("Running NEAT\n")
             controller = PlayerVersusNeatController(
                 map_type=map_type,
-                config=config,
-                genome_path=str(BEST_GENOME.resolve()),
+                network_path=str(BEST_NETWORK.resolve()),
+                max_angular_velocity=6.,
+                draw_radars="Draw radars" in options,
+                hardcore="Hardcore mode" in options,
+                car_contacts="Car collisions" in options
+            )
+        elif "Field" in ai:
+            print("Running field\n")
+            controller = PlayerVersusFieldController(
+                map_type=map_type,
+                network_paths=[str(path.resolve()) for path in sorted(FIELD_NETWORKS.rglob("*.net"))],
                 max_angular_velocity=6.,
                 draw_radars="Draw radars" in options,
-                hardcore="Hardcore mode" in options
+                hardcore="Hardcore mode" in options,
+                car_contacts="Car collisions" in options
             )
         else:
             print("Running DQN\n")
+            from src.ai.dqn import CarRacingEnv  # loads TensorFlow, so only when it's really needed
             controller = PlayerVersusDqnController(
                 map_type=map_type,
                 checkpoint_path=str(CHECKPOINT.resolve()),
                 max_angular_velocity=5.7,
                 draw_radars="Draw radars" in options,
-                hardcore="Hardcore mode" in options
+                hardcore="Hardcore mode" in options,
+                car_contacts="Car collisions" in options
             )
             env = CarRacingEnv.tf_environment(with_gui=False, get_observation=controller.get_observation)
             controller.set_env(env)
@@ -81,6 +90,7 @@ if __name__ == "__main__":
             map_type=map_type,
             max_angular_velocity=6.,
             draw_radars="Draw radars" in options,
-            hardcore="Hardcore mode" in options
+            hardcore="Hardcore mode" in options,
+            car_contacts="Car collisions" in options
         )
     controller.run()
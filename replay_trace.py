@@ -0,0 +1,25 @@
+import sys
+from pathlib import Path
+from time import perf_counter
+
+from decouple import config
+
+from src.game import Trace, TraceReplayer
+
+
+if __name__ == "__main__":
+    # usage: python replay_trace.py <trace or directory of traces> [bundle of a custom track]
+    target = Path(sys.argv[1])
+    bundle = sys.argv[2] if len(sys.argv) > 2 else None
+    paths = sorted(target.glob("*.trace")) if target.is_dir() else [target]
+    fps = config('FPS', cast=int)
+    for path in paths:
+        trace = Trace.load(str(path))
+        start = perf_counter()
+        verified = TraceReplayer(trace, bundle).verify()
+        elapsed = perf_counter() - start
+        print(
+            f"{path.name}: {len(trace.cars)} cars, {trace.ticks} ticks, {path.stat().st_size} B, "
+            f"replayed {trace.ticks / fps / max(elapsed, 1e-9):.0f}x real time, "
+            f"{'OK' if verified else 'MISMATCH'}"
+        )
@@ -1 +1,20 @@
-from .utils import get_ann, get_agent
+from importlib import import_module
+
+# Exports are resolved lazily, so that importing e.g. AsyncCheckpointer doesn't load TensorFlow
+_EXPORTS = {
+    'get_ann': '.utils',
+    'get_conv_ann': '.utils',
+    'get_agent': '.utils',
+    'AsyncCheckpointer': '.checkpoint',
+    'load_weights': '.checkpoint'
+}
+
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        return getattr(import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
@@ -0,0 +1,165 @@
+import os
+import re
+from pathlib import Path
+from queue import Queue, Empty
+from threading import Thread
+from time import monotonic
+from typing import Optional, List, Dict, Tuple, Union
+
+import numpy as np
+
+
+def load_weights(ckpt: Union[str, Path], group: str = 'q') -> List[np.ndarray]:
+    """
+    Reads weights of a single variables' group from AsyncCheckpointer's checkpoint, without TensorFlow.
+    ckpt is either a checkpoint file or a directory, whose latest checkpoint is used.
+    """
+    path = Path(ckpt)
+    if path.is_dir():
+        checkpoints = AsyncCheckpointer(str(path), agent=None)._checkpoints()
+        if not checkpoints:
+            raise FileNotFoundError(f"No checkpoints in {path}")
+        path = checkpoints[-1][1]
+    with np.load(path) as data:
+        return [data[f"{group}/{i}"] for i in range(int(data[f"{group}/count"]))]
+
+
+class AsyncCheckpointer:
+    """
+    Interval based DqnAgent checkpointing.
+
+    Weights are copied in the training thread (cheap, in memory) and written to disk by a background thread,
+    so the learner keeps stepping while a checkpoint is in flight. Every file is written under a temporary
+    name and atomically renamed, hence a crash never leaves a torn checkpoint behind.
+    """
+
+    _FILE_PATTERN = re.compile(r"^ckpt-(\d+)\.npz$")
+
+    def __init__(
+            self,
+            ckpt_dir: str,
+            agent,
+            max_to_keep: int = 5,
+            step_interval: Optional[int] = 1000,
+            time_interval_seconds: Optional[float] = None
+    ):
+        self._dir = Path(ckpt_dir)
+        self._agent = agent
+        self._max_to_keep = max_to_keep
+        self._step_interval = step_interval
+        self._time_interval = time_interval_seconds
+        self._last_step: Optional[int] = None
+        self._last_time = monotonic()
+        self._queue: Queue = Queue(maxsize=1)
+        self._worker: Optional[Thread] = None
+
+    @property
+    def latest_checkpoint(self) -> Optional[Path]:
+        checkpoints = self._checkpoints()
+
+        return checkpoints[-1][1] if checkpoints else None
+
+    def maybe_save(self, step: int) -> bool:
+        """ Saves only if the step or time interval has elapsed since the last save """
+        if self._last_step is None:
+            self._last_step = step
+        due = self._step_interval is not None and step - self._last_step >= self._step_interval
+        due |= self._time_interval is not None and monotonic() - self._last_time >= self._time_interval
+        if due:
+            self.save(step)
+
+        return due
+
+    def save(self, step: int) -> None:
+        """ Snapshots the weights and hands them over to the writer thread """
+        self._last_step = step
+        self._last_time = monotonic()
+        snapshot = self._snapshot()
+        self._ensure_worker()
+        try:  # the newest snapshot wins if the writer is still busy with an older one
+            self._queue.get_nowait()
+        except Empty:
+            pass
+        self._queue.put_nowait((step, snapshot))
+
+    def initialize_or_restore(self) -> Optional[int]:
+        """ Restores the latest checkpoint, if any. Returns restored step """
+        self._dir.mkdir(parents=True, exist_ok=True)
+        for tmp in self._dir.glob("*.tmp"):  # leftovers of an interrupted write
+            tmp.unlink()
+        latest = self.latest_checkpoint
+        if latest is None:
+            return None
+        with np.load(latest) as data:
+            arrays = dict(data)
+        for group, variables in self._variables().items():
+            weights = [arrays[f"{group}/{i}"] for i in range(int(arrays[f"{group}/count"]))]
+            if [w.shape for w in weights] != [tuple(v.shape) for v in variables]:
+                continue  # e.g. optimizer slots are created lazily on the first train step
+            for variable, weight in zip(variables, weights):
+                variable.assign(weight)
+        step = int(arrays['step'])
+        self._agent.train_step_counter.assign(step)
+        self._last_step = step
+
+        return step
+
+    def close(self) -> None:
+        """ Waits for the pending checkpoint to be written and stops the writer thread """
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def _variables(self) -> Dict[str, List]:
+        return {
+            'q': list(self._agent._q_network.variables),
+            'target': list(self._agent._target_q_network.variables),
+            'optimizer': list(self._agent._optimizer.variables())
+        }
+
+    def _snapshot(self) -> Dict[str, np.ndarray]:
+        arrays = {}
+        for group, variables in self._variables().items():
+            arrays[f"{group}/count"] = np.array(len(variables))
+            for i, variable in enumerate(variables):
+                arrays[f"{group}/{i}"] = np.array(variable.numpy(), copy=True)
+
+        return arrays
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            self._dir.mkdir(parents=True, exist_ok=True)
+            self._worker = Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+            self._worker.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            step, snapshot = item
+            self._write(step, snapshot)
+
+    def _write(self, step: int, snapshot: Dict[str, np.ndarray]) -> None:
+        path = self._dir / f"ckpt-{step}.npz"
+        tmp = self._dir / f"ckpt-{step}.npz.tmp"
+        with open(tmp, 'wb') as fh:
+            np.savez(fh, step=np.array(step), **snapshot)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        for _, old in self._checkpoints()[:-self._max_to_keep]:
+            old.unlink()
+
+    def _checkpoints(self) -> List[Tuple[int, Path]]:
+        """ Returns (step, path) sorted by step """
+        if not self._dir.is_dir():
+            return []
+        checkpoints = []
+        for path in self._dir.iterdir():
+            match = self._FILE_PATTERN.match(path.name)
+            if match:
+                checkpoints.append((int(match.group(1)), path))
+
+        return sorted(checkpoints)
@@ -1,2 +1,22 @@
-from .environment import DqnController, CarRacingEnv
-from .rl import compute_avg_return, get_replay_buffer, collect_step
+from importlib import import_module
+
+# Exports are resolved lazily, so that e.g. actor processes using DqnController don't load TensorFlow
+_EXPORTS = {
+    'DqnController': '.controller',
+    'CarRacingEnv': '.environment',
+    'compute_avg_return': '.rl',
+    'get_replay_buffer': '.rl',
+    'collect_step': '.rl',
+    'PolicyEvaluator': '.evaluation',
+    'ActorLearner': '.actor_learner'
+}
+
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        return getattr(import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
@@ -0,0 +1,260 @@
+import os
+from collections import deque
+from multiprocessing import get_context
+from queue import Empty, Full
+from threading import Thread, Event
+from time import perf_counter
+from typing import List, Optional, Callable, Tuple, Deque
+
+import numpy as np
+
+from src.game import MapType, RadarConfig, DEFAULT_RADARS, DenseBatch
+
+# tf_agents' StepType values & CarRacingEnv's discounts - actors don't load TensorFlow
+_FIRST, _MID, _LAST = 0, 1, 2
+_DISCOUNT = .9
+
+
+def _actor_worker(
+        actor_id: int,
+        weights,
+        transitions,
+        stop,
+        map_type: MapType,
+        chunk_size: int,
+        temperature: float,
+        radar_config: RadarConfig,
+        action_repeat: int
+) -> None:
+    """
+    Plays CarRacingEnv's episodes with a NumPy copy of the q-network and Boltzmann exploration, exactly as
+    collect_step would, and sends trajectories to the learner in chunks
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from .controller import DqnController
+
+    controller = DqnController(
+        map_type, headless=True, draw_checkpoints=True, radar_config=radar_config, action_repeat=action_repeat
+    )
+    rng = np.random.default_rng(actor_id)
+    q_network = DenseBatch([weights.get()])
+    rays = radar_config.rays
+    chunk = {
+        'step_type': np.zeros(chunk_size, dtype=np.int32),
+        'observation': np.zeros((chunk_size, rays), dtype=np.float32),
+        'action': np.zeros(chunk_size, dtype=np.int32),
+        'next_step_type': np.zeros(chunk_size, dtype=np.int32),
+        'reward': np.zeros(chunk_size, dtype=np.float32),
+        'discount': np.zeros(chunk_size, dtype=np.float32)
+    }
+    filled = 0
+    observation = np.zeros(rays, dtype=np.float32)
+    controller.reset()
+    controller.get_observation(out=observation)
+    step_type = _FIRST
+    while not stop.is_set():
+        try:  # the latest weights, if the learner published new ones
+            q_network = DenseBatch([weights.get_nowait()])
+        except Empty:
+            pass
+        logits = q_network.activate(observation[None])[0] / temperature
+        probabilities = np.exp(logits - logits.max())
+        action = rng.choice(len(probabilities), p=probabilities / probabilities.sum())
+        chunk['step_type'][filled] = step_type
+        chunk['observation'][filled] = observation
+        chunk['action'][filled] = action
+        if step_type == _LAST:  # CarRacingEnv resets on the step following the last one
+            controller.reset()
+            step_type, reward, discount = _FIRST, 0., 1.
+        else:
+            done, reward = controller.run(int(action))
+            step_type, discount = (_LAST, 0.) if done else (_MID, _DISCOUNT)
+        controller.get_observation(out=observation)
+        chunk['next_step_type'][filled] = step_type
+        chunk['reward'][filled] = reward
+        chunk['discount'][filled] = discount
+        filled += 1
+        if filled == chunk_size:
+            transitions.put((actor_id, {name: array.copy() for name, array in chunk.items()}))
+            filled = 0
+    controller.quit()
+
+
+class ActorLearner:
+    """
+    Decoupled DQN training - actor processes play headless episodes with periodically refreshed weights
+    and push trajectories through a queue, while the learner trains continuously.
+
+    Every actor owns a row of the replay buffer (its batch_size equals number of actors), so that sampled
+    num_steps=2 trajectories never mix two actors. A feeder thread moves trajectories into the buffer, hence
+    the learner's updates overlap with collection even within its own process.
+    """
+
+    def __init__(
+            self,
+            agent,
+            map_type: MapType = MapType.PWR,
+            num_actors: int = 2,
+            chunk_size: int = 32,
+            weights_interval: int = 100,
+            temperature: float = 1.,
+            radar_config: RadarConfig = DEFAULT_RADARS,
+            action_repeat: int = 1,
+            replay_buffer_length: int = 100000,
+            max_pending: int = 64
+    ):
+        """
+        weights_interval - learner updates between publishing weights to actors (and checking they're alive)
+        temperature - of actors' Boltzmann exploration, the same as agent's collect policy
+        max_pending - chunks an actor may get ahead of the slowest one, training fails beyond that
+        """
+        from .rl import get_replay_buffer
+
+        self._agent = agent
+        self._num_actors = num_actors
+        self._weights_interval = weights_interval
+        self._buffer = get_replay_buffer(agent, max_length=replay_buffer_length, batch_size=num_actors)
+        context = get_context('spawn')  # forking a process with initialized TensorFlow is unsafe
+        self._stop = context.Event()
+        self._transitions = context.Queue(maxsize=4 * num_actors)
+        self._weights = [context.Queue(maxsize=1) for _ in range(num_actors)]
+        self._actors = [
+            context.Process(
+                target=_actor_worker,
+                args=(
+                    i, self._weights[i], self._transitions, self._stop, map_type, chunk_size, temperature,
+                    radar_config, action_repeat
+                ),
+                daemon=True
+            )
+            for i in range(num_actors)
+        ]
+        self._pending: List[Deque[dict]] = [deque() for _ in range(num_actors)]
+        self._max_pending = max_pending
+        self._feed_error: Optional[str] = None
+        self._feeder_stop = Event()
+        self._feeder: Optional[Thread] = None
+        self._actor_steps = 0
+        self._updates = 0
+        self._rates_since = (perf_counter(), 0, 0)
+
+    @property
+    def replay_buffer(self):
+        return self._buffer
+
+    def start(self) -> None:
+        self._publish_weights()
+        for actor in self._actors:
+            actor.start()
+        self._feeder = Thread(target=self._feed, name="replay-feeder", daemon=True)
+        self._feeder.start()
+
+    def train(
+            self,
+            num_updates: int,
+            sample_batch_size: int = 64,
+            min_frames: int = 1000,
+            on_update: Optional[Callable[[int, float], None]] = None
+    ) -> None:
+        """ on_update(train step, loss) is called after every update """
+        from tf_agents.utils.common import function
+
+        train = function(self._agent.train)
+        dataset = self._buffer.as_dataset(
+            num_parallel_calls=3,
+            sample_batch_size=sample_batch_size,
+            num_steps=2,
+            single_deterministic_pass=False
+        ).prefetch(3)
+        iterator = iter(dataset)
+        while self._buffer.num_frames() < min_frames:
+            self._check_alive()
+            self._stop.wait(.1)
+        for _ in range(num_updates):
+            experience, _ = next(iterator)
+            loss = train(experience).loss
+            self._updates += 1
+            if self._updates % self._weights_interval == 0:
+                self._check_alive()  # the buffer would stop growing, the learner would train on stale data
+                self._publish_weights()
+            if on_update is not None:
+                on_update(int(self._agent.train_step_counter.numpy()), float(loss))
+
+    def rates(self) -> Tuple[float, float]:
+        """ Returns (actor steps / s, learner updates / s) since the last call """
+        now = perf_counter()
+        since, actor_steps, updates = self._rates_since
+        elapsed = max(now - since, 1e-9)
+        self._rates_since = (now, self._actor_steps, self._updates)
+
+        return (self._actor_steps - actor_steps) / elapsed, (self._updates - updates) / elapsed
+
+    def close(self) -> None:
+        self._stop.set()
+        self._feeder_stop.set()
+        if self._feeder is not None:
+            self._feeder.join()
+        while True:  # actors may be blocked on a full queue
+            try:
+                self._transitions.get(timeout=.5)
+            except Empty:
+                if not any(actor.is_alive() for actor in self._actors):
+                    break
+        for actor in self._actors:
+            actor.join()
+
+    def _check_alive(self) -> None:
+        """ A batch takes a chunk of every actor, so that a single dead actor would stall the learner forever """
+        for i, actor in enumerate(self._actors):
+            if not actor.is_alive():
+                raise RuntimeError(f"Actor {i} exited with code {actor.exitcode}")
+        if self._feed_error is not None:
+            raise RuntimeError(self._feed_error)
+        if self._feeder is None or not self._feeder.is_alive():
+            raise RuntimeError("Replay feeder isn't running, see start")
+
+    def _publish_weights(self) -> None:
+        weights = [np.asarray(w) for w in self._agent._q_network.get_weights()]
+        for queue in self._weights:
+            try:  # the newest weights win if an actor didn't pick up the previous ones yet
+                queue.get_nowait()
+            except Empty:
+                pass
+            try:
+                queue.put_nowait(weights)
+            except Full:
+                pass
+
+    def _feed(self) -> None:
+        from tf_agents.trajectories.trajectory import Trajectory
+        from tf_agents.utils.common import function
+
+        @function
+        def add_batch(trajectory: Trajectory) -> None:  # a tf.function can't return add_batch's operation
+            self._buffer.add_batch(trajectory)
+
+        policy_info = self._agent.collect_data_spec.policy_info
+        while not self._feeder_stop.is_set():
+            try:
+                actor_id, chunk = self._transitions.get(timeout=.1)
+            except Empty:
+                continue
+            self._actor_steps += len(chunk['action'])
+            self._pending[actor_id].append(chunk)
+            if len(self._pending[actor_id]) > self._max_pending:
+                # dropping chunks would join unrelated steps into transitions, some actor is stuck instead
+                self._feed_error = f"Actor {actor_id} got {self._max_pending} chunks ahead of the slowest actor"
+                return
+            # a batch takes one chunk of every actor, so that each buffer row holds a single actor's steps
+            while all(self._pending):
+                chunks = [pending.popleft() for pending in self._pending]
+                for t in range(len(chunks[0]['action'])):
+                    add_batch(Trajectory(
+                        step_type=np.stack([chunk['step_type'][t] for chunk in chunks]),
+                        observation=np.stack([chunk['observation'][t] for chunk in chunks]),
+                        action=np.stack([chunk['action'][t] for chunk in chunks]),
+                        policy_info=policy_info,
+                        next_step_type=np.stack([chunk['next_step_type'][t] for chunk in chunks]),
+                        reward=np.stack([chunk['reward'][t] for chunk in chunks]),
+                        discount=np.stack([chunk['discount'][t] for chunk in chunks])
+                    ))
@@ -0,0 +1,205 @@
+from typing import Tuple, List, Optional, MutableSequence
+
+import pygame
+
+from src.game import (
+    MapType,
+    AiCar,
+    AiCarPool,
+    draw_ai_controls,
+    CarMovement,
+    Point,
+    AiController,
+    RadarConfig,
+    DEFAULT_RADARS,
+    Telemetry,
+    VisionConfig,
+    get_vision
+)
+from src.game.trace import CHECKPOINT_RESETS_STAGNATION
+
+
+"""
+TODO: punishing for not using some actions (anything related with turning right)
+"""
+
+
+class DqnController(AiController):
+    def __init__(
+            self,
+            map_type: MapType,
+            max_levels: int = 5,
+            hardcore: bool = False,
+            draw_controls: bool = False,
+            draw_checkpoints: bool = True,
+            headless: bool = False,
+            radar_config: RadarConfig = DEFAULT_RADARS,
+            action_repeat: int = 1,
+            trace_dir: Optional[str] = None,
+            telemetry: Optional[Telemetry] = None,
+            vision: Optional[VisionConfig] = None
+    ):
+        """
+        action_repeat - number of ticks every action is applied for
+        trace_dir - if given, every episode is recorded there as a trace
+        telemetry - if given, receives finish events & every episode's return
+        vision - if given, observations are car's top-down views (uint8 pixels) instead of radars' distances
+        """
+        super().__init__(
+            map_type=map_type,
+            max_levels=max_levels,
+            draw_radars=True,
+            hardcore=hardcore,
+            draw_checkpoints=draw_checkpoints,
+            headless=headless,
+            trace_dir=trace_dir,
+            telemetry=telemetry
+        )
+        if draw_checkpoints:
+            self._trace_rules |= CHECKPOINT_RESETS_STAGNATION
+        self._draw_controls = draw_controls
+        self._radar_config = radar_config
+        self._action_repeat = action_repeat
+        self._vision = get_vision(vision, self._map_meta.track, self._map_meta.finish_line) if vision else None
+        self._cars: List[AiCar] = []  # just for typing issues
+        self._episode_return = 0.
+        # the car is recycled between episodes
+        self._pool = AiCarPool(
+            max_velocity=10,
+            rotation_velocity=6.,
+            acceleration=.15,
+            track=self._map_meta.track,
+            use_threshold=True,
+            movement_threshold=550,
+            radar_config=radar_config
+        )
+        self.spawn_car()
+
+    def start_level(self) -> None:
+        self._state.start_level()
+
+    def get_state(self) -> Tuple[Point, float, float]:
+        return (
+            (self._cars[0].x, self._cars[0].y),
+            self._cars[0].velocity,
+            self._cars[0].angle,
+        )
+
+    def set_state(self, pos: Point, velocity: float, angle: float) -> None:
+        self.start_level()
+        self.spawn_car(pos, angle, velocity)
+        self._draw()
+
+    def spawn_car(
+            self,
+            position: Optional[Point] = None,
+            angle: Optional[float] = None,
+            velocity: float = .0
+    ) -> None:
+        self._save_trace()  # every episode is a trace of its own
+        if self._draw_checkpoints:
+            for checkpoint in self._map_meta.checkpoints:
+                checkpoint.activate()
+        self._cars = self._pool.take(
+            1,
+            self._map_meta.car_initial_pos if position is None else position,
+            self._map_meta.car_initial_angle if angle is None else angle,
+            velocity
+        )
+        self._begin_trace_segment()
+
+    def get_observation(self, out: Optional[MutableSequence[float]] = None) -> MutableSequence[float]:
+        car = self._cars[0]
+        if self._vision is not None:
+            return self._vision.look(car.get_rect_center(), car.angle, out)
+
+        return car.radars_distances(out)
+
+    def quit(self) -> None:
+        self._save_trace()
+        pygame.quit()
+
+    def reset(self) -> None:
+        self._episode_return = 0.
+        self.start_level()
+        self.spawn_car()
+        self._draw()
+
+    def _draw(self) -> None:
+        if self._headless:
+            return
+        super()._draw()
+        if self._draw_controls:
+            self._dirty.append(draw_ai_controls(self._window, self._ai_movements))
+        self._present()
+
+    def run(self, action: int) -> Tuple[bool, float]:
+        """ Return done, reward summed over action_repeat ticks """
+        movement = CarMovement(action)
+        done, total_reward = False, .0
+        for _ in range(self._action_repeat):  # every tick still checks borders & finish line
+            done, reward = self._run_tick(movement)
+            total_reward += reward
+            if done:
+                break
+        self._draw()
+        self._episode_return += total_reward
+        if done:
+            self._event('episode', episode_return=self._episode_return)
+
+        return done, total_reward
+
+    def _run_tick(self, movement: CarMovement) -> Tuple[bool, float]:
+        reward = -20
+        if movement == CarMovement.SLOW_DOWN:
+            reward -= 50
+        elif movement == CarMovement.UP:
+            reward += 50
+        elif movement == CarMovement.NOTHING:
+            reward -= 50
+        elif movement == CarMovement.RIGHT or movement == CarMovement.LEFT:
+            reward -= 50
+        done = False
+        car = self._cars[0]
+        if car.alive:
+            reward += self._handle_car_movement(car, movement) + car.velocity
+            if car.velocity <= .005:
+                reward -= 100
+            if self._draw_checkpoints:
+                for checkpoint in self._map_meta.checkpoints:
+                    if checkpoint.active:
+                        if car.is_colliding(checkpoint.mask, checkpoint.rect.left, checkpoint.rect.top):
+                            checkpoint.deactivate()
+                            reward += 1000
+                            car.stagnation = 0
+            if car.is_colliding_swept(self._map_meta.borders_mask):
+                car.alive = False
+                reward -= 1000
+                done = True
+            crossed_finish_line_poi = car.is_colliding_swept(self._map_meta.finish_line_mask)
+            if crossed_finish_line_poi:
+                if crossed_finish_line_poi[1] > self._map_meta.finish_line_crossing_point:
+                    car.bounce()
+                    reward -= 1000
+                else:
+                    self._event('finish')
+                    reward += 10000 + 1000 * (400 / self._state.level_time())  # time bonus
+                    self._state.next_level()
+                    car.alive = False
+                    done = True
+        else:
+            reward -= 100
+            done = True
+        self._tick()
+
+        if self._state.level_time() > 400:
+            done, reward = True, -100
+
+        if done and self._draw_checkpoints:
+            punishment = 0
+            for checkpoint in self._map_meta.checkpoints:
+                if checkpoint.active:
+                    punishment -= 1000
+            reward += punishment
+
+        return done, reward
@@ -0,0 +1,117 @@
+from multiprocessing import get_context
+from queue import Empty, Full
+from typing import List, Tuple, Optional
+
+import numpy as np
+
+from src.game import MapType
+
+
+def _evaluation_worker(
+        snapshots,
+        results,
+        map_type: MapType,
+        num_episodes: int,
+        n_observations: int,
+        n_actions: int,
+        temperature: Optional[float]
+) -> None:
+    # TensorFlow lives only in the worker process
+    from tf_agents.specs import tensor_spec
+
+    from src.ai.utils import get_ann
+    from .environment import CarRacingEnv
+
+    envs = [CarRacingEnv(map_type=map_type, headless=True) for _ in range(num_episodes)]
+    model = get_ann(n_observations, n_actions)
+    model.create_variables(tensor_spec.from_spec(envs[0].observation_spec()))
+    rng = np.random.default_rng()
+    while True:
+        snapshot = snapshots.get()
+        if snapshot is None:
+            break
+        step, weights = snapshot
+        model.set_weights(weights)
+        time_steps = [env.reset() for env in envs]
+        returns = np.zeros(num_episodes)
+        running = np.ones(num_episodes, dtype=bool)
+        while running.any():
+            observations = np.stack([time_step.observation for time_step in time_steps])
+            q_values, _ = model(observations, training=False)
+            q_values = np.asarray(q_values).reshape(num_episodes, n_actions)
+            if temperature is None:
+                actions = q_values.argmax(axis=-1)
+            else:
+                logits = q_values / temperature
+                probabilities = np.exp(logits - logits.max(axis=-1, keepdims=True))
+                probabilities /= probabilities.sum(axis=-1, keepdims=True)
+                actions = [rng.choice(n_actions, p=p) for p in probabilities]
+            for i in np.flatnonzero(running):
+                time_steps[i] = envs[i].step(np.int32(actions[i]))
+                returns[i] += time_steps[i].reward
+                if time_steps[i].is_last():
+                    running[i] = False
+        results.put((step, float(returns.mean())))
+    for env in envs:
+        env.close()
+
+
+class PolicyEvaluator:
+    """
+    Evaluates q-network weight snapshots in a separate process, on its own headless environments.
+
+    All episodes run in lockstep, so a single forward pass serves the whole batch. Headless environments run on
+    simulated time, hence greedy episodes are deterministic - use temperature to sample a spread of episodes.
+    """
+
+    def __init__(
+            self,
+            map_type: MapType = MapType.PWR,
+            num_episodes: int = 1,
+            n_observations: int = 5,
+            n_actions: int = 9,
+            temperature: Optional[float] = None
+    ):
+        context = get_context('spawn')  # forking a process with initialized TensorFlow is unsafe
+        self._snapshots = context.Queue(maxsize=1)
+        self._results = context.Queue()
+        self._process = context.Process(
+            target=_evaluation_worker,
+            args=(self._snapshots, self._results, map_type, num_episodes, n_observations, n_actions, temperature),
+            daemon=True
+        )
+        self._process.start()
+
+    def submit(self, step: int, weights: List[np.ndarray]) -> bool:
+        """ Hands over q-network weights. Returns False (snapshot skipped) if the worker is still busy """
+        self._check_alive()
+        try:
+            self._snapshots.put_nowait((step, weights))
+        except Full:
+            return False
+
+        return True
+
+    def results(self) -> List[Tuple[int, float]]:
+        """ Returns (step, average return) of evaluations finished since the last call, never blocks """
+        self._check_alive()
+        finished = []
+        while True:
+            try:
+                finished.append(self._results.get_nowait())
+            except Empty:
+                return finished
+
+    def close(self) -> None:
+        while self._process.is_alive():  # the worker may still be evaluating, or have died with a snapshot queued
+            try:
+                self._snapshots.put(None, timeout=.5)
+                break
+            except Full:
+                pass
+        self._process.join()
+
+    def _check_alive(self) -> None:
+        """ A dead worker would silently never report again """
+        if not self._process.is_alive():
+            raise RuntimeError(f"Evaluation worker exited with code {self._process.exitcode}")
@@ -1,2 +1,9 @@
 from .controller import NeatController
 from .visualization import draw_net, plot_stats, plot_spikes, plot_species
+from .export import compile_genome, export_genome
+from .fitness_cache import FitnessCache
+from .sweep import SweepRunner, grid, random_search, uniform, log_uniform
+from .telemetry import TelemetryReporter
+from .stats_store import StatisticsStore, StreamingStatisticsReporter
+from .checkpoint import PopulationCheckpointer, restore_population, snapshot_population, restore_snapshot
+from .islands import IslandRunner, load_island_checkpoint
@@ -0,0 +1,341 @@
+import json
+import os
+import random
+import re
+from itertools import count
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+from time import monotonic
+from typing import Optional, List, Dict, Tuple, Union, Any
+
+import neat
+import numpy as np
+
+VERSION = 1
+# roles of genome rows
+_POPULATION, _REPRESENTATIVE, _BEST = 0, 1, 2
+
+
+def _next(config_owner: Any, attribute: str) -> int:
+    """ Next value of an itertools.count attribute (-1 if None), without consuming it """
+    indexer = getattr(config_owner, attribute)
+    if indexer is None:
+        return -1
+    value = next(indexer)
+    setattr(config_owner, attribute, count(value))
+
+    return value
+
+
+def _gene_attributes(gene_type) -> List[str]:
+    return [attribute.name for attribute in gene_type._gene_attributes]
+
+
+def _optional(value: Optional[float]) -> float:
+    return np.nan if value is None else value
+
+
+def _from_optional(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def snapshot_population(population: neat.Population, fitness: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """
+    Columnar arrays of everything a run's continuation depends on - genomes (gene by gene, in their dicts' order,
+    which mutations depend on), species, the best genome, genome/species/node key counters & the random state.
+    fitness - recorded to rank checkpoints by, e.g. the best fitness of the last evaluated generation
+    """
+    config = population.config
+    rows: Dict[int, int] = {}
+    genomes: List[Tuple[Any, int]] = []
+
+    def row(genome, role: int) -> int:
+        if id(genome) not in rows:
+            rows[id(genome)] = len(genomes)
+            genomes.append((genome, role))
+        return rows[id(genome)]
+
+    for genome in population.population.values():
+        row(genome, _POPULATION)
+    species = list(population.species.species.values())
+    representatives = [row(s.representative, _REPRESENTATIVE) for s in species]
+    # usually one of the elites, whose fitness is updated as they are evaluated again
+    best = -1 if population.best_genome is None else row(population.best_genome, _BEST)
+
+    node_attributes = _gene_attributes(config.genome_config.node_gene_type)
+    connection_attributes = _gene_attributes(config.genome_config.connection_gene_type)
+    nodes = [(i, gene) for i, (genome, _) in enumerate(genomes) for gene in genome.nodes.values()]
+    connections = [(i, gene) for i, (genome, _) in enumerate(genomes) for gene in genome.connections.values()]
+    arrays = {
+        'version': np.array(VERSION),
+        'generation': np.array(population.generation),
+        'fitness': np.array(_optional(fitness), dtype=np.float64),
+        'genome_key': np.array([genome.key for genome, _ in genomes], dtype=np.int64),
+        'genome_role': np.array([role for _, role in genomes], dtype=np.int8),
+        'genome_fitness': np.array([_optional(genome.fitness) for genome, _ in genomes], dtype=np.float64),
+        'best': np.array(best),
+        'node_genome': np.array([i for i, _ in nodes], dtype=np.int32),
+        'node_key': np.array([gene.key for _, gene in nodes], dtype=np.int64),
+        'connection_genome': np.array([i for i, _ in connections], dtype=np.int32),
+        'connection_key': np.array([gene.key for _, gene in connections], dtype=np.int64).reshape(-1, 2),
+        'species_key': np.array([s.key for s in species], dtype=np.int64),
+        'species_created': np.array([s.created for s in species], dtype=np.int64),
+        'species_last_improved': np.array([s.last_improved for s in species], dtype=np.int64),
+        'species_representative': np.array(representatives, dtype=np.int32),
+        'species_fitness': np.array([_optional(s.fitness) for s in species], dtype=np.float64),
+        'species_adjusted_fitness': np.array([_optional(s.adjusted_fitness) for s in species], dtype=np.float64),
+        'species_members': np.array([len(s.members) for s in species], dtype=np.int32),
+        'members': np.array([rows[id(m)] for s in species for m in s.members.values()], dtype=np.int32),
+        'species_history': np.array([len(s.fitness_history) for s in species], dtype=np.int32),
+        'history': np.array([f for s in species for f in s.fitness_history], dtype=np.float64),
+        'next_genome_key': np.array(_next(population.reproduction, 'genome_indexer')),
+        'next_species_key': np.array(_next(population.species, 'indexer')),
+        'next_node_key': np.array(_next(config.genome_config, 'node_indexer')),
+    }
+    for name in node_attributes:
+        arrays[f'node/{name}'] = np.array([getattr(gene, name) for _, gene in nodes])
+    for name in connection_attributes:
+        arrays[f'connection/{name}'] = np.array([getattr(gene, name) for _, gene in connections])
+    version, state, gauss = random.getstate()
+    arrays['random'] = np.array(state, dtype=np.int64)
+    arrays['random_meta'] = np.array([version, _optional(gauss)], dtype=np.float64)
+    # names of the gene attributes, checked against the config on restore
+    arrays['meta'] = np.array(json.dumps({'node': node_attributes, 'connection': connection_attributes}))
+
+    return arrays
+
+
+def restore_population(path: Union[str, Path], config: neat.Config) -> neat.Population:
+    """
+    Resumes a run from a PopulationCheckpointer's checkpoint - the returned population continues exactly as the
+    checkpointed run would have (given a deterministic fitness function). Also restores the global random state
+    """
+    with np.load(path) as data:
+        return restore_snapshot(dict(data), config)
+
+
+def restore_snapshot(arrays: Dict[str, np.ndarray], config: neat.Config) -> neat.Population:
+    """ The population of snapshot_population's arrays, see restore_population """
+    version = int(arrays['version'])
+    if version != VERSION:
+        raise ValueError(f"Unsupported checkpoint version {version}, expected {VERSION}")
+    meta = json.loads(str(arrays['meta']))
+    genome_config = config.genome_config
+    for gene, gene_type in (('node', genome_config.node_gene_type), ('connection', genome_config.connection_gene_type)):
+        if meta[gene] != _gene_attributes(gene_type):
+            raise ValueError(f"Checkpoint's {gene} genes don't match config's")
+
+    genomes = []
+    for key, fitness in zip(arrays['genome_key'].tolist(), arrays['genome_fitness'].tolist()):
+        genome = config.genome_type(key)
+        genome.fitness = _from_optional(fitness)
+        genomes.append(genome)
+    node_columns = [(name, arrays[f'node/{name}'].tolist()) for name in meta['node']]
+    for j, (i, key) in enumerate(zip(arrays['node_genome'].tolist(), arrays['node_key'].tolist())):
+        gene = genome_config.node_gene_type(key)
+        for name, column in node_columns:
+            setattr(gene, name, column[j])
+        genomes[i].nodes[key] = gene
+    connection_columns = [(name, arrays[f'connection/{name}'].tolist()) for name in meta['connection']]
+    for j, (i, key) in enumerate(zip(arrays['connection_genome'].tolist(), arrays['connection_key'].tolist())):
+        gene = genome_config.connection_gene_type(tuple(key))
+        for name, column in connection_columns:
+            setattr(gene, name, column[j])
+        genomes[i].connections[gene.key] = gene
+
+    members = iter(arrays['members'].tolist())
+    history = iter(arrays['history'].tolist())
+    species_set = config.species_set_type(config.species_set_config, neat.reporting.ReporterSet())
+    for key, created, last_improved, representative, fitness, adjusted_fitness, n_members, n_history in zip(
+            arrays['species_key'].tolist(),
+            arrays['species_created'].tolist(),
+            arrays['species_last_improved'].tolist(),
+            arrays['species_representative'].tolist(),
+            arrays['species_fitness'].tolist(),
+            arrays['species_adjusted_fitness'].tolist(),
+            arrays['species_members'].tolist(),
+            arrays['species_history'].tolist()
+    ):
+        species = neat.species.Species(key, created)
+        species.last_improved = last_improved
+        species.fitness = _from_optional(fitness)
+        species.adjusted_fitness = _from_optional(adjusted_fitness)
+        species.fitness_history = [next(history) for _ in range(n_history)]
+        member_genomes = [genomes[next(members)] for _ in range(n_members)]
+        species.update(genomes[representative], {genome.key: genome for genome in member_genomes})
+        species_set.species[key] = species
+        for genome in member_genomes:
+            species_set.genome_to_species[genome.key] = key
+
+    roles = arrays['genome_role'].tolist()
+    population_genomes = {genome.key: genome for genome, role in zip(genomes, roles) if role == _POPULATION}
+    population = neat.Population(config, (population_genomes, species_set, int(arrays['generation'])))
+    species_set.reporters = population.reporters
+    best = int(arrays['best'])
+    population.best_genome = genomes[best] if best >= 0 else None
+    population.reproduction.genome_indexer = count(int(arrays['next_genome_key']))
+    species_set.indexer = count(int(arrays['next_species_key']))
+    next_node_key = int(arrays['next_node_key'])
+    genome_config.node_indexer = count(next_node_key) if next_node_key >= 0 else None
+    version, gauss = arrays['random_meta'].tolist()
+    random.setstate((int(version), tuple(arrays['random'].tolist()), _from_optional(gauss)))
+
+    return population
+
+
+class PopulationCheckpointer(neat.reporting.BaseReporter):
+    """
+    Drop-in for neat.Checkpointer - saves the population every generation_interval generations or
+    time_interval_seconds, whichever comes first, see restore_population.
+
+    The population is snapshotted in the training thread into compact arrays (see snapshot_population), which are
+    compressed and written by a background thread under a temporary name and atomically renamed, so evolution goes on
+    while a checkpoint is written and a crash never leaves a torn checkpoint behind. Only the max_to_keep latest
+    checkpoints and the keep_best ones of the fittest generations are kept.
+
+    Checkpoints are named population-<generation>.npz, after the (yet unevaluated) generation they hold.
+    """
+
+    _FILE_PATTERN = re.compile(r"^population-(\d+)\.npz$")
+
+    def __init__(
+            self,
+            ckpt_dir: str,
+            generation_interval: Optional[int] = 10,
+            time_interval_seconds: Optional[float] = None,
+            max_to_keep: int = 3,
+            keep_best: int = 1
+    ):
+        if max_to_keep < 1 or keep_best < 0:
+            raise ValueError("At least the latest checkpoint must be kept")
+        self._dir = Path(ckpt_dir)
+        self._generation_interval = generation_interval
+        self._time_interval = time_interval_seconds
+        self._max_to_keep = max_to_keep
+        self._keep_best = keep_best
+        self._generation = 0
+        self._last_generation: Optional[int] = None
+        self._last_time = monotonic()
+        self._fitness: Optional[float] = None
+        self._population: Optional[neat.Population] = None
+        self._queue: Queue = Queue(maxsize=1)
+        self._worker: Optional[Thread] = None
+        self._ranks: Optional[Dict[Path, float]] = None  # checkpoints' fitness, owned by the writer thread
+
+    @property
+    def latest_checkpoint(self) -> Optional[Path]:
+        checkpoints = self._checkpoints()
+
+        return checkpoints[-1][1] if checkpoints else None
+
+    def restore(self, config: neat.Config) -> Optional[neat.Population]:
+        """ Restores the latest checkpoint, if any, and keeps checkpointing the restored population """
+        if self._dir.is_dir():
+            for tmp in self._dir.glob("*.tmp"):  # leftovers of an interrupted write
+                tmp.unlink()
+        latest = self.latest_checkpoint
+        if latest is None:
+            return None
+        population = restore_population(latest, config)
+        self.watch(population)
+        self._last_generation = population.generation
+
+        return population
+
+    def watch(self, population: neat.Population) -> None:
+        """ Checkpoints population - a reporter isn't told which population it reports on """
+        self._population = population
+        if self not in population.reporters.reporters:
+            population.add_reporter(self)
+
+    def start_generation(self, generation: int) -> None:
+        self._generation = generation
+        if self._last_generation is None:
+            self._last_generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome) -> None:
+        self._fitness = best_genome.fitness
+
+    def end_generation(self, config, population, species_set) -> None:
+        due = self._generation_interval is not None and \
+            self._generation + 1 - self._last_generation >= self._generation_interval
+        due |= self._time_interval is not None and monotonic() - self._last_time >= self._time_interval
+        if due and self._population is not None:
+            self.save()
+
+    def save(self) -> None:
+        """ Snapshots the watched population (at the end of a generation) and hands it over to the writer thread """
+        if self._population is None:
+            raise ValueError("No population to checkpoint, see watch")
+        # neat calls end_generation before it increments the generation
+        generation = self._generation + 1
+        self._last_generation = generation
+        self._last_time = monotonic()
+        snapshot = snapshot_population(self._population, self._fitness)
+        snapshot['generation'] = np.array(generation)
+        self._ensure_worker()
+        # blocks only if the writer is still busy with the previous checkpoint, so that none is lost
+        self._queue.put((generation, snapshot))
+
+    def close(self) -> None:
+        """ Waits for the pending checkpoint to be written and stops the writer thread """
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            self._dir.mkdir(parents=True, exist_ok=True)
+            self._worker = Thread(target=self._write_loop, name="population-checkpoint-writer", daemon=True)
+            self._worker.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            generation, snapshot = item
+            self._write(generation, snapshot)
+
+    def _write(self, generation: int, snapshot: Dict[str, np.ndarray]) -> None:
+        path = self._dir / f"population-{generation}.npz"
+        tmp = self._dir / f"population-{generation}.npz.tmp"
+        with open(tmp, 'wb') as fh:
+            np.savez_compressed(fh, **snapshot)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        self._retain(path, float(snapshot['fitness']))
+
+    def _retain(self, path: Path, fitness: float) -> None:
+        checkpoints = self._checkpoints()
+        if self._ranks is None:  # checkpoints of earlier runs are ranked too
+            self._ranks = {}
+            for _, old in checkpoints:
+                with np.load(old) as data:
+                    self._ranks[old] = float(data['fitness'])
+        self._ranks[path] = fitness
+        keep = {old for _, old in checkpoints[-self._max_to_keep:]}
+        ranked = sorted(
+            (old for _, old in checkpoints if not np.isnan(self._ranks.get(old, np.nan))),
+            key=lambda old: self._ranks[old], reverse=True
+        )
+        keep.update(ranked[:self._keep_best])
+        for _, old in checkpoints:
+            if old not in keep:
+                old.unlink()
+                self._ranks.pop(old, None)
+
+    def _checkpoints(self) -> List[Tuple[int, Path]]:
+        """ Returns (generation, path) sorted by generation """
+        if not self._dir.is_dir():
+            return []
+        checkpoints = []
+        for path in self._dir.iterdir():
+            match = self._FILE_PATTERN.match(path.name)
+            if match:
+                checkpoints.append((int(match.group(1)), path))
+
+        return sorted(checkpoints)
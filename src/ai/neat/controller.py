@@ -1,10 +1,28 @@
-from typing import List
+from typing import List, Optional, Tuple
 
 from numpy import argmax
 import pygame
 import neat
 
-from src.game import MapType, AiCar, display_text, MAIN_FONT, CarMovement, AiController
+from src.game import (
+    MapType,
+    AiCar,
+    AiCarPool,
+    display_text,
+    MAIN_FONT,
+    CarMovement,
+    AiController,
+    RadarConfig,
+    DEFAULT_RADARS,
+    Telemetry,
+    GameState
+)
+from .export import compile_genome
+from .fitness_cache import FitnessCache
+
+# version of the fitness function (rewards, penalties, car physics, episode rules) - part of fitness cache's keys,
+# bump it on every change that changes any genome's fitness
+FITNESS_RULES = 2
 
 
 class NeatController(AiController):
@@ -13,18 +31,68 @@ class NeatController(AiController):
             map_type: MapType,
             max_levels: int = 5,
             timeout: int = 500,
-            hardcore: bool = False
+            hardcore: bool = False,
+            headless: bool = False,
+            radar_config: RadarConfig = DEFAULT_RADARS,
+            action_repeat: int = 1,
+            trace_dir: Optional[str] = None,
+            fitness_cache: Optional[FitnessCache] = None,
+            telemetry: Optional[Telemetry] = None,
+            render_top: Optional[int] = 10,
+            car_contacts: bool = False,
+            fixed_episodes: bool = False
     ):
+        """
+        radar_config - genomes' num_inputs must match its number of rays
+        action_repeat - networks are activated every action_repeat ticks, cars repeat their last movement meanwhile
+        trace_dir - if given, every generation is recorded there as a trace
+        fitness_cache - genomes with an already evaluated network get the cached fitness instead of being simulated.
+            Requires fixed_episodes, generations then run on simulated time even with a window
+        telemetry - if given, receives finish events, simulation rate & fitness cache's hit rate
+        render_top - only this many cars of the best current fitness are drawn in full, the leader with its radars.
+            The rest are drawn as points, so that watching training costs about the same whatever the population.
+            None draws every car in full
+        car_contacts - whether cars collide with each other, see CarContacts. Cars spawned together drive off freely
+        fixed_episodes - generations end only on timeout or once no car is racing. By default they also end early
+            once few cars are left (which penalizes those still racing), so that a genome's fitness depends on how
+            many other genomes race with it. Changes the objective, but makes fitness of every genome its own
+        """
         super().__init__(
             map_type=map_type,
             max_levels=max_levels,
             draw_radars=True,
-            hardcore=hardcore
+            hardcore=hardcore,
+            headless=headless,
+            trace_dir=trace_dir,
+            telemetry=telemetry,
+            car_contacts=car_contacts
         )
+        if fitness_cache is not None:
+            if not fixed_episodes:
+                raise ValueError("Fitness depends on the other genomes racing unless episodes are fixed")
+            if car_contacts:
+                raise ValueError("Fitness of colliding cars depends on each other, it can't be cached")
+            self._state = GameState(max_levels=max_levels, frame_time=1 / self._fps)
         self.__nets = []
+        self.__genomes: List[Tuple[int, neat.genome.DefaultGenome]] = []
         self.__generation = 0
+        self._render_top = render_top
         self._cars: List[AiCar] = []
         self._timeout = timeout
+        self._radar_config = radar_config
+        self._action_repeat = action_repeat
+        self._fitness_cache = fitness_cache
+        self._fixed_episodes = fixed_episodes
+        # cars are recycled between generations
+        self._pool = AiCarPool(
+            max_velocity=10.,
+            rotation_velocity=6.,
+            acceleration=.15,
+            track=self._map_meta.track,
+            movement_threshold=35,
+            use_threshold=True,
+            radar_config=radar_config
+        )
 
     @property
     def cars_alive(self) -> int:
@@ -35,67 +103,118 @@ class NeatController(AiController):
 
         return count
 
-    @staticmethod
-    def quit() -> None:
+    def quit(self) -> None:
+        self._save_trace()
         pygame.quit()
 
-    def __init_car(self) -> AiCar:
-        return AiCar(
-            max_velocity=10.,
-            rotation_velocity=6.,
-            acceleration=.15,
-            track=self._map_meta.track,
-            start_position=self._map_meta.car_initial_pos,
-            start_angle=self._map_meta.car_initial_angle,
-            movement_threshold=35,
-            use_threshold=True
-        )
-
     def __display_population_info(self) -> None:
-        display_text(self._window, f"Generation: {self.__generation}", MAIN_FONT, (810, 0))
-        display_text(self._window, f"Cars alive: {self.cars_alive}", MAIN_FONT, (810, 45))
+        self._dirty.append(display_text(self._window, f"Generation: {self.__generation}", MAIN_FONT, (810, 0)))
+        self._dirty.append(display_text(self._window, f"Cars alive: {self.cars_alive}", MAIN_FONT, (810, 45)))
 
     def _draw(self) -> None:
+        if self._headless:
+            return
         super()._draw()
         self.__display_population_info()
-        pygame.display.update()
+        self._present()
+
+    def _draw_cars(self) -> None:
+        if self._render_top is None:
+            super()._draw_cars()
+            return
+        ranked = sorted(
+            (i for i, car in enumerate(self._cars) if car.alive),
+            key=lambda i: self.__genomes[i][1].fitness,
+            reverse=True
+        )
+        detailed = set(ranked[:self._render_top])
+        for i, car in enumerate(self._cars):
+            if i in detailed:
+                continue
+            x, y = car.get_rect_center()
+            color = (255, 255, 0) if car.alive else (90, 90, 90)
+            self._dirty.append(pygame.draw.rect(self._window, color, (x - 2, y - 2, 5, 5)))
+        for i in reversed(ranked[:self._render_top]):  # the leader on top
+            self._dirty.append(self._cars[i].draw(self._window))
+        if ranked and self._draw_radars:
+            self._draw_car_radars(self._cars[ranked[0]])
+
+    def _cached_fitness(
+            self,
+            genomes: List[Tuple[int, neat.genome.DefaultGenome]],
+            config: neat.config.Config,
+            timeout: float
+    ) -> Tuple[List[Tuple[int, neat.genome.DefaultGenome]], List[str]]:
+        """ Sets fitness of cached genomes, returns the ones to simulate with their cache keys """
+        radars = self._radar_config
+        settings = (
+            FITNESS_RULES, timeout, self._action_repeat, radars.angles, radars.max_range,
+            radars.step, radars.coarse_step, radars.corrections
+        )
+        if self._map_meta.map_type == MapType.CUSTOM:  # custom tracks share a map type
+            settings += (self._map_meta.bundle.source,)
+        uncached, keys = [], []
+        for genome_id, genome in genomes:
+            key = FitnessCache.key(compile_genome(genome, config), self._map_meta.map_type, settings)
+            fitness = self._fitness_cache.get(key)
+            if fitness is None:
+                uncached.append((genome_id, genome))
+                keys.append(key)
+            else:
+                genome.fitness = fitness
+
+        return uncached, keys
 
     def run(self, genomes: List[neat.genome.DefaultGenome], config: neat.config.Config) -> None:
         self.__generation += 1
-        self._cars = []
+        timeout = self._timeout * (len(genomes) / config.pop_size)  # fixed genomes count
+        keys = []
+        if self._fitness_cache is not None:
+            genomes, keys = self._cached_fitness(genomes, config, timeout)
+            if self._telemetry is not None:
+                self._telemetry.scalar('fitness_cache_hits', self._fitness_cache.hits, self.__generation)
+                self._telemetry.scalar('fitness_cache_misses', self._fitness_cache.misses, self.__generation)
+            if not genomes:
+                return
         self.__nets = []
+        self.__genomes = genomes
         self._run = True
         for _, genome in genomes:
             self.__nets.append(neat.nn.FeedForwardNetwork.create(genome, config))
             genome.fitness = 0
-            self._cars.append(self.__init_car())
+        self._cars = self._pool.take(len(genomes), self._map_meta.car_initial_pos, self._map_meta.car_initial_angle)
         self._state.start_level()
+        self._begin_trace_segment()
         won_already = False
         next_level = False
-        timeout = self._timeout * (len(genomes) / config.pop_size)  # fixed genomes count
+        movements = [CarMovement.NOTHING] * len(self._cars)
+        tick = 0
         while self._run:
-            self._clock.tick(self._fps)
-            self._draw()
-            pygame.display.update()
+            self._tick()
+            decide = tick % self._action_repeat == 0
+            tick += 1
+            if decide:
+                self._draw()
             for i, car in enumerate(self._cars):
                 if car.alive:
                     genomes[i][1].fitness -= 5
                 if not car.alive:
                     continue
-                output = self.__nets[i].activate(car.radars_distances())
-                movement = CarMovement(argmax(output))
-                reward = self._handle_car_movement(car, movement)
+                if decide:
+                    output = self.__nets[i].activate(car.radars_distances())
+                    movements[i] = CarMovement(argmax(output))
+                reward = self._handle_car_movement(car, movements[i])
 
-                if car.is_colliding(self._map_meta.borders_mask):
+                if car.is_colliding_swept(self._map_meta.borders_mask):
                     car.alive = False
                     continue
-                crossed_finish_line_poi = car.is_colliding(self._map_meta.finish_line_mask)
+                crossed_finish_line_poi = car.is_colliding_swept(self._map_meta.finish_line_mask)
                 if crossed_finish_line_poi:
                     if crossed_finish_line_poi[1] > self._map_meta.finish_line_crossing_point:
                         car.bounce()
                         genomes[i][1].fitness -= 100
                     else:
-                        print("Wow! You've made it!!!")
+                        self._event('finish', generation=self.__generation, genome=genomes[i][0])
                         if not won_already:
                             next_level = True
                         time_reward = max(timeout - self._state.level_time(), 0)
@@ -105,12 +224,16 @@ class NeatController(AiController):
 
                 if car.alive:
                     genomes[i][1].fitness += reward
+            if self._contacts is not None:
+                self._contacts.resolve(self._cars)
 
             if self.cars_alive == 0 or self._state.level_time() > timeout:
                 self._run = False
                 if next_level:
                     self._state.next_level()
                 break
+            if self._fixed_episodes:  # the rest depends on the cohort
+                continue
             if (won_already and self.cars_alive < 3 and self._state.level_time() > timeout * .75) or \
                     (self._state.level_time() > timeout) or \
                     (self.cars_alive == 1 and self._state.level_time() > timeout * .7):
@@ -121,3 +244,9 @@ class NeatController(AiController):
                 if next_level:
                     self._state.next_level()
                 break
+
+        self._save_trace()
+        if self._fitness_cache is not None:
+            for (_, genome), key in zip(genomes, keys):
+                self._fitness_cache.put(key, genome.fitness)
+            self._fitness_cache.save()
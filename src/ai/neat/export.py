@@ -0,0 +1,59 @@
+from typing import Dict, List
+
+import neat
+
+from src.game import CompactNetwork, ACTIVATIONS
+
+
+def compile_genome(genome: neat.genome.DefaultGenome, config: neat.config.Config) -> CompactNetwork:
+    """ Turns genome into a pruned CompactNetwork, evaluating exactly as neat's FeedForwardNetwork """
+    # FeedForwardNetwork already holds only the expressed nodes, in evaluation order
+    network = neat.nn.FeedForwardNetwork.create(genome, config)
+    inputs = list(network.input_nodes)
+    level: Dict[int, int] = {key: 0 for key in inputs}
+    for node, _, _, _, _, links in network.node_evals:
+        level[node] = 1 + max((level[i] for i, _ in links if i in level), default=0)
+    node_evals = sorted(network.node_evals, key=lambda node_eval: level[node_eval[0]])  # stable sort
+    slot = {key: i for i, key in enumerate(inputs)}
+    for i, node_eval in enumerate(node_evals):
+        slot[node_eval[0]] = len(inputs) + i
+
+    level_ptr: List[int] = [0]
+    activations, biases, responses, indptr, sources, weights = [], [], [], [0], [], []
+    for i, (node, _, _, bias, response, links) in enumerate(node_evals):
+        if i > 0 and level[node] != level[node_evals[i - 1][0]]:
+            level_ptr.append(i)
+        node_gene = genome.nodes[node]
+        if node_gene.aggregation != 'sum':
+            raise ValueError(f"Unsupported aggregation '{node_gene.aggregation}' of node {node}")
+        if node_gene.activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation '{node_gene.activation}' of node {node}")
+        activations.append(ACTIVATIONS.index(node_gene.activation))
+        biases.append(bias)
+        responses.append(response)
+        for source, weight in links:
+            if source in slot:  # links from nodes which are never evaluated always carry 0
+                sources.append(slot[source])
+                weights.append(weight)
+        indptr.append(len(sources))
+    level_ptr.append(len(node_evals))
+    outputs = [slot.get(key, -1) for key in network.output_nodes]
+
+    return CompactNetwork(
+        n_inputs=len(inputs),
+        outputs=outputs,
+        level_ptr=level_ptr,
+        activations=activations,
+        biases=biases,
+        responses=responses,
+        indptr=indptr,
+        sources=sources,
+        weights=weights
+    )
+
+
+def export_genome(genome: neat.genome.DefaultGenome, config: neat.config.Config, path: str) -> CompactNetwork:
+    network = compile_genome(genome, config)
+    network.save(path)
+
+    return network
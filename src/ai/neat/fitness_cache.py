@@ -0,0 +1,71 @@
+import json
+import os
+from collections import OrderedDict
+from hashlib import sha1
+from pathlib import Path
+from typing import Optional, Sequence, Any
+
+from src.game import CompactNetwork, MapType
+
+
+class FitnessCache:
+    """
+    LRU cache of genomes' fitness. Simulation is deterministic given a network, map & settings, so a genome whose
+    pruned network was already evaluated (e.g. an elite carried into the next generation) doesn't need to be
+    simulated again. Optionally persisted to a JSON file, so that it survives between trainings - entries of
+    another VERSION are dropped on load.
+    """
+
+    VERSION = 2
+
+    def __init__(self, max_size: int = 100000, path: Optional[str] = None):
+        self._max_size = max_size
+        self._path = Path(path) if path is not None else None
+        self._entries: OrderedDict[str, float] = OrderedDict()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if self._path is not None and self._path.exists():
+            with open(self._path) as fh:
+                data = json.load(fh)
+            if data.get('version') == self.VERSION:
+                self._entries.update(data['entries'][-max_size:])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(network: CompactNetwork, map_type: MapType, settings: Sequence[Any] = ()) -> str:
+        """ Canonical hash of the pruned network (connections, weights, biases, activations), map & settings """
+        digest = sha1(network.to_bytes())
+        digest.update(repr((map_type.name, tuple(settings))).encode())
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[float]:
+        fitness = self._entries.get(key)
+        if fitness is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+        return fitness
+
+    def put(self, key: str, fitness: float) -> None:
+        self._entries[key] = fitness
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def save(self) -> None:
+        """ Persists entries (least recently used first), if the cache has a path & changed since the last save """
+        if self._path is None or not self._dirty:
+            return
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_name(self._path.name + '.tmp')
+        with open(tmp, 'w') as fh:
+            json.dump({'version': self.VERSION, 'entries': list(self._entries.items())}, fh)
+        os.replace(tmp, self._path)
+        self._dirty = False
@@ -0,0 +1,262 @@
+import gzip
+import os
+import pickle
+import random
+from itertools import count
+from multiprocessing import get_context
+from pathlib import Path
+from queue import Empty
+from typing import List, Sequence, Optional, Dict, Any, Union
+
+import neat
+
+from src.game import MapType
+from .checkpoint import snapshot_population, restore_snapshot
+
+CHECKPOINT_PREFIX = "islands-checkpoint-"
+
+
+class _EmigrantsReporter(neat.reporting.BaseReporter):
+    """ Keeps the best genomes of the last evaluated generation """
+
+    def __init__(self, migrants: int):
+        self._migrants = migrants
+        self.best: List[neat.DefaultGenome] = []
+
+    def post_evaluate(self, config, population, species, best_genome) -> None:
+        ranked = sorted(population.values(), key=lambda genome: genome.fitness, reverse=True)
+        self.best = ranked[:self._migrants]
+
+
+def _rekey_nodes(population: neat.Population, groups: Sequence[Sequence[neat.DefaultGenome]]) -> None:
+    """
+    Every island numbers new hidden nodes with its own counter, so the same key means unrelated nodes on different
+    islands - crossover would merge them & the local counter would eventually hand out a key an immigrant holds.
+    Immigrants' hidden nodes get fresh local keys, consistently within each group (immigrants of the same island),
+    so that immigrants sharing an ancestry still share their nodes
+    """
+    genome_config = population.config.genome_config
+    if genome_config.node_indexer is None:  # no node was added on this island yet
+        genome_config.node_indexer = count(max(key for g in population.population.values() for key in g.nodes) + 1)
+    outputs = set(genome_config.output_keys)
+    for genomes in groups:
+        keys: Dict[int, int] = {}
+        for genome in genomes:
+            for key in genome.nodes:
+                if key not in outputs and key not in keys:
+                    keys[key] = next(genome_config.node_indexer)
+            nodes, genome.nodes = genome.nodes, {}
+            for key, gene in nodes.items():
+                gene.key = keys.get(key, key)
+                genome.nodes[gene.key] = gene
+            connections, genome.connections = genome.connections, {}
+            for (source, target), gene in connections.items():
+                gene.key = (keys.get(source, source), keys.get(target, target))
+                genome.connections[gene.key] = gene
+
+
+def _immigrate(
+        population: neat.Population,
+        groups: Sequence[Sequence[neat.DefaultGenome]],
+        rng: random.Random
+) -> None:
+    """
+    Immigrants (grouped by their island) replace random genomes of the (yet unevaluated) generation and get fresh
+    keys, see _rekey_nodes
+    """
+    genomes = [genome for group in groups for genome in group]
+    if not genomes:
+        return
+    _rekey_nodes(population, groups)
+    members = population.population
+    for key, genome in zip(rng.sample(sorted(members), min(len(genomes), len(members))), genomes):
+        del members[key]
+        genome.key = next(population.reproduction.genome_indexer)
+        genome.fitness = None
+        members[genome.key] = genome
+    population.species.speciate(population.config, members, population.generation)
+
+
+def _island_worker(
+        island: int,
+        config_path: str,
+        map_type: MapType,
+        seed: int,
+        migrants: int,
+        state: Optional[Dict[str, Any]],
+        commands,
+        results
+) -> None:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # workers never open a window
+    from .controller import NeatController
+
+    config = neat.Config(
+        neat.DefaultGenome,
+        neat.DefaultReproduction,
+        neat.DefaultSpeciesSet,
+        neat.DefaultStagnation,
+        config_path
+    )
+    random.seed(seed)  # neat draws from the global generator, the game itself is deterministic
+    rng = random.Random(seed)
+    if state is None:
+        population = neat.Population(config)
+    else:  # also restores the key counters & the global random state
+        population = restore_snapshot(state['population'], config)
+        rng.setstate(state['migration_random'])
+    emigrants = _EmigrantsReporter(migrants)
+    population.add_reporter(emigrants)
+    controller = NeatController(map_type, headless=True)
+    while True:
+        command, *args = commands.get()
+        if command == 'evolve':
+            generations, immigrants = args
+            _immigrate(population, immigrants, rng)
+            best = population.run(controller.run, generations)
+            solved = not config.no_fitness_termination and best.fitness >= config.fitness_threshold
+            results.put((island, population.generation, emigrants.best, best, solved))
+        elif command == 'state':
+            results.put((island, {'population': snapshot_population(population), 'migration_random': rng.getstate()}))
+        else:
+            break
+    controller.quit()
+
+
+def _island(result: tuple) -> int:
+    return result[0]
+
+
+def load_island_checkpoint(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Returns {'generation', 'map_types', 'islands', 'best': the best genome so far}, every island's state is
+    {'population': snapshot_population's arrays, 'migration_random'}
+    """
+    with gzip.open(path, 'rb') as fh:
+        return pickle.load(fh)
+
+
+class IslandRunner:
+    """
+    Island-model NEAT - independent populations evolve in parallel, one per process (so one per CPU), each on its own
+    headless NeatController & map. Every migration_interval generations the best migrants genomes of every island
+    replace random genomes of all the other islands, which spreads good solutions while the islands keep evolving
+    apart in between.
+
+    All islands are saved together every checkpoint_interval generations, as out_dir/islands-checkpoint-<generation>,
+    a run resumes from such a checkpoint.
+    """
+
+    def __init__(
+            self,
+            config_path: str,
+            map_types: Sequence[MapType],
+            out_dir: str,
+            migration_interval: int = 5,
+            migrants: int = 2,
+            checkpoint_interval: int = 10,
+            seed: int = 0
+    ):
+        """ map_types - map of every island, e.g. [MapType.PWR] * 4 for four islands of PWR """
+        if not map_types:
+            raise ValueError("At least one island is needed")
+        if migration_interval < 1 or checkpoint_interval < 1:
+            raise ValueError("Intervals must be positive")
+        self._config_path = str(Path(config_path).resolve())
+        self._map_types = list(map_types)
+        self._out_dir = Path(out_dir)
+        self._migration_interval = migration_interval
+        self._migrants = migrants
+        self._checkpoint_interval = checkpoint_interval
+        self._seed = seed
+        self._best: Optional[neat.DefaultGenome] = None
+
+    @property
+    def best_genome(self) -> Optional[neat.DefaultGenome]:
+        """ The fittest genome of all islands so far - fitness of islands racing on different maps is compared as is """
+        return self._best
+
+    def run(self, generations: int, restore: Optional[str] = None) -> neat.DefaultGenome:
+        """ Evolves every island up to generations, returns the best genome. restore - path of a checkpoint """
+        n_islands = len(self._map_types)
+        states: List[Optional[Dict[str, Any]]] = [None] * n_islands
+        generation = 0
+        if restore is not None:
+            checkpoint = load_island_checkpoint(restore)
+            if len(checkpoint['islands']) != n_islands:
+                raise ValueError(f"Checkpoint has {len(checkpoint['islands'])} islands, not {n_islands}")
+            states, generation, self._best = checkpoint['islands'], checkpoint['generation'], checkpoint['best']
+        context = get_context('spawn')  # spawned workers don't inherit any pygame state of this process
+        results = context.Queue()
+        commands = [context.Queue() for _ in range(n_islands)]
+        workers = [
+            context.Process(
+                target=_island_worker,
+                args=(
+                    i, self._config_path, map_type, self._seed + i, self._migrants, states[i], commands[i], results
+                ),
+                daemon=True
+            )
+            for i, map_type in enumerate(self._map_types)
+        ]
+        for worker in workers:
+            worker.start()
+        emigrants: List[List[neat.DefaultGenome]] = [[] for _ in range(n_islands)]
+        try:
+            while generation < generations:
+                epoch = min(self._migration_interval, generations - generation)
+                previous = generation
+                for i in range(n_islands):
+                    immigrants = [emigrants[j] for j in range(n_islands) if j != i]
+                    commands[i].put(('evolve', epoch, immigrants))
+                solved = False
+                for i, _, best_emigrants, best, island_solved in sorted(self._gather(results, workers), key=_island):
+                    emigrants[i] = best_emigrants
+                    solved |= island_solved
+                    if self._best is None or best.fitness > self._best.fitness:
+                        self._best = best
+                    print(f"Island {i} ({self._map_types[i].name}) best fitness {best.fitness:.1f}")
+                generation += epoch
+                print(f"Generation {generation}/{generations}, best fitness {self._best.fitness:.1f}")
+                # islands stop every migration_interval generations, which needn't be a multiple of checkpoints'
+                checkpoint_due = generation // self._checkpoint_interval > previous // self._checkpoint_interval
+                if solved or generation >= generations or checkpoint_due:
+                    self._checkpoint(generation, commands, results, workers)
+                if solved:
+                    break
+        finally:
+            for queue in commands:
+                queue.put(('stop',))
+            for worker in workers:
+                worker.join()
+
+        return self._best
+
+    def _checkpoint(self, generation: int, commands, results, workers) -> None:
+        for queue in commands:
+            queue.put(('state',))
+        islands = [state for _, state in sorted(self._gather(results, workers), key=_island)]
+        self._out_dir.mkdir(parents=True, exist_ok=True)
+        path = self._out_dir / f"{CHECKPOINT_PREFIX}{generation}"
+        tmp = path.with_name(path.name + '.tmp')
+        with gzip.open(tmp, 'wb', compresslevel=5) as fh:
+            pickle.dump({
+                'generation': generation,
+                'map_types': self._map_types,
+                'islands': islands,
+                'best': self._best
+            }, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        print(f"Saved {path}")
+
+    @staticmethod
+    def _gather(results, workers) -> List[tuple]:
+        """ One result of every island - a dead island would leave the others waiting forever """
+        gathered = []
+        while len(gathered) < len(workers):
+            try:
+                gathered.append(results.get(timeout=1.))
+            except Empty:
+                if not all(worker.is_alive() for worker in workers):
+                    raise RuntimeError("An island process died")
+
+        return gathered
@@ -0,0 +1,203 @@
+import json
+import os
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Optional, Union, List
+
+import neat
+import numpy as np
+
+VERSION = 1
+# one row per generation
+COLUMNS = {
+    'generation': np.int32,
+    'best': np.float64,
+    'mean': np.float64,
+    'stdev': np.float64,
+    'median': np.float64,
+    'population': np.int32,
+    'species': np.int32,
+    'evaluation_time': np.float64,
+    'generation_time': np.float64
+}
+# one row per species of every generation
+SPECIES_COLUMNS = {
+    'species_generation': np.int32,
+    'species_id': np.int32,
+    'species_size': np.int32
+}
+_META = "meta.json"
+_SUFFIX = ".col"
+
+
+def _column_path(path: Path, name: str) -> Path:
+    return path / f"{name}{_SUFFIX}"
+
+
+def _rows(path: Path, columns: Dict[str, type]) -> int:
+    """ Rows written completely to every column - a crash may leave some columns a row (or a part of it) ahead """
+    sizes = []
+    for name, dtype in columns.items():
+        column = _column_path(path, name)
+        sizes.append(column.stat().st_size // np.dtype(dtype).itemsize if column.exists() else 0)
+
+    return min(sizes)
+
+
+def _read(path: Path, name: str, dtype: type, rows: int) -> np.ndarray:
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(_column_path(path, name), dtype=dtype, mode='r', shape=(rows,))
+
+
+def _truncate(path: Path, columns: Dict[str, type], rows: int) -> None:
+    for name, dtype in columns.items():
+        with open(_column_path(path, name), 'ab') as fh:
+            fh.truncate(rows * np.dtype(dtype).itemsize)
+
+
+class StatisticsStore:
+    """
+    Reads the statistics a StreamingStatisticsReporter writes - each column is memory-mapped on access, so only
+    the generations actually used are read, and a store can be read while the run is still writing it.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self._path = Path(path)
+        with open(self._path / _META) as fh:
+            version = json.load(fh)['version']
+        if version != VERSION:
+            raise ValueError(f"Unsupported statistics version {version}, expected {VERSION}")
+
+    def __len__(self) -> int:
+        """ Generations recorded so far """
+        return _rows(self._path, COLUMNS)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def column(self, name: str) -> np.ndarray:
+        """ One value per generation, of a name of COLUMNS """
+        if name not in COLUMNS:
+            raise ValueError(f"Unknown column {name}")
+        return _read(self._path, name, COLUMNS[name], len(self))
+
+    def species_sizes(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """
+        (generations, species) sizes of every species of generations [start, stop) of the store (0 where a species
+        didn't exist), species ordered by id. Only the rows of those generations are read
+        """
+        generations = self.column('generation')[start:stop]
+        rows = _rows(self._path, SPECIES_COLUMNS)
+        if len(generations) == 0 or rows == 0:
+            return np.zeros((len(generations), 0), dtype=np.int32)
+        species_generation = _read(self._path, 'species_generation', np.int32, rows)
+        lower = int(np.searchsorted(species_generation, generations[0], side='left'))
+        upper = int(np.searchsorted(species_generation, generations[-1], side='right'))
+        species_generation = np.asarray(species_generation[lower:upper])
+        species_id = np.asarray(_read(self._path, 'species_id', np.int32, rows)[lower:upper])
+        species_size = np.asarray(_read(self._path, 'species_size', np.int32, rows)[lower:upper])
+        ids, columns = np.unique(species_id, return_inverse=True)
+        sizes = np.zeros((len(generations), len(ids)), dtype=np.int32)
+        sizes[np.searchsorted(generations, species_generation), columns] = species_size
+
+        return sizes
+
+
+class StreamingStatisticsReporter(neat.reporting.BaseReporter):
+    """
+    Appends every generation's fitness statistics, species sizes & timings to a columnar store (a directory
+    of one raw binary file per column, see COLUMNS & SPECIES_COLUMNS) as soon as the generation is over, instead of
+    keeping the whole run in memory as neat.StatisticsReporter does. A crash loses at most the generation in progress.
+
+    Reopening a store appends to it - a run restored from an earlier checkpoint first drops the generations
+    it is about to evolve again. Column files are only open while a generation is appended (so that the reporter
+    can be pickled along with neat's checkpoints).
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self._path = Path(path)
+        self._path.mkdir(parents=True, exist_ok=True)
+        meta = self._path / _META
+        if meta.exists():
+            StatisticsStore(self._path)  # checks the version
+        else:
+            tmp = meta.with_name(meta.name + '.tmp')
+            with open(tmp, 'w') as fh:
+                json.dump({
+                    'version': VERSION,
+                    'columns': {name: np.dtype(dtype).str for name, dtype in COLUMNS.items()},
+                    'species_columns': {name: np.dtype(dtype).str for name, dtype in SPECIES_COLUMNS.items()}
+                }, fh)
+            os.replace(tmp, meta)
+        self._rows = _rows(self._path, COLUMNS)
+        _truncate(self._path, COLUMNS, self._rows)
+        generations = _read(self._path, 'generation', np.int32, self._rows)
+        self._last: Optional[int] = int(generations[-1]) if self._rows else None
+        del generations
+        self._truncate_species(-1 if self._last is None else self._last + 1)
+        self._generation = 0
+        self._start = perf_counter()
+        self._pending: Optional[Dict[str, float]] = None
+        self._species: List[tuple] = []
+
+    @property
+    def store(self) -> StatisticsStore:
+        return StatisticsStore(self._path)
+
+    def start_generation(self, generation: int) -> None:
+        if self._last is not None and self._last >= generation:
+            generations = _read(self._path, 'generation', np.int32, self._rows)
+            self._rows = int(np.searchsorted(generations, generation))
+            self._last = int(generations[self._rows - 1]) if self._rows else None
+            del generations
+            _truncate(self._path, COLUMNS, self._rows)
+            self._truncate_species(generation)
+        self._generation = generation
+        self._start = perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome) -> None:
+        fitness = np.array([genome.fitness for genome in population.values()], dtype=np.float64)
+        self._pending = {
+            'generation': self._generation,
+            'best': best_genome.fitness,
+            'mean': fitness.mean(),
+            'stdev': fitness.std(),
+            'median': np.median(fitness),
+            'population': len(fitness),
+            'species': len(species.species),
+            'evaluation_time': perf_counter() - self._start
+        }
+        self._species = [(self._generation, sid, len(s.members)) for sid, s in sorted(species.species.items())]
+
+    def end_generation(self, config, population, species_set) -> None:
+        self._write(perf_counter() - self._start)
+
+    def found_solution(self, config, generation, best) -> None:
+        self._write(float('nan'))  # the run stops before reproducing the generation
+
+    def _write(self, generation_time: float) -> None:
+        if self._pending is None:
+            return
+        if self._species:  # species first - the store's length is told by the per generation columns
+            species = np.array(self._species)
+            for i, (name, dtype) in enumerate(SPECIES_COLUMNS.items()):
+                with open(_column_path(self._path, name), 'ab') as fh:
+                    fh.write(species[:, i].astype(dtype).tobytes())
+        for name, dtype in COLUMNS.items():
+            value = generation_time if name == 'generation_time' else self._pending[name]
+            with open(_column_path(self._path, name), 'ab') as fh:
+                fh.write(np.array(value, dtype=dtype).tobytes())
+        self._rows += 1
+        self._last = self._pending['generation']
+        self._pending = None
+        self._species = []
+
+    def _truncate_species(self, generation: int) -> None:
+        """ Drops species rows of generation & the later ones """
+        rows = _rows(self._path, SPECIES_COLUMNS)
+        species_generation = _read(self._path, 'species_generation', np.int32, rows)
+        rows = int(np.searchsorted(species_generation, generation))
+        del species_generation
+        _truncate(self._path, SPECIES_COLUMNS, rows)
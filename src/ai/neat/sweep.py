@@ -0,0 +1,214 @@
+import csv
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from configparser import ConfigParser
+from hashlib import sha1
+from itertools import product
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Any, List, Sequence, Callable, Union, Optional
+
+import neat
+
+from src.game import MapType
+
+Overrides = Dict[str, Any]
+# search space - field ('pop_size' or 'NEAT.pop_size') to either the values to try or a sampler of a value
+Space = Dict[str, Union[Sequence[Any], Callable[[random.Random], Any]]]
+RESULT_FIELDS = ['run_id', 'seed', 'generation', 'best_fitness', 'mean_fitness', 'wall_time']
+
+
+def uniform(low: float, high: float) -> Callable[[random.Random], float]:
+    return lambda rng: rng.uniform(low, high)
+
+
+def log_uniform(low: float, high: float) -> Callable[[random.Random], float]:
+    return lambda rng: low * (high / low) ** rng.random()
+
+
+def grid(space: Dict[str, Sequence[Any]]) -> List[Overrides]:
+    """ Every combination of the given values """
+    fields = list(space)
+
+    return [dict(zip(fields, values)) for values in product(*(space[field] for field in fields))]
+
+
+def random_search(space: Space, trials: int, seed: int = 0) -> List[Overrides]:
+    """ trials random points of space, the same for the same seed """
+    rng = random.Random(seed)
+
+    return [
+        {field: values(rng) if callable(values) else rng.choice(list(values)) for field, values in space.items()}
+        for _ in range(trials)
+    ]
+
+
+def apply_overrides(parser: ConfigParser, overrides: Overrides) -> None:
+    """ Fields may skip their section, as long as the field's name is unique in the config """
+    for field, value in overrides.items():
+        if '.' in field:
+            section, option = field.split('.', 1)
+        else:
+            option = field
+            sections = [section for section in parser.sections() if parser.has_option(section, option)]
+            if len(sections) != 1:
+                raise ValueError(f"Field '{field}' is {'ambiguous' if sections else 'unknown'}, use Section.{field}")
+            section = sections[0]
+        if not parser.has_option(section, option):
+            raise ValueError(f"Unknown field '{field}'")
+        if isinstance(value, (list, tuple)):  # e.g. activation_options
+            value = ' '.join(map(str, value))
+        parser.set(section, option, str(value))
+
+
+class _GenerationReporter(neat.reporting.BaseReporter):
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+        self._generation = 0
+        self._start = perf_counter()
+
+    def start_generation(self, generation: int) -> None:
+        self._generation = generation
+        self._start = perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome) -> None:
+        fitnesses = [genome.fitness for genome in population.values()]
+        self.rows.append({
+            'generation': self._generation,
+            'best_fitness': best_genome.fitness,
+            'mean_fitness': sum(fitnesses) / len(fitnesses),
+            'wall_time': perf_counter() - self._start
+        })
+
+
+def _run_trial(
+        run_id: str,
+        config_path: str,
+        overrides: Overrides,
+        map_type: MapType,
+        generations: int,
+        seed: int,
+        out_dir: str
+) -> str:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # workers never open a window
+    from .controller import NeatController
+
+    out = Path(out_dir)
+    parser = ConfigParser()
+    parser.read(config_path)
+    apply_overrides(parser, overrides)
+    trial_config = out / 'configs' / f"{run_id}.ini"
+    with open(trial_config, 'w') as fh:
+        parser.write(fh)
+    config = neat.Config(
+        neat.DefaultGenome,
+        neat.DefaultReproduction,
+        neat.DefaultSpeciesSet,
+        neat.DefaultStagnation,
+        str(trial_config)
+    )
+    random.seed(seed)  # neat draws from the global generator, the game itself is deterministic
+    population = neat.Population(config)
+    reporter = _GenerationReporter()
+    population.add_reporter(reporter)
+    controller = NeatController(map_type, headless=True)
+    population.run(controller.run, generations)
+    controller.quit()
+    # a run's results appear at once, so an interrupted run simply runs again
+    path = out / 'runs' / f"{run_id}.csv"
+    tmp = out / 'runs' / f"{run_id}.csv.tmp"
+    with open(tmp, 'w', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=RESULT_FIELDS + sorted(overrides))
+        writer.writeheader()
+        for row in reporter.rows:
+            writer.writerow({'run_id': run_id, 'seed': seed, **row, **overrides})
+    os.replace(tmp, path)
+
+    return run_id
+
+
+class SweepRunner:
+    """
+    Runs NEAT trainings of many config variants in a process pool, each on a headless NeatController.
+
+    Every run gets an id derived from its settings & overrides, its per-generation best & mean fitness and wall time
+    land in out_dir/runs/<run_id>.csv once it's finished. Runs which already have results are skipped, hence
+    an interrupted sweep resumes by running it again. All results are merged into out_dir/results.csv.
+    """
+
+    def __init__(
+            self,
+            config_path: str,
+            map_type: MapType,
+            out_dir: str,
+            generations: int = 20,
+            seeds: Sequence[int] = (0,),
+            max_workers: Optional[int] = None
+    ):
+        """ max_workers - concurrently running trainings (each uses a single CPU), at most the number of CPUs """
+        cpus = os.cpu_count() or 1
+        self._config_path = str(Path(config_path).resolve())
+        # editing the base config changes every run's id, so that a resumed sweep doesn't report stale results
+        self._config_digest = sha1(Path(self._config_path).read_bytes()).hexdigest()
+        self._map_type = map_type
+        self._out_dir = Path(out_dir)
+        self._generations = generations
+        self._seeds = tuple(seeds)
+        self._max_workers = min(max_workers or cpus, cpus)
+
+    def run_id(self, overrides: Overrides, seed: int) -> str:
+        key = repr((
+            self._config_digest, self._map_type.name, self._generations, seed, sorted(overrides.items())
+        ))
+
+        return sha1(key.encode()).hexdigest()[:12]
+
+    def run(self, trials: Sequence[Overrides]) -> Path:
+        """ Returns path of the results table """
+        (self._out_dir / 'runs').mkdir(parents=True, exist_ok=True)
+        (self._out_dir / 'configs').mkdir(parents=True, exist_ok=True)
+        pending = []
+        for overrides in trials:
+            for seed in self._seeds:
+                run_id = self.run_id(overrides, seed)
+                if not (self._out_dir / 'runs' / f"{run_id}.csv").exists():
+                    pending.append((run_id, overrides, seed))
+        print(f"{len(trials) * len(self._seeds) - len(pending)} runs done already, {len(pending)} to go")
+        # spawned workers don't inherit any pygame state of this process
+        with ProcessPoolExecutor(max_workers=self._max_workers, mp_context=get_context('spawn')) as pool:
+            futures = {
+                pool.submit(
+                    _run_trial, run_id, self._config_path, overrides, self._map_type, self._generations, seed,
+                    str(self._out_dir)
+                ): run_id
+                for run_id, overrides, seed in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    print(f"Run {futures[future]} finished")
+                except Exception as e:  # a failed run doesn't stop the sweep, it's retried on resume
+                    print(f"Run {futures[future]} failed: {e!r}")
+                self.collect()
+
+        return self.collect()
+
+    def collect(self) -> Path:
+        """ Merges results of all finished runs into a single table """
+        rows, fields = [], list(RESULT_FIELDS)
+        for path in sorted((self._out_dir / 'runs').glob("*.csv")):
+            with open(path, newline='') as fh:
+                reader = csv.DictReader(fh)
+                fields.extend(field for field in reader.fieldnames if field not in fields)
+                rows.extend(reader)
+        path = self._out_dir / 'results.csv'
+        tmp = self._out_dir / 'results.csv.tmp'
+        with open(tmp, 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp, path)
+
+        return path
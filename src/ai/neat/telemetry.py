@@ -0,0 +1,37 @@
+from time import perf_counter
+
+import neat
+
+from src.game import Telemetry
+
+
+class TelemetryReporter(neat.reporting.BaseReporter):
+    """ Records every generation's fitness distribution, species & wall time as telemetry """
+
+    def __init__(self, telemetry: Telemetry):
+        self._telemetry = telemetry
+        self._generation = 0
+        self._start = perf_counter()
+
+    def start_generation(self, generation: int) -> None:
+        self._generation = generation
+        self._start = perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome) -> None:
+        telemetry, generation = self._telemetry, self._generation
+        telemetry.histogram('fitness', [genome.fitness for genome in population.values()], generation)
+        telemetry.scalar('best_fitness', best_genome.fitness, generation)
+        telemetry.scalar('species', len(species.species), generation)
+        telemetry.scalar('evaluation_time', perf_counter() - self._start, generation)
+
+    def end_generation(self, config, population, species_set) -> None:
+        self._telemetry.scalar('generation_time', perf_counter() - self._start, self._generation)
+
+    def found_solution(self, config, generation, best) -> None:
+        self._telemetry.event('solution', generation, fitness=best.fitness)
+
+    def species_stagnant(self, sid, species) -> None:
+        self._telemetry.event('species_stagnant', self._generation, species=sid)
+
+    def complete_extinction(self) -> None:
+        self._telemetry.event('extinction', self._generation)
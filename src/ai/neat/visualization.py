@@ -8,22 +8,40 @@ I do not claim any rights to visualization.py
 
 
 import warnings
+from pathlib import Path
 
 import graphviz
 import matplotlib.pyplot as plt
 import numpy as np
 
+from .stats_store import StatisticsStore
 
-def plot_stats(statistics, ylog=False, view=False, filename='avg_fitness.svg'):
-    """ Plots the population's average and best fitness. """
+
+def _store(statistics):
+    """ A path of a StreamingStatisticsReporter's store is read lazily """
+    return StatisticsStore(statistics) if isinstance(statistics, (str, Path)) else statistics
+
+
+def plot_stats(statistics, ylog=False, view=False, filename='avg_fitness.svg', start=0, stop=None):
+    """
+    Plots the population's average and best fitness of generations [start, stop). statistics - a
+    neat.StatisticsReporter, a StatisticsStore or its path, which can be plotted while the run is still writing it
+    """
     if plt is None:
         warnings.warn("This display is not available due to a missing optional dependency (matplotlib)")
         return
 
-    generation = range(len(statistics.most_fit_genomes))
-    best_fitness = [c.fitness for c in statistics.most_fit_genomes]
-    avg_fitness = np.array(statistics.get_fitness_mean())
-    stdev_fitness = np.array(statistics.get_fitness_stdev())
+    statistics = _store(statistics)
+    if isinstance(statistics, StatisticsStore):
+        generation = statistics.column('generation')[start:stop]
+        best_fitness = statistics.column('best')[start:stop]
+        avg_fitness = statistics.column('mean')[start:stop]
+        stdev_fitness = statistics.column('stdev')[start:stop]
+    else:
+        generation = range(len(statistics.most_fit_genomes))[start:stop]
+        best_fitness = [c.fitness for c in statistics.most_fit_genomes[start:stop]]
+        avg_fitness = np.array(statistics.get_fitness_mean()[start:stop])
+        stdev_fitness = np.array(statistics.get_fitness_stdev()[start:stop])
 
     plt.plot(generation, avg_fitness, 'b-', label="average")
     plt.plot(generation, avg_fitness - stdev_fitness, 'g-.', label="-1 sd")
@@ -94,18 +112,23 @@ def plot_spikes(spikes, view=False, filename=None, title=None):
     return fig
 
 
-def plot_species(statistics, view=False, filename='speciation.svg'):
-    """ Visualizes speciation throughout evolution. """
+def plot_species(statistics, view=False, filename='speciation.svg', start=0, stop=None):
+    """ Visualizes speciation of generations [start, stop). statistics - the same as plot_stats' """
     if plt is None:
         warnings.warn("This display is not available due to a missing optional dependency (matplotlib)")
         return
 
-    species_sizes = statistics.get_species_sizes()
-    num_generations = len(species_sizes)
-    curves = np.array(species_sizes).T
+    statistics = _store(statistics)
+    if isinstance(statistics, StatisticsStore):
+        generation = statistics.column('generation')[start:stop]
+        curves = statistics.species_sizes(start, stop).T
+    else:
+        species_sizes = statistics.get_species_sizes()[start:stop]
+        generation = range(len(statistics.get_species_sizes()))[start:stop]
+        curves = np.array(species_sizes).T
 
     fig, ax = plt.subplots()
-    ax.stackplot(range(num_generations), *curves)
+    ax.stackplot(generation, *curves)
 
     plt.title("Speciation")
     plt.ylabel("Size per Species")
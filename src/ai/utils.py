@@ -13,6 +13,20 @@ def get_ann(n_observations: int, n_actions: int) -> tf.keras.models.Model:
     ])
 
 
+def get_conv_ann(size: int, n_actions: int) -> tf.keras.models.Model:
+    """ For (size, size) uint8 top-down views, see VisionConfig """
+    return Sequential([
+        tf.keras.layers.InputLayer((size, size)),
+        tf.keras.layers.Reshape((size, size, 1)),
+        tf.keras.layers.Rescaling(1 / 255),
+        tf.keras.layers.Conv2D(16, 5, strides=2, activation='relu'),
+        tf.keras.layers.Conv2D(32, 3, strides=2, activation='relu'),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(64, activation='relu'),
+        tf.keras.layers.Dense(n_actions, activation=None)
+    ])
+
+
 def get_agent(model: tf.keras.models.Model, time_step_spec, action_spec) -> DqnAgent:
     train_step_counter = tf.Variable(0)
     agent = DqnAgent(
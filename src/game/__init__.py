@@ -24,13 +24,24 @@ from .assets import (
     K_LEFT,
     K_RIGHT
 )
-from .cars import PlayerCar, AiCar, Car
+from .cars import PlayerCar, AiCar, Car, AiCarPool, radars_distances_many
+from .sensors import RadarConfig, RadarSuite, DEFAULT_RADARS
+from .vision import VisionConfig, Vision, DEFAULT_VISION, get_vision
 from .meta import GameState, MapMeta, MapType, Checkpoint
 from .controller import (
     Controller,
     AiController,
     OnePlayerController,
     PlayerVersusNeatController,
-    PlayerVersusDqnController
+    PlayerVersusDqnController,
+    PlayerVersusFieldController
 )
 from .controls import CarMovement
+from .network import CompactNetwork, NetworkBatch, DenseBatch, ACTIVATIONS
+from .physics import apply_movement, apply_movements, apply_keys
+from .trace import Trace, TraceRecorder, TraceReplayer
+from .contacts import CarContacts
+from .telemetry import Telemetry
+from .pacing import FramePacer
+from .tracks import TrackBundle, compile_track, load_track_bundle
+from .radar_table import RadarTable, build_radar_table, load_radar_table, use_radar_table
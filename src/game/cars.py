@@ -1,13 +1,15 @@
 from __future__ import annotations
 from abc import ABC
-from typing import Tuple, Optional, List, Callable
-from math import radians, cos, sin
+from typing import Tuple, Optional, List, Callable, MutableSequence, Sequence
+from math import radians, cos, sin, ceil, hypot
 
+import numpy as np
 import pygame.draw
-from pygame import Color, Mask, Surface
+from pygame import Mask, Surface, Rect
 
-from .utils import Window, Image, rotate_image, scale_image, get_mask, Point, distance
+from .utils import Window, Image, rotate_image, get_sprite, get_mask, get_display_image, Point, distance
 from .assets import CAR, AI_CAR
+from .sensors import RadarConfig, DEFAULT_RADARS, get_radar_suite
 
 
 class Car(ABC):
@@ -19,11 +21,20 @@ class Car(ABC):
             max_velocity: float,
             rotation_velocity: float,
             start_angle: float = .0,
-            acceleration: float = .15
+            acceleration: float = .15,
+            radar_config: RadarConfig = DEFAULT_RADARS,
+            sweep_step: Optional[float] = None,
+            mask: Optional[Mask] = None
     ):
+        """
+        sweep_step - the longest move (px) checked for collisions at its end position only
+        mask - img's mask, if it's shared with other cars
+        """
         self._img = img
-        self._mask = get_mask(self._img)
+        self._mask = mask if mask is not None else get_mask(self._img)
         self._x, self._y = start_position
+        self._prev_x, self._prev_y = self._x, self._y  # position before the last move
+        self._sweep_step = sweep_step or max(min(self._mask.get_size()) / 2, 1)
         self._max_velocity = max_velocity
         self._velocity = .0
         self._rotation_velocity = rotation_velocity
@@ -31,6 +42,9 @@ class Car(ABC):
         self._acceleration = acceleration
         self.alive = True
         self._radars: List[Tuple[int, Point]] = []  # radar's length & terminal point
+        self._radar_suite = get_radar_suite(radar_config, track)
+        self._radars_valid = False  # radars are computed lazily, at most once per pose
+        self._distances: Optional[List[float]] = None
         self._track = track
 
     def get_rect_center(self) -> Tuple[int, int]:
@@ -68,14 +82,30 @@ class Car(ABC):
     def acceleration(self) -> float:
         return self._acceleration
 
+    @property
+    def radar_config(self) -> RadarConfig:
+        return self._radar_suite.config
+
+    @property
+    def radars(self) -> List[Tuple[int, Point]]:
+        """ Radar's length & terminal point, computed on first access after the car has moved """
+        if not self._radars_valid:
+            self._calculate_radars()
+            self._radars_valid = True
+
+        return self._radars
+
     def rotate(self, left: bool = False) -> None:
         if left:
             self._angle += self._rotation_velocity
         else:
             self._angle -= self._rotation_velocity
+        self._prev_x, self._prev_y = self._x, self._y  # turning in place doesn't travel any segment
+        self._invalidate_radars()
 
-    def draw(self, window: Window) -> None:
-        rotate_image(window=window, image=self._img, top_left=(self._x, self._y), angle=self._angle)
+    def draw(self, window: Window) -> Rect:
+        """ Returns the area drawn over """
+        return rotate_image(window=window, image=self._img, top_left=(self._x, self._y), angle=self._angle)
 
     def accelerate(self) -> Optional[Tuple[float, float]]:
         self._velocity = min(self._velocity + self._acceleration, self._max_velocity)
@@ -92,9 +122,10 @@ class Car(ABC):
             rad = radians(self._angle)
             dx = cos(rad) * self._velocity
             dy = sin(rad) * self._velocity
+            self._prev_x, self._prev_y = self._x, self._y
             self._x += dx
             self._y -= dy
-            self._calculate_radars()
+            self._invalidate_radars()
 
             return dx, dy
 
@@ -107,39 +138,92 @@ class Car(ABC):
         self._velocity = - self._velocity
         self.move()
 
+    def knock_back(self) -> None:
+        """ Contact with another car - back to the position before the last move, rolling back at half the speed """
+        self._x, self._y = self._prev_x, self._prev_y
+        self._velocity = -self._velocity / 2
+        self._invalidate_radars()
+
     def is_colliding(self, mask: Mask, x: int = 0, y: int = 0) -> Optional[Tuple[int, int]]:
         offset = (int(self.x - x), int(self.y - y))
         poi = mask.overlap(self._mask, offset)  # point of intersection
 
         return poi
 
-    def draw_radars(self, window: Window) -> None:
-        for r_len, r_point in self._radars:
+    def is_colliding_swept(self, mask: Mask, x: int = 0, y: int = 0) -> Optional[Tuple[int, int]]:
+        """
+        Continuous version of is_colliding - checks the whole segment travelled during the last move,
+        so that fast cars can't tunnel through thin borders. Sub-steps only moves longer than sweep_step.
+        On collision the car is put back to the first colliding position.
+        """
+        dx, dy = self._x - self._prev_x, self._y - self._prev_y
+        steps = ceil(hypot(dx, dy) / self._sweep_step)
+        if steps <= 1:
+            return self.is_colliding(mask, x, y)
+        for i in range(1, steps + 1):
+            px, py = self._prev_x + dx * i / steps, self._prev_y + dy * i / steps
+            poi = mask.overlap(self._mask, (int(px - x), int(py - y)))
+            if poi:
+                if i < steps:
+                    self._x, self._y = px, py
+                    self._invalidate_radars()
+                return poi
+
+        return None
+
+    def draw_radars(self, window: Window) -> Optional[Rect]:
+        """ Returns the area drawn over """
+        max_range = self.radar_config.max_range
+        drawn = []
+        for r_len, r_point in self.radars:
             line = ((255, 255, 255), self.get_rect_center(), r_point, 1)
-            circle = ((0, 255, 0) if r_len == 200 else (255, 0, 0), r_point, 3)
-            pygame.draw.line(window, *line)
-            pygame.draw.circle(window, *circle)
+            circle = ((0, 255, 0) if r_len == max_range else (255, 0, 0), r_point, 3)
+            drawn.append(pygame.draw.line(window, *line))
+            drawn.append(pygame.draw.circle(window, *circle))
+
+        return drawn[0].unionall(drawn[1:]) if drawn else None
+
+    def radars_distances(self, out: Optional[MutableSequence[float]] = None) -> MutableSequence[float]:
+        """ If out is given (e.g. a preallocated np.ndarray), distances are written into it in place """
+        if self._distances is None:
+            center = self.get_rect_center()
+            self._distances = [
+                distance(center, r_point) - correction
+                for (_, r_point), correction in zip(self.radars, self.radar_config.corrections)
+            ]
+        if out is None:
+            return list(self._distances)
+        out[:] = self._distances
+
+        return out
+
+    def convert_image(self) -> None:
+        """ Converts car's image to display's pixel format, so that it's drawn faster. Needs an initialized display """
+        self._img = get_display_image(self._img)
+
+    def set_kinematics(self, x: float, y: float, angle: float, velocity: float) -> None:
+        """ Sets the outcome of a tick computed elsewhere, e.g. by batched physics """
+        self._prev_x, self._prev_y = self._x, self._y
+        self._x, self._y = x, y
+        self._angle = angle
+        self._velocity = velocity
+        self._invalidate_radars()
 
     def _calculate_radars(self) -> None:
-        radar_angles = (-60, -30, 0, 30, 60)
-        self._radars = []
-        for angle in radar_angles:
-            length = 0
-            x, y = self.get_rect_center()
-            while self._track.get_at((x, y)) != Color(0, 0, 0, 0) and length < 200:
-                length += 1
-                x, y = self.get_rect_center()
-                x = int(x + cos(radians(self._angle + angle)) * length)
-                y = int(y - sin(radians(self._angle + angle)) * length)
-            self._radars.append((length, (x, y)))
+        self._radars = self._radar_suite.sweep(self.get_rect_center(), self._angle)
+
+    def _invalidate_radars(self) -> None:
+        self._radars_valid = False
+        self._distances = None
 
     def reset(self, x: int, y: int, angle: int) -> None:
         self._x = x
         self._y = y
+        self._prev_x, self._prev_y = x, y
         self._angle = angle
         self._velocity = 0
         self.alive = True
-        self._calculate_radars()
+        self._invalidate_radars()
 
 
 class PlayerCar(Car):
@@ -152,8 +236,10 @@ class PlayerCar(Car):
             start_angle: float = .0,
             acceleration: float = .15
     ):
+        img, mask = get_sprite(CAR, .65)
         super().__init__(
-            img=scale_image(CAR, .65),
+            img=img,
+            mask=mask,
             start_position=start_position,
             max_velocity=max_velocity,
             rotation_velocity=rotation_velocity,
@@ -189,20 +275,23 @@ class AiCar(Car):
             start_angle: float = .0,
             acceleration: float = .15,
             use_threshold: bool = True,
-            velocity: float = .0
+            velocity: float = .0,
+            radar_config: RadarConfig = DEFAULT_RADARS
     ):
+        img, mask = get_sprite(AI_CAR, .35)
         super().__init__(
-            img=scale_image(AI_CAR, .35),
+            img=img,
+            mask=mask,
             start_position=start_position,
             max_velocity=max_velocity,
             rotation_velocity=rotation_velocity,
             start_angle=start_angle,
             acceleration=acceleration,
-            track=track
+            track=track,
+            radar_config=radar_config
         )
         self._velocity = velocity
         self.__bounce_count = 0
-        self._calculate_radars()
         self.__movement_thresh = movement_threshold
         self.stagnation = 0
         self._use_threshold = use_threshold
@@ -215,17 +304,20 @@ class AiCar(Car):
     def use_threshold(self) -> bool:
         return self._use_threshold
 
-    def radars_distances(self) -> List[float]:
-        self._calculate_radars()
-        distances = []
-        for i, (_, r_point) in enumerate(self._radars):
-            dst = distance(self.get_rect_center(), r_point)
-            # -30, 0, 30 degrees radars need adjusting
-            if i in (1, 2, 3):
-                dst -= 45  # more or less
-            distances.append(dst)
+    @property
+    def bounce_count(self) -> int:
+        return self.__bounce_count
 
-        return distances
+    @bounce_count.setter
+    def bounce_count(self, value: int) -> None:
+        self.__bounce_count = value
+
+    def respawn(self, position: Point, angle: float, velocity: float = .0) -> None:
+        """ Cheap reset to a freshly built car's state """
+        self.reset(*position, angle)
+        self._velocity = velocity
+        self.stagnation = 0
+        self.__bounce_count = 0
 
     @stagnate(7)
     def rotate(self, left: bool = False) -> None:
@@ -246,13 +338,9 @@ class AiCar(Car):
         if self.alive:
             return super().inertia()
 
-    def draw_radars(self, window: Window) -> None:
+    def draw_radars(self, window: Window) -> Optional[Rect]:
         if self.alive:
-            super().draw_radars(window)
-
-    def _calculate_radars(self) -> None:
-        if self.alive:
-            super()._calculate_radars()
+            return super().draw_radars(window)
 
     @stagnate(20)
     def bounce(self):
@@ -261,3 +349,55 @@ class AiCar(Car):
             self.alive = False
         if self.alive:
             super().bounce()
+
+    @stagnate(20)
+    def knock_back(self) -> None:
+        if self.alive:
+            super().knock_back()
+
+
+class AiCarPool:
+    """
+    Recycles AiCars built with the same parameters - taking cars respawns already built ones, so that no sprite,
+    mask or radar setup is repeated. Cars of the previous take are the ones being recycled.
+    """
+
+    def __init__(self, **params):
+        """ params - of AiCar, except start_position, start_angle & velocity """
+        self._params = params
+        self._cars: List[AiCar] = []
+
+    def take(self, count: int, position: Point, angle: float, velocity: float = .0) -> List[AiCar]:
+        while len(self._cars) < count:
+            self._cars.append(AiCar(**self._params))
+        cars = self._cars[:count]
+        for car in cars:
+            car.respawn(position, angle, velocity)
+
+        return cars
+
+
+def radars_distances_many(cars: Sequence[Car], out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Observations of many cars as a single (cars, rays) matrix. Cars sharing a radar suite layout and track
+    are swept together in one vectorized pass, radars which are still valid are served from cars' caches.
+    """
+    if out is None:
+        out = np.zeros((len(cars), cars[0].radar_config.rays), dtype=np.float32)
+    groups = {}
+    for i, car in enumerate(cars):
+        if not car._radars_valid:
+            groups.setdefault((car.radar_config, id(car._track)), []).append(i)
+    for indices in groups.values():
+        suite = cars[indices[0]]._radar_suite
+        lengths, points = suite.sweep_many(
+            [cars[i].get_rect_center() for i in indices],
+            [cars[i].angle for i in indices]
+        )
+        for i, car_lengths, car_points in zip(indices, lengths.tolist(), points.tolist()):
+            cars[i]._radars = [(length, tuple(point)) for length, point in zip(car_lengths, car_points)]
+            cars[i]._radars_valid = True
+    for i, car in enumerate(cars):
+        car.radars_distances(out[i])
+
+    return out
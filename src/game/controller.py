@@ -1,102 +1,216 @@
-from typing import Tuple, List
+from __future__ import annotations
+from typing import Tuple, List, Optional, MutableSequence, Sequence, Union, TYPE_CHECKING
 from abc import ABC, abstractmethod
+from pathlib import Path
 
+import numpy as np
 import pygame
 from decouple import config
-from neat.nn.feed_forward import FeedForwardNetwork
-from neat.config import Config
-from dill import loads
 from numpy import argmax
-from tf_agents.utils.common import Checkpointer
-from tf_agents.environments.tf_environment import TFEnvironment
-from tf_agents.agents import DqnAgent
 
 from .meta import GameState, MapMeta, MapType
 from .utils import Window, display_text_center, display_text, draw_ai_controls
 from .assets import MAIN_FONT
-from .cars import PlayerCar, Car, AiCar
+from .cars import PlayerCar, Car, AiCar, radars_distances_many
 from .controls import CarMovement
-from ..ai import (
-    get_ann,
-    get_agent
-)
+from .network import CompactNetwork, NetworkBatch, DenseBatch
+from .pacing import FramePacer
+from .physics import apply_movements, apply_keys, KEY_LEFT, KEY_RIGHT, KEY_UP, KEY_DOWN
+from .telemetry import Telemetry
+from .trace import TraceRecorder, IDLE_STAGNATION, FINISH_KILLS, CAR_CONTACTS
+from .contacts import CarContacts
+
+if TYPE_CHECKING:  # AI backends are imported only when an AI opponent is actually built
+    from tf_agents.environments.tf_environment import TFEnvironment
+    from tf_agents.agents import DqnAgent
 
 
 class Controller(ABC):
     def __init__(
             self,
-            map_type: MapType,
+            map_type: Union[MapType, str],
             max_levels: int = 5,
             draw_radars: bool = False,
             hardcore: bool = False,
             draw_checkpoints: bool = False,
+            headless: bool = False,
+            trace_dir: Optional[str] = None,
+            telemetry: Optional[Telemetry] = None,
+            car_contacts: bool = False
     ):
-        self._map_meta = MapMeta(map_type)
+        """
+        map_type - a built-in map or path of a compiled track bundle, see compile_track
+        trace_dir - if given, runs are recorded there as traces, see TraceReplayer
+        telemetry - if given, receives game events, e.g. cars crossing the finish line
+        car_contacts - whether cars collide with each other, see CarContacts
+        """
+        self._map_meta = MapMeta.from_bundle(map_type) if isinstance(map_type, str) else MapMeta(map_type)
         self._draw_radars = draw_radars or hardcore
         self._draw_checkpoints = draw_checkpoints
         self._hardcore = hardcore
-        self._state = GameState(max_levels=max_levels)
-        self._cars: List[Car] = []
+        self._headless = headless
         self._fps = config('FPS', cast=int)
-        self._window, self._clock = self._init_game()
+        # headless games run on simulated time, as fast as possible
+        self._state = GameState(max_levels=max_levels, frame_time=1 / self._fps if headless else None)
+        self._cars: List[Car] = []
+        self._window = self._init_game(headless)
+        self._pacer = FramePacer(self._fps)
+        if headless:
+            self._track_image, self._finish_line_image = self._map_meta.track, self._map_meta.finish_line
+        else:  # copies in display's pixel format, blitting them is an order of magnitude faster
+            self._track_image = self._map_meta.track.convert_alpha()
+            self._finish_line_image = self._map_meta.finish_line.convert_alpha()
+        self._trace_dir = Path(trace_dir) if trace_dir is not None else None
+        self._trace_rules = 0  # see trace's rules
+        self._recorder: Optional[TraceRecorder] = None
+        self._telemetry = telemetry
+        self._contacts = CarContacts() if car_contacts else None
+        if car_contacts:
+            self._trace_rules |= CAR_CONTACTS
         self._run = True
+        # frames are drawn over a cached background - track & finish line. Only areas drawn over by the
+        # previous frame are restored and only those & the ones drawn by this frame are pushed to the display
+        self._background: Optional[pygame.Surface] = None
+        self._restored: List[pygame.Rect] = []
+        self._dirty: List[pygame.Rect] = []  # areas drawn over the background by the current frame
+        self._full_redraw = True
 
     @staticmethod
-    def _init_game() -> Tuple[Window, pygame.time.Clock]:
+    def _init_game(headless: bool = False) -> Window:
         pygame.init()
         width = config('WIDTH', cast=int)
         height = config('HEIGHT', cast=int)
+        if headless:
+            return pygame.Surface((width, height))
         pygame.display.set_caption("AI racing car")
 
-        return pygame.display.set_mode((width, height)), pygame.time.Clock()
+        return pygame.display.set_mode((width, height))
+
+    def _tick(self) -> None:
+        """ Advances game time by a single frame """
+        self._state.tick()
+        if self._recorder is not None:
+            self._recorder.end_tick()
+        if self._telemetry is not None:
+            self._telemetry.count('ticks')
+        if not self._headless:
+            self._pacer.tick()
+            if self._telemetry is not None and self._pacer.frames % self._fps == 0:
+                self._telemetry.histogram('frame_time', self._pacer.frame_times)
+
+    def _begin_trace_segment(self) -> None:
+        """ Call right after cars were (re)spawned. A new set of cars starts a new trace """
+        if self._contacts is not None:
+            self._contacts.reset(self._cars)
+        if self._trace_dir is None:
+            return
+        if self._recorder is None or self._recorder.cars != self._cars:
+            self._save_trace()
+            self._recorder = TraceRecorder(self._map_meta.map_type, self._cars, self._trace_rules)
+        self._recorder.begin_segment(self._map_meta.checkpoints)
+
+    def _end_trace_segment(self) -> None:
+        """ Call before cars are reset """
+        if self._recorder is not None:
+            self._recorder.end_segment()
+
+    def _record(self, car: Car, action: int) -> None:
+        if self._recorder is not None:
+            self._recorder.record(car, action)
+
+    def _event(self, name: str, **fields) -> None:
+        if self._telemetry is not None:
+            self._telemetry.event(name, level=self._state.level, level_time=self._state.level_time(), **fields)
+
+    def _save_trace(self) -> None:
+        if self._recorder is None:
+            return
+        trace = self._recorder.trace()
+        self._recorder = None
+        if trace.ticks == 0:
+            return
+        self._trace_dir.mkdir(parents=True, exist_ok=True)
+        index = len(list(self._trace_dir.glob("trace-*.trace")))
+        trace.save(str(self._trace_dir / f"trace-{index:05d}.trace"))
 
     def _reset_car(self, car: Car) -> None:
         car.reset(*self._map_meta.car_initial_pos, self._map_meta.car_initial_angle)
 
     def _draw(self) -> None:
-        self._window.fill((0, 0, 0))
-        if not self._hardcore:
-            self._window.blit(self._map_meta.track, (0, 0))
-            self._window.blit(self._map_meta.finish_line, (0, 0))
-        for car in self._cars:
-            car.draw(self._window)
-            if self._draw_radars:
-                car.draw_radars(self._window)
-        if self._draw_checkpoints:
+        """ Draws the frame into the window, subclasses add what they draw over it to _dirty. See _present """
+        if self._background is None:
+            self._background = self.__render_background()
+            self._full_redraw = True
+        if self._full_redraw:
+            self._window.blit(self._background, (0, 0))
+            self._restored = []
+        else:
+            self._restored = [self._window.blit(self._background, rect, rect) for rect in self._dirty]
+        self._dirty = []
+        self._draw_cars()
+        if self._draw_checkpoints:  # over the cars
             self.__draw_checkpoints()
 
         lvl_text = MAIN_FONT.render(f"Level {self._state.level}", True, (255, 255, 255))
         time_text = MAIN_FONT.render(f"Time {self._state.level_time():.3f}s", True, (255, 255, 255))
-        self._window.blit(lvl_text, (10, self._window.get_height() - lvl_text.get_height() - 70))
-        self._window.blit(time_text, (10, self._window.get_height() - time_text.get_height() - 20))
+        self._dirty.append(
+            self._window.blit(lvl_text, (10, self._window.get_height() - lvl_text.get_height() - 70))
+        )
+        self._dirty.append(
+            self._window.blit(time_text, (10, self._window.get_height() - time_text.get_height() - 20))
+        )
+
+    def _draw_cars(self) -> None:
+        for car in self._cars:
+            self._dirty.append(car.draw(self._window))
+            if self._draw_radars:
+                self._draw_car_radars(car)
+
+    def _draw_car_radars(self, car: Car) -> None:
+        radars = car.draw_radars(self._window)
+        if radars is not None:
+            self._dirty.append(radars)
+
+    def _present(self) -> None:
+        """ Pushes the drawn frame to the display - only its changed areas, unless the whole window was redrawn """
+        if self._full_redraw:
+            pygame.display.update()
+            self._full_redraw = False
+        else:
+            pygame.display.update(self._restored + self._dirty)
+
+    def __render_background(self) -> pygame.Surface:
+        background = pygame.Surface(self._window.get_size())
+        if not self._headless:
+            background = background.convert()
+        if not self._hardcore:
+            background.blit(self._track_image, (0, 0))
+            background.blit(self._finish_line_image, (0, 0))
+
+        return background
 
     def __draw_checkpoints(self) -> None:
         for checkpoint in self._map_meta.checkpoints:
             if checkpoint.active:
-                pygame.draw.rect(self._window, (0, 255, 0), checkpoint)
+                self._dirty.append(pygame.draw.rect(self._window, (0, 255, 0), checkpoint))
 
     def _init_monit(self) -> None:
         display_text_center(self._window, f"Press any key to start {self._state.level} level!", MAIN_FONT)
         pygame.display.update()
+        self._full_redraw = True  # the message is drawn over the whole window
 
     @staticmethod
-    def _player_controls(car: Car) -> None:
+    def _player_controls(car: Car) -> int:
+        """ Returns applied keys, as KEY_* bits """
         keys = pygame.key.get_pressed()
-        changing_velocity = False
-
-        if keys[pygame.K_LEFT]:
-            car.rotate(left=True)
-        if keys[pygame.K_RIGHT]:
-            car.rotate(left=False)
-        if keys[pygame.K_UP]:
-            changing_velocity = True
-            car.accelerate()
-        if keys[pygame.K_DOWN]:
-            changing_velocity = True
-            car.decelerate()
+        pressed = 0
+        for key, bit in ((pygame.K_LEFT, KEY_LEFT), (pygame.K_RIGHT, KEY_RIGHT), (pygame.K_UP, KEY_UP),
+                         (pygame.K_DOWN, KEY_DOWN)):
+            if keys[key]:
+                pressed |= bit
+        apply_keys(car, pressed)
 
-        if not changing_velocity:
-            car.inertia()
+        return pressed
 
     @abstractmethod
     def run(self) -> None:
@@ -110,22 +224,32 @@ class AiController(Controller, ABC):
             max_levels: int = 5,
             draw_radars: bool = False,
             hardcore: bool = False,
-            draw_checkpoints: bool = False
+            draw_checkpoints: bool = False,
+            headless: bool = False,
+            trace_dir: Optional[str] = None,
+            telemetry: Optional[Telemetry] = None,
+            car_contacts: bool = False
     ):
         super().__init__(
             map_type=map_type,
             max_levels=max_levels,
             draw_radars=draw_radars,
             hardcore=hardcore,
-            draw_checkpoints=draw_checkpoints
+            draw_checkpoints=draw_checkpoints,
+            headless=headless,
+            trace_dir=trace_dir,
+            telemetry=telemetry,
+            car_contacts=car_contacts
         )
         self._ai_movements: List[CarMovement] = []
+        self._trace_rules |= IDLE_STAGNATION | FINISH_KILLS
 
     def _handle_car_movement(self, car: AiCar, movement: CarMovement) -> float:
         dxdy = None
         reward = -2
         promote = False
         self._ai_movements = []
+        self._record(car, movement.value)
         if movement == CarMovement.LEFT:
             car.rotate(left=True)
             self._ai_movements.append(CarMovement.LEFT)
@@ -179,14 +303,20 @@ class OnePlayerController(Controller):
             max_levels: int = 5,
             draw_radars: bool = False,
             hardcore: bool = False,
-            draw_checkpoints: bool = False
+            draw_checkpoints: bool = False,
+            trace_dir: Optional[str] = None,
+            telemetry: Optional[Telemetry] = None,
+            car_contacts: bool = False
     ):
         super().__init__(
             map_type=map_type,
             max_levels=max_levels,
             draw_radars=draw_radars,
             hardcore=hardcore,
-            draw_checkpoints=draw_checkpoints
+            draw_checkpoints=draw_checkpoints,
+            trace_dir=trace_dir,
+            telemetry=telemetry,
+            car_contacts=car_contacts
         )
         self._cars.append(PlayerCar(
             max_velocity=max_velocity,
@@ -200,56 +330,66 @@ class OnePlayerController(Controller):
     def _draw(self, update: bool = True) -> None:
         super()._draw()
         if update:
-            pygame.display.update()
+            self._present()
 
     def _handle_idleness(self) -> None:
+        """ Blocks until a key is pressed (or the window closed), idling the CPU """
         pygame.event.clear()
         while True:
-            keydown = pygame.event.get(pygame.KEYDOWN)
-            should_quit = pygame.event.get(pygame.QUIT)
-            if should_quit:
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
                 self._run = False
                 break
-            if keydown:
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                pygame.display.update()
+            elif event.type == pygame.KEYDOWN:
                 self._state.start_level()
+                self._end_trace_segment()
                 for car in self._cars:
                     self._reset_car(car)
+                self._begin_trace_segment()
                 self._run = True
                 break
+        self._pacer.reset()  # the wait isn't a frame
 
     def _game_loop_step(self) -> bool:
         game_over = False
         next_level = False
         for car in filter(lambda _car: isinstance(_car, PlayerCar), self._cars):
-            self._player_controls(car)
+            self._record(car, self._player_controls(car))
         for car in self._cars:
             for checkpoint in self._map_meta.checkpoints:
                 if checkpoint.active:
                     if car.is_colliding(checkpoint.mask, checkpoint.rect.left, checkpoint.rect.top):
                         checkpoint.deactivate()
-            if car.is_colliding(self._map_meta.borders_mask):
+            if car.is_colliding_swept(self._map_meta.borders_mask):
                 car.alive = False
                 if isinstance(car, PlayerCar):
                     game_over = True
-            crossed_finish_line_poi = car.is_colliding(self._map_meta.finish_line_mask)
+            crossed_finish_line_poi = car.is_colliding_swept(self._map_meta.finish_line_mask)
             if crossed_finish_line_poi:
                 if crossed_finish_line_poi[1] > self._map_meta.finish_line_crossing_point:
                     car.bounce()
-                    print(crossed_finish_line_poi[1])
+                    self._event('wrong_way', y=crossed_finish_line_poi[1])
                 else:
                     if not isinstance(car, PlayerCar):
                         game_over = True
+                    self._event('finish', player=isinstance(car, PlayerCar))
                     next_level = True
                     self._state.next_level()
+        if self._contacts is not None:
+            self._contacts.resolve(self._cars)
         if next_level:
+            self._end_trace_segment()
             for car in self._cars:
                 self._reset_car(car)
+            self._begin_trace_segment()
 
         return game_over
 
     def run(self) -> None:
         while self._run:
-            self._clock.tick(self._fps)
+            self._tick()
             self._draw()
             # region game idle & stop
             if not self._state.level_started:
@@ -263,10 +403,12 @@ class OnePlayerController(Controller):
             game_over = self._game_loop_step()
             if game_over:
                 display_text(self._window, "You loser!", MAIN_FONT, (810, 0))
+                self._full_redraw = True
                 self._state.reset()
                 self._init_monit()
                 self._handle_idleness()
 
+        self._save_trace()
         pygame.quit()
 
 
@@ -280,7 +422,9 @@ class PlayerVersusAiController(OnePlayerController, ABC):
             max_levels: int = 5,
             draw_radars: bool = False,
             hardcore: bool = False,
-            draw_controls: bool = True
+            draw_controls: bool = True,
+            trace_dir: Optional[str] = None,
+            car_contacts: bool = False
     ):
         super().__init__(
             map_type=map_type,
@@ -289,13 +433,16 @@ class PlayerVersusAiController(OnePlayerController, ABC):
             max_acceleration=max_acceleration,
             max_levels=max_levels,
             draw_radars=draw_radars,
-            hardcore=hardcore
+            hardcore=hardcore,
+            trace_dir=trace_dir,
+            car_contacts=car_contacts
         )
         self._draw_controls = draw_controls
         self._ai_movements: List[CarMovement] = []
 
     def _handle_ai_movement(self, car: AiCar, movement: CarMovement) -> None:
         self._ai_movements = []
+        self._record(car, movement.value)
         if movement == CarMovement.LEFT:
             car.rotate(left=True)
             self._ai_movements.append(CarMovement.LEFT)
@@ -330,9 +477,9 @@ class PlayerVersusAiController(OnePlayerController, ABC):
     def _draw(self, update: bool = True) -> None:
         super()._draw(update=False)
         if self._draw_controls:
-            draw_ai_controls(self._window, self._ai_movements)
+            self._dirty.append(draw_ai_controls(self._window, self._ai_movements))
         if update:
-            pygame.display.update()
+            self._present()
 
 
 class PlayerVersusDqnController(PlayerVersusAiController):
@@ -346,7 +493,9 @@ class PlayerVersusDqnController(PlayerVersusAiController):
             max_levels: int = 5,
             draw_radars: bool = False,
             hardcore: bool = False,
-            draw_controls: bool = True
+            draw_controls: bool = True,
+            trace_dir: Optional[str] = None,
+            car_contacts: bool = False
     ):
         super().__init__(
             map_type=map_type,
@@ -356,7 +505,9 @@ class PlayerVersusDqnController(PlayerVersusAiController):
             max_levels=max_levels,
             draw_radars=draw_radars,
             hardcore=hardcore,
-            draw_controls=draw_controls
+            draw_controls=draw_controls,
+            trace_dir=trace_dir,
+            car_contacts=car_contacts
         )
         self._cars.append(AiCar(
             max_velocity=max_velocity,
@@ -380,22 +531,27 @@ class PlayerVersusDqnController(PlayerVersusAiController):
         self._env.reset()
 
     def load_dqn(self, path: str) -> DqnAgent:
+        from tf_agents.utils.common import Checkpointer
+        from ..ai import get_ann, get_agent, AsyncCheckpointer
+
         ann = get_ann(5, 9)
         agent = get_agent(ann, self._env.time_step_spec(), self._env.action_spec())
-        checkpointer = Checkpointer(
-            ckpt_dir=path,
-            agent=agent,
-            policy=agent.policy
-        )
-        checkpointer.initialize_or_restore()
+        if AsyncCheckpointer(path, agent).initialize_or_restore() is None:
+            # checkpoints saved by the tf-agents Checkpointer
+            checkpointer = Checkpointer(
+                ckpt_dir=path,
+                agent=agent,
+                policy=agent.policy
+            )
+            checkpointer.initialize_or_restore()
 
         return agent
 
-    def get_observation(self) -> List[float]:
+    def get_observation(self, out: Optional[MutableSequence[float]] = None) -> MutableSequence[float]:
         for ai_car in filter(lambda car: isinstance(car, AiCar), self._cars):
             ai_car: AiCar
 
-            return ai_car.radars_distances()
+            return ai_car.radars_distances(out)
 
     def _handle_ai_movement(self, car: AiCar, movement: CarMovement) -> None:
         if car.alive:
@@ -421,15 +577,16 @@ class PlayerVersusNeatController(PlayerVersusAiController):
     def __init__(
             self,
             map_type: MapType,
-            genome_path: str,
-            config: Config,
+            network_path: str,
             max_velocity: float = 10.,
             max_angular_velocity: float = 4.,
             max_acceleration: float = .15,
             max_levels: int = 5,
             draw_radars: bool = False,
             hardcore: bool = False,
-            draw_controls: bool = True
+            draw_controls: bool = True,
+            trace_dir: Optional[str] = None,
+            car_contacts: bool = False
     ):
         super().__init__(
             map_type=map_type,
@@ -439,9 +596,11 @@ class PlayerVersusNeatController(PlayerVersusAiController):
             max_levels=max_levels,
             draw_radars=draw_radars,
             hardcore=hardcore,
-            draw_controls=draw_controls
+            draw_controls=draw_controls,
+            trace_dir=trace_dir,
+            car_contacts=car_contacts
         )
-        self.__ann = self.__load_ann(genome_path, config)
+        self.__ann = CompactNetwork.load(network_path)
         self._cars.append(AiCar(
             max_velocity=max_velocity,
             rotation_velocity=max_angular_velocity,
@@ -462,9 +621,79 @@ class PlayerVersusNeatController(PlayerVersusAiController):
 
         return super()._game_loop_step()
 
-    @staticmethod
-    def __load_ann(genome_path: str, config: Config) -> FeedForwardNetwork:
-        with open(genome_path, 'rb') as fh:
-            genome = loads(fh.read())
 
-        return FeedForwardNetwork.create(genome, config)
+class PlayerVersusFieldController(PlayerVersusAiController):
+    """
+    Player races a whole field of AI opponents, each driven by its own NEAT network or DQN checkpoint.
+
+    Observations of all opponents are gathered into a single matrix, every model family is evaluated in one
+    batched forward pass and the movements are applied with batched physics. DQN checkpoints have to be written by
+    AsyncCheckpointer, as they're read with NumPy only.
+    """
+
+    def __init__(
+            self,
+            map_type: MapType,
+            network_paths: Sequence[str] = (),
+            dqn_checkpoints: Sequence[str] = (),
+            max_velocity: float = 10.,
+            max_angular_velocity: float = 4.,
+            max_acceleration: float = .15,
+            max_levels: int = 5,
+            draw_radars: bool = False,
+            hardcore: bool = False,
+            trace_dir: Optional[str] = None,
+            car_contacts: bool = False
+    ):
+        super().__init__(
+            map_type=map_type,
+            max_velocity=max_velocity,
+            max_angular_velocity=max_angular_velocity,
+            max_acceleration=max_acceleration,
+            max_levels=max_levels,
+            draw_radars=draw_radars,
+            hardcore=hardcore,
+            draw_controls=False,  # controls of a single car mean nothing in a field
+            trace_dir=trace_dir,
+            car_contacts=car_contacts
+        )
+        n_opponents = len(network_paths) + len(dqn_checkpoints)
+        if n_opponents == 0:
+            raise ValueError("Field needs at least one opponent")
+        self._opponents = [AiCar(
+            max_velocity=max_velocity,
+            rotation_velocity=max_angular_velocity,
+            track=self._map_meta.track,
+            start_position=self._map_meta.car_initial_pos,
+            start_angle=self._map_meta.car_initial_angle,
+            acceleration=max_acceleration,
+            use_threshold=False
+        ) for _ in range(n_opponents)]
+        for opponent in self._opponents:
+            opponent.convert_image()
+        self._cars.extend(self._opponents)
+        # (batched models, rows of the observation matrix they drive)
+        self._families: List[Tuple[Union[NetworkBatch, DenseBatch], slice]] = []
+        if network_paths:
+            networks = NetworkBatch([CompactNetwork.load(path) for path in network_paths])
+            self._families.append((networks, slice(0, len(network_paths))))
+        if dqn_checkpoints:
+            from ..ai.checkpoint import load_weights
+
+            q_networks = DenseBatch([load_weights(path) for path in dqn_checkpoints])
+            self._families.append((q_networks, slice(len(network_paths), n_opponents)))
+        self._observations = np.zeros((n_opponents, self._opponents[0].radar_config.rays), dtype=np.float32)
+        self._movements = np.zeros(n_opponents, dtype=np.intp)
+
+    def _game_loop_step(self) -> bool:
+        radars_distances_many(self._opponents, out=self._observations)
+        for models, rows in self._families:
+            self._movements[rows] = models.activate(self._observations[rows]).argmax(axis=-1)
+        movements = [CarMovement(movement) for movement in self._movements.tolist()]
+        if self._recorder is not None:
+            for opponent, movement in zip(self._opponents, movements):
+                if opponent.alive:  # dead cars are left untouched
+                    self._record(opponent, movement.value)
+        apply_movements(self._opponents, movements)
+
+        return super()._game_loop_step()
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
+import warnings
+
 from time import time
 from enum import Enum
-from typing import Union, Tuple, List
+from typing import Union, Tuple, List, Optional, Dict
 
 import pygame
 from pygame import Mask, Surface, Rect
 
 from .utils import get_mask, Point
+from .tracks import TrackBundle, load_track_bundle, builtin_bundle_path, source_digest
 from .assets import (
     CIRCLE_TRACK,
     FINISH_LINE_CIRCLE_TRACK,
@@ -44,11 +47,14 @@ class Checkpoint:
 
 
 class GameState:
-    def __init__(self, level: int = 1, max_levels: int = 5):
+    def __init__(self, level: int = 1, max_levels: int = 5, frame_time: Optional[float] = None):
+        """ frame_time - if given, level time is simulated (ticks * frame_time) instead of wall clock """
         self._level = level
         self._max_levels = max_levels
         self._started = False
         self._start_time = 0
+        self._frame_time = frame_time
+        self._ticks = 0
 
     @property
     def level_started(self) -> bool:
@@ -73,10 +79,16 @@ class GameState:
     def start_level(self) -> None:
         self._started = True
         self._start_time = time()
+        self._ticks = 0
+
+    def tick(self) -> None:
+        self._ticks += 1
 
     def level_time(self) -> Union[int, float]:
         if not self._started:
             return 0
+        if self._frame_time is not None:
+            return self._ticks * self._frame_time
         return time() - self._start_time
 
 
@@ -84,23 +96,61 @@ class MapType(Enum):
     CIRCLE = 0
     W_SHAPED = 1
     PWR = 2
+    CUSTOM = 3  # any compiled track, see MapMeta.from_bundle
 
 
 Position = Tuple[Point, Point]
+# source_digest of every built-in map, they're constant - hashing their images takes a while
+_BUILTIN_SOURCES: Dict[MapType, str] = {}
 
 
 class MapMeta:
-    def __init__(self, map_type: MapType):
+    def __init__(self, map_type: MapType, bundle: Optional[TrackBundle] = None):
+        """
+        Built-in maps come from their compiled bundles (tracks/<name>.track, see compile_track.py) if there are any
+        up to date, otherwise from their images
+        """
+        if bundle is None and map_type == MapType.CUSTOM:
+            raise ValueError("Custom tracks are loaded from their bundles, see MapMeta.from_bundle")
         self._map_type = map_type
-        self._track, self._finish_line = self._load_assets()
-        self._car_initial_pos, self._car_initial_angle = self._get_positions()
-        self._finish_line_crossing_point = self._get_crossing_point()
-        self._checkpoints = self._get_checkpoints()
+        if bundle is None and map_type != MapType.CUSTOM:
+            bundle = self._load_builtin_bundle()
+        self._bundle = bundle
+        if bundle is None:
+            self._track, self._finish_line = self._load_assets()
+            self._car_initial_pos, self._car_initial_angle = self._get_positions()
+            self._finish_line_crossing_point = self._get_crossing_point()
+            self._checkpoints = self._get_checkpoints()
+        else:
+            self._track, self._finish_line = bundle.track, bundle.finish_line
+            self._car_initial_pos, self._car_initial_angle = bundle.start_position, bundle.start_angle
+            self._finish_line_crossing_point = bundle.crossing_point
+            self._checkpoints = [Checkpoint(rect) for rect in bundle.checkpoints]
+        # masks are checked by every car on every tick, so they're built once
+        self._track_mask = get_mask(self._track)
+        self._borders_mask = get_mask(self._track, inverted=True)
+        self._finish_line_mask = get_mask(self._finish_line)
+
+    @classmethod
+    def from_bundle(cls, path: str) -> MapMeta:
+        """ Bundles of built-in maps keep their map type, any other track is MapType.CUSTOM """
+        bundle = load_track_bundle(path)
+        map_type = MapType.__members__.get(bundle.name.upper(), MapType.CUSTOM)
+
+        return cls(map_type, bundle)
 
     @property
     def map_type(self) -> MapType:
         return self._map_type
 
+    @property
+    def name(self) -> str:
+        return self._bundle.name if self._map_type == MapType.CUSTOM else self._map_type.name
+
+    @property
+    def bundle(self) -> Optional[TrackBundle]:
+        return self._bundle
+
     @property
     def track(self) -> Surface:
         return self._track
@@ -115,15 +165,15 @@ class MapMeta:
 
     @property
     def track_mask(self) -> Mask:
-        return get_mask(self._track)
+        return self._track_mask
 
     @property
     def borders_mask(self) -> Mask:
-        return get_mask(self._track, inverted=True)
+        return self._borders_mask
 
     @property
     def finish_line_mask(self) -> Mask:
-        return get_mask(self._finish_line)
+        return self._finish_line_mask
 
     @property
     def finish_line_crossing_point(self) -> int:
@@ -137,6 +187,30 @@ class MapMeta:
     def car_initial_angle(self) -> int:
         return self._car_initial_angle
 
+    def _load_builtin_bundle(self) -> Optional[TrackBundle]:
+        """ None if there's no bundle, or it was compiled from other images or metadata than the current ones """
+        path = builtin_bundle_path(self._map_type.name)
+        if not path.exists():
+            return None
+        try:
+            bundle = load_track_bundle(path)
+        except ValueError as e:
+            warnings.warn(f"{path} can't be used ({e}), recompile it with compile_track.py")
+            return None
+        source = _BUILTIN_SOURCES.get(self._map_type)
+        if source is None:
+            track, finish_line = self._load_assets()
+            position, angle = self._get_positions()
+            checkpoints = [checkpoint.rect for checkpoint in self._get_checkpoints()]
+            source = _BUILTIN_SOURCES[self._map_type] = source_digest(
+                track, finish_line, self._map_type.name, position, angle, self._get_crossing_point(), checkpoints
+            )
+        if bundle.source != source:
+            warnings.warn(f"{path} is outdated, the map is loaded from its images - recompile it with compile_track.py")
+            return None
+
+        return bundle
+
     def _load_assets(self) -> Tuple[Surface, Surface]:
         """ Returns (track, finish_line) """
 
@@ -0,0 +1,235 @@
+from __future__ import annotations
+from struct import Struct
+from typing import Sequence, List, Tuple, Dict, Callable
+
+import numpy as np
+
+
+MAGIC = b"ARNN"
+VERSION = 1
+ACTIVATIONS = ('identity', 'sigmoid', 'tanh', 'relu', 'clamped', 'abs', 'sin', 'gauss')
+# same definitions as neat.activations
+_ACTIVATION_FUNCTIONS: Dict[int, Callable[[np.ndarray], np.ndarray]] = {
+    0: lambda z: z,
+    1: lambda z: 1. / (1. + np.exp(-np.clip(5. * z, -60., 60.))),
+    2: lambda z: np.tanh(np.clip(2.5 * z, -60., 60.)),
+    3: lambda z: np.maximum(z, 0.),
+    4: lambda z: np.clip(z, -1., 1.),
+    5: np.abs,
+    6: lambda z: np.sin(np.clip(5. * z, -60., 60.)),
+    7: lambda z: np.exp(-5. * np.clip(z, -3.4, 3.4) ** 2)
+}
+# magic, version, inputs, outputs, levels, nodes, connections
+_HEADER = Struct("<4sHHHHII")
+
+
+class CompactNetwork:
+    """
+    Pruned feed-forward network, evaluated with NumPy only.
+
+    Value vector holds inputs followed by nodes (sorted by topological level) and a constant zero slot for
+    outputs which aren't expressed. Incoming connections of node j are sources/weights[indptr[j]:indptr[j + 1]].
+    """
+
+    def __init__(
+            self,
+            n_inputs: int,
+            outputs: Sequence[int],
+            level_ptr: Sequence[int],
+            activations: Sequence[int],
+            biases: Sequence[float],
+            responses: Sequence[float],
+            indptr: Sequence[int],
+            sources: Sequence[int],
+            weights: Sequence[float]
+    ):
+        self._n_inputs = n_inputs
+        self._outputs = np.asarray(outputs, dtype=np.int32)
+        self._level_ptr = np.asarray(level_ptr, dtype=np.uint32)
+        self._activations = np.asarray(activations, dtype=np.uint8)
+        self._biases = np.asarray(biases, dtype=np.float32)
+        self._responses = np.asarray(responses, dtype=np.float32)
+        self._indptr = np.asarray(indptr, dtype=np.uint32)
+        self._sources = np.asarray(sources, dtype=np.uint32)
+        self._weights = np.asarray(weights, dtype=np.float32)
+        n_nodes = len(self._activations)
+        self._zero_slot = n_inputs + n_nodes
+        self._values = np.zeros(self._zero_slot + 1)
+        self._output_slots = np.where(self._outputs < 0, self._zero_slot, self._outputs)
+        self._levels = self._plan_levels()
+
+    @property
+    def n_inputs(self) -> int:
+        return self._n_inputs
+
+    @property
+    def n_outputs(self) -> int:
+        return len(self._outputs)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self._activations)
+
+    def activate(self, inputs: Sequence[float]) -> np.ndarray:
+        if len(inputs) != self._n_inputs:
+            raise RuntimeError(f"Expected {self._n_inputs} inputs, got {len(inputs)}")
+        values = self._values
+        values[:self._n_inputs] = inputs
+        for first, sources, weights, segments, n_segments, bias, response, groups in self._levels:
+            sums = np.bincount(segments, weights=values[sources] * weights, minlength=n_segments)
+            z = bias + response * sums
+            for code, index in groups:
+                values[first + index] = _ACTIVATION_FUNCTIONS[code](z[index])
+
+        return values[self._output_slots]
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(
+            MAGIC, VERSION, self._n_inputs, len(self._outputs), len(self._level_ptr) - 1,
+            len(self._activations), len(self._sources)
+        )
+        arrays = (
+            self._level_ptr, self._activations, self._biases, self._responses,
+            self._indptr, self._sources, self._weights, self._outputs
+        )
+
+        return header + b"".join(array.astype(array.dtype.newbyteorder('<')).tobytes() for array in arrays)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> CompactNetwork:
+        magic, version, n_inputs, n_outputs, n_levels, n_nodes, n_connections = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a compact network file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported compact network version {version}, expected {VERSION}")
+        offset = _HEADER.size
+        arrays = []
+        for dtype, count in (
+                ('<u4', n_levels + 1), ('u1', n_nodes), ('<f4', n_nodes), ('<f4', n_nodes),
+                ('<u4', n_nodes + 1), ('<u4', n_connections), ('<f4', n_connections), ('<i4', n_outputs)
+        ):
+            array = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            arrays.append(array)
+            offset += array.nbytes
+        level_ptr, activations, biases, responses, indptr, sources, weights, outputs = arrays
+
+        return cls(n_inputs, outputs, level_ptr, activations, biases, responses, indptr, sources, weights)
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as fh:
+            fh.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> CompactNetwork:
+        with open(path, 'rb') as fh:
+            return cls.from_bytes(fh.read())
+
+    def _plan_levels(self) -> List[Tuple]:
+        """ Precomputes gather indices of every level, so that activation is a few vectorized calls per level """
+        levels = []
+        biases = self._biases.astype(np.float64)
+        responses = self._responses.astype(np.float64)
+        weights = self._weights.astype(np.float64)
+        sources = self._sources.astype(np.intp)
+        for level in range(len(self._level_ptr) - 1):
+            start, end = int(self._level_ptr[level]), int(self._level_ptr[level + 1])
+            c_start, c_end = int(self._indptr[start]), int(self._indptr[end])
+            segments = np.repeat(np.arange(end - start), np.diff(self._indptr[start:end + 1]).astype(np.intp))
+            codes = self._activations[start:end]
+            groups = [(int(code), np.flatnonzero(codes == code)) for code in np.unique(codes)]
+            levels.append((
+                self._n_inputs + start, sources[c_start:c_end], weights[c_start:c_end], segments, end - start,
+                biases[start:end], responses[start:end], groups
+            ))
+
+        return levels
+
+
+class NetworkBatch:
+    """
+    Many CompactNetworks (of any topologies) merged into one graph, so that a single vectorized pass per level
+    activates all of them. Networks must share the number of inputs & outputs.
+    """
+
+    def __init__(self, networks: Sequence[CompactNetwork]):
+        if len({(network.n_inputs, network.n_outputs) for network in networks}) != 1:
+            raise ValueError("Networks in a batch must have the same number of inputs and outputs")
+        self._size = len(networks)
+        self._n_inputs = networks[0].n_inputs
+        self._n_outputs = networks[0].n_outputs
+        input_slots, output_slots, levels, offset = [], [], {}, 0
+        for network in networks:
+            input_slots.append(offset + np.arange(network.n_inputs))
+            output_slots.append(offset + network._output_slots)
+            for level, (first, sources, weights, segments, n_segments, bias, response, groups) in \
+                    enumerate(network._levels):
+                levels.setdefault(level, []).append((
+                    offset + first + np.arange(n_segments), offset + sources, weights, segments, bias, response,
+                    network._activations[first - network.n_inputs:first - network.n_inputs + n_segments]
+                ))
+            offset += len(network._values)
+        self._values = np.zeros(offset)
+        self._input_slots = np.concatenate(input_slots)
+        self._output_slots = np.stack(output_slots)
+        self._levels = []
+        for level in sorted(levels):
+            parts = levels[level]
+            segment_offsets = np.cumsum([0] + [len(part[0]) for part in parts[:-1]])
+            codes = np.concatenate([part[6] for part in parts])
+            self._levels.append((
+                np.concatenate([part[0] for part in parts]),
+                np.concatenate([part[1] for part in parts]),
+                np.concatenate([part[2] for part in parts]),
+                np.concatenate([part[3] + segment_offset for part, segment_offset in zip(parts, segment_offsets)]),
+                len(codes),
+                np.concatenate([part[4] for part in parts]),
+                np.concatenate([part[5] for part in parts]),
+                [(int(code), np.flatnonzero(codes == code)) for code in np.unique(codes)]
+            ))
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def activate(self, inputs: np.ndarray) -> np.ndarray:
+        """ inputs (networks, n_inputs) -> outputs (networks, n_outputs) """
+        values = self._values
+        values[self._input_slots] = np.asarray(inputs).reshape(-1)
+        for slots, sources, weights, segments, n_segments, bias, response, groups in self._levels:
+            sums = np.bincount(segments, weights=values[sources] * weights, minlength=n_segments)
+            z = bias + response * sums
+            for code, index in groups:
+                values[slots[index]] = _ACTIVATION_FUNCTIONS[code](z[index])
+
+        return values[self._output_slots]
+
+
+class DenseBatch:
+    """
+    Many dense networks of the same architecture but different weights (e.g. DQN q-networks of several
+    checkpoints), evaluated together with batched matrix products.
+    """
+
+    def __init__(
+            self,
+            weights: Sequence[Sequence[np.ndarray]],
+            activations: Sequence[str] = ('relu', 'relu', 'linear')
+    ):
+        """ weights - per network [kernel_1, bias_1, kernel_2, bias_2, ...], as returned by keras get_weights """
+        self._kernels = [np.stack([w[2 * i] for w in weights]).astype(np.float32) for i in range(len(activations))]
+        self._biases = [np.stack([w[2 * i + 1] for w in weights]).astype(np.float32) for i in range(len(activations))]
+        self._activations = tuple(activations)
+
+    @property
+    def size(self) -> int:
+        return len(self._kernels[0])
+
+    def activate(self, inputs: np.ndarray) -> np.ndarray:
+        """ inputs (networks, n_inputs) -> outputs (networks, n_outputs) """
+        x = np.asarray(inputs, dtype=np.float32)
+        for kernel, bias, activation in zip(self._kernels, self._biases, self._activations):
+            x = np.einsum('ni,nio->no', x, kernel) + bias
+            if activation == 'relu':
+                x = np.maximum(x, 0)
+
+        return x
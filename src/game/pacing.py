@@ -0,0 +1,82 @@
+from collections import deque
+from time import perf_counter, sleep
+from typing import Optional, Deque
+
+import numpy as np
+
+
+class FramePacer:
+    """
+    Paces frames to a fixed rate against absolute deadlines, so that oversleeping a frame doesn't delay the next ones.
+    Sleeps until shortly before the deadline and spins the rest of it - the OS wakes sleepers up to a few
+    milliseconds late, which would show as stutter. A frame running late by more than a whole frame resyncs the
+    deadlines instead of rushing through the missed ones.
+
+    Frame times (between consecutive ticks) of the last window frames are measured, see jitter.
+
+    spin - seconds before the deadline to stop sleeping at
+    """
+
+    def __init__(self, fps: int, spin: float = .002, window: int = 120):
+        if fps < 1:
+            raise ValueError("FPS must be positive")
+        self._period = 1 / fps
+        self._spin = spin
+        self._frame_times: Deque[float] = deque(maxlen=window)
+        self._deadline: Optional[float] = None
+        self._last: Optional[float] = None
+        self._frames = 0
+        self._late_frames = 0
+
+    @property
+    def fps(self) -> float:
+        return 1 / self._period
+
+    @property
+    def frames(self) -> int:
+        """ Frames paced since creation """
+        return self._frames
+
+    @property
+    def late_frames(self) -> int:
+        """ Frames which missed their deadline by more than a whole frame """
+        return self._late_frames
+
+    @property
+    def frame_times(self) -> np.ndarray:
+        """ Seconds between the last window ticks """
+        return np.array(self._frame_times)
+
+    @property
+    def jitter(self) -> float:
+        """ Standard deviation of frame times, in seconds """
+        return float(np.std(self._frame_times)) if self._frame_times else 0.
+
+    def reset(self) -> None:
+        """ Call after the loop was paused (e.g. waiting for a key), so that the pause isn't measured nor caught up """
+        self._deadline = None
+        self._last = None
+
+    def tick(self) -> float:
+        """ Waits for the current frame's deadline, returns seconds since the previous tick (0 after reset) """
+        now = perf_counter()
+        if self._deadline is None:
+            self._deadline = now
+        else:
+            remaining = self._deadline - now
+            if remaining > self._spin:
+                sleep(remaining - self._spin)
+            while perf_counter() < self._deadline:
+                pass
+            now = perf_counter()
+        frame_time = 0. if self._last is None else now - self._last
+        if self._last is not None:
+            self._frame_times.append(frame_time)
+        self._last = now
+        self._frames += 1
+        if now - self._deadline > self._period:  # this frame's deadline, before it moves on to the next frame's
+            self._late_frames += 1
+            self._deadline = now
+        self._deadline += self._period
+
+        return frame_time
@@ -0,0 +1,83 @@
+from math import radians, cos, sin
+from typing import Sequence
+
+import numpy as np
+
+from .cars import Car, AiCar
+from .controls import CarMovement
+
+# per CarMovement value: rotation (1 left, -1 right), throttle (1 accelerate, -1 decelerate, 0 inertia), moves
+_ROTATION = np.array([1, 1, 0, -1, -1, 0, 1, -1, 0])
+_THROTTLE = np.array([0, 1, 1, 1, 0, -1, -1, -1, 0])
+_MOVES = np.array([False, True, True, True, False, True, True, True, True])
+# player's keys, as bits of a single byte
+KEY_LEFT = 1
+KEY_RIGHT = 2
+KEY_UP = 4
+KEY_DOWN = 8
+
+
+def apply_keys(car: Car, keys: int) -> None:
+    """ Applies player's pressed keys (KEY_* bits) """
+    if keys & KEY_LEFT:
+        car.rotate(left=True)
+    if keys & KEY_RIGHT:
+        car.rotate(left=False)
+    if keys & KEY_UP:
+        car.accelerate()
+    if keys & KEY_DOWN:
+        car.decelerate()
+    if not keys & (KEY_UP | KEY_DOWN):
+        car.inertia()
+
+
+def apply_movement(car: Car, movement: CarMovement) -> None:
+    """ Applies single movement the way every controller does """
+    if movement in (CarMovement.LEFT, CarMovement.LEFT_UP, CarMovement.LEFT_SLOW_DOWN):
+        car.rotate(left=True)
+    elif movement in (CarMovement.RIGHT, CarMovement.RIGHT_UP, CarMovement.RIGHT_SLOW_DOWN):
+        car.rotate(left=False)
+    if movement in (CarMovement.LEFT_UP, CarMovement.UP, CarMovement.RIGHT_UP):
+        car.accelerate()
+    elif movement in (CarMovement.SLOW_DOWN, CarMovement.LEFT_SLOW_DOWN, CarMovement.RIGHT_SLOW_DOWN):
+        car.decelerate()
+    elif movement == CarMovement.NOTHING:
+        car.inertia()
+
+
+def apply_movements(cars: Sequence[Car], movements: Sequence[CarMovement]) -> None:
+    """
+    Batched apply_movement - kinematics of all alive cars are updated at once, with the same arithmetic as
+    Car's methods. Cars with movement threshold (stagnation) are handled one by one, dead cars are left untouched.
+    """
+    batch = []
+    for car, movement in zip(cars, movements):
+        if not car.alive:
+            continue
+        if isinstance(car, AiCar) and car.use_threshold:
+            apply_movement(car, movement)
+        else:
+            batch.append((car, movement.value))
+    if not batch:
+        return
+    codes = np.array([code for _, code in batch])
+    rotation = _ROTATION[codes]
+    throttle = _THROTTLE[codes]
+    moves = _MOVES[codes]
+    angle = np.array([car.angle for car, _ in batch]) + rotation * np.array([car.rotation_velocity for car, _ in batch])
+    velocity = np.array([car.velocity for car, _ in batch])
+    acceleration = np.array([car.acceleration for car, _ in batch])
+    max_velocity = np.array([car.max_velocity for car, _ in batch])
+    velocity = np.where(
+        throttle > 0, np.minimum(velocity + acceleration, max_velocity), np.where(
+            throttle < 0, np.maximum(velocity - 1.85 * acceleration, 0), np.maximum(velocity - acceleration / 2, 0)
+        )
+    )
+    velocity = np.where(moves, velocity, [car.velocity for car, _ in batch])
+    rad = [radians(a) for a in angle.tolist()]
+    dx = np.array([cos(r) for r in rad]) * velocity  # math, not np, trigonometry - bit-identical to Car.move
+    dy = np.array([sin(r) for r in rad]) * velocity
+    x = np.array([car.x for car, _ in batch]) + np.where(moves, dx, 0)
+    y = np.array([car.y for car, _ in batch]) - np.where(moves, dy, 0)
+    for (car, _), *kinematics in zip(batch, x.tolist(), y.tolist(), angle.tolist(), velocity.tolist()):
+        car.set_kinematics(*kinematics)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+from math import radians, cos, sin, floor
+from pathlib import Path
+from time import perf_counter
+from typing import Tuple, List, Sequence, Union, Optional
+
+import numpy as np
+from pygame import Surface
+
+from .meta import MapMeta, MapType
+from .sensors import RadarConfig, RadarSuite, DEFAULT_RADARS, install_radar_suite
+from .tracks import write_arrays, map_arrays, TRACKS_DIR
+from .utils import Point, get_track_array
+
+MAGIC = b"ARAD"
+VERSION = 1
+SUFFIX = ".radars"
+
+
+def _map_meta(map_type: Union[MapType, str]) -> MapMeta:
+    return MapMeta.from_bundle(map_type) if isinstance(map_type, str) else MapMeta(map_type)
+
+
+def build_radar_table(
+        map_type: Union[MapType, str],
+        path: Union[str, Path],
+        config: RadarConfig = DEFAULT_RADARS,
+        position_step: int = 2,
+        angle_step: float = 3.,
+        verbose: bool = True
+) -> RadarTable:
+    """
+    Marches a ray in every direction (angle_step apart) from every drivable position (position_step apart),
+    exactly as config's radar suite would, and writes ray lengths as a memory-mappable table.
+    A one-off offline job - lookups are then answered for any angles of radars of the same range & steps.
+
+    map_type - a built-in map or path of a compiled track bundle
+    """
+    if (360 / angle_step) % 1:
+        raise ValueError("angle_step must divide the full angle")
+    meta = _map_meta(map_type)
+    on_track = get_track_array(meta.track)
+    height, width = on_track.shape
+    ys, xs = np.nonzero(on_track[::position_step, ::position_step])
+    centers = np.stack((xs, ys), axis=1) * position_step
+    directions = round(360 / angle_step)
+    dtype = np.uint8 if config.max_range <= np.iinfo(np.uint8).max else np.uint16
+    lengths = np.zeros((directions, -(-height // position_step), -(-width // position_step)), dtype=dtype)
+    ray = RadarSuite(RadarConfig((0,), config.max_range, config.step, config.coarse_step, None), meta.track)
+    start = perf_counter()
+    for direction in range(directions):
+        ray_lengths, _ = ray.sweep_many(centers, np.full(len(centers), direction * angle_step))
+        lengths[direction, ys, xs] = ray_lengths[:, 0]
+        if verbose and (direction + 1) % 10 == 0:
+            print(f"{direction + 1}/{directions} directions, {perf_counter() - start:.0f}s")
+    metadata = {
+        'map': map_type if isinstance(map_type, str) else map_type.name,
+        'max_range': config.max_range,
+        'step': config.step,
+        'coarse_step': config.coarse_step,
+        'position_step': position_step,
+        'angle_step': angle_step
+    }
+    write_arrays(Path(path), MAGIC, VERSION, metadata, {'lengths': lengths})
+
+    return load_radar_table(path, config)
+
+
+def load_radar_table(path: Union[str, Path], config: RadarConfig = DEFAULT_RADARS) -> RadarTable:
+    """ config must have the same range & marching steps as the table was built for, its angles may differ """
+    metadata, arrays = map_arrays(Path(path), MAGIC, VERSION)
+    if (metadata['max_range'], metadata['step'], metadata['coarse_step']) != \
+            (config.max_range, config.step, config.coarse_step):
+        raise ValueError("Radar table was built for radars of another range or marching steps")
+    map_name = metadata['map']
+    map_type = MapType[map_name] if map_name in MapType.__members__ else map_name
+
+    return RadarTable(
+        config, _map_meta(map_type).track, arrays['lengths'], metadata['position_step'], metadata['angle_step']
+    )
+
+
+class RadarTable:
+    """
+    Drop-in for a RadarSuite - radars are looked up in a precomputed table instead of being marched.
+
+    Car's centre is snapped to the nearest table position, the ray's length is corrected by the snap's offset along
+    the ray and interpolated between the two nearest table directions. Lengths are thus approximate (within a couple
+    of pixels along straight borders), so the table is an opt-in, see use_radar_table.
+    Cars whose nearest table position is off the track (the table has no rays there) are marched instead.
+    """
+
+    def __init__(
+            self,
+            config: RadarConfig,
+            track: Surface,
+            lengths: np.ndarray,
+            position_step: int,
+            angle_step: float
+    ):
+        self._config = config
+        self._track = track
+        self._on_track = get_track_array(track)
+        self._height, self._width = self._on_track.shape
+        self._lengths = lengths
+        self._position_step = position_step
+        self._angle_step = angle_step
+        self._offsets = np.asarray(config.angles, dtype=np.float64)
+        self._suite: Optional[RadarSuite] = None
+
+    @property
+    def config(self) -> RadarConfig:
+        return self._config
+
+    @property
+    def track(self) -> Surface:
+        return self._track
+
+    def sweep(self, center: Point, heading: float) -> List[Tuple[int, Point]]:
+        """ The same as sweep_many of a single car, without NumPy's per-call overhead """
+        cx, cy = int(center[0]), int(center[1])
+        if not (0 <= cx < self._width and 0 <= cy < self._height and self._on_track[cy, cx]):
+            return [(0, (cx, cy)) for _ in self._config.angles]
+        directions, rows, columns = self._lengths.shape
+        step = self._position_step
+        column = min(max((cx + step // 2) // step, 0), columns - 1)
+        row = min(max((cy + step // 2) // step, 0), rows - 1)
+        if not self._on_track[row * step, column * step]:
+            return self._marching_suite().sweep(center, heading)
+        offset_x, offset_y = cx - column * step, cy - row * step
+        table = self._lengths[:, row, column].tolist()
+        max_range = self._config.max_range
+        radars = []
+        for angle in self._config.angles:
+            angle += heading
+            position = (angle % 360) / self._angle_step
+            lower = floor(position)
+            weight = position - lower
+            length = 0.
+            for direction, direction_weight in ((lower, 1 - weight), (lower + 1, weight)):
+                rad = radians(direction * self._angle_step)
+                looked_up = table[direction % directions]
+                length += direction_weight * (looked_up - (offset_x * cos(rad) - offset_y * sin(rad)))
+            length = int(min(max(round(length), 0), max_range))
+            rad = radians(angle)
+            radars.append((length, (int(cx + cos(rad) * length), int(cy - sin(rad) * length))))
+
+        return radars
+
+    def sweep_many(self, centers: Sequence[Point], headings: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns radars' lengths (cars, rays) and terminal points (cars, rays, 2), like RadarSuite.sweep_many """
+        centers = np.asarray(centers, dtype=np.int64).reshape(-1, 2)
+        cx, cy = centers[:, :1], centers[:, 1:]
+        directions, rows, columns = self._lengths.shape
+        step = self._position_step
+        column = np.clip((cx + step // 2) // step, 0, columns - 1)
+        row = np.clip((cy + step // 2) // step, 0, rows - 1)
+        offset_x, offset_y = cx - column * step, cy - row * step
+        angles = np.asarray(headings, dtype=np.float64)[:, None] + self._offsets
+        position = np.mod(angles, 360) / self._angle_step
+        lower = np.floor(position)
+        weight = position - lower
+        lengths = np.zeros(angles.shape, dtype=np.float64)
+        for direction, direction_weight in ((lower, 1 - weight), (lower + 1, weight)):
+            rad = np.radians(direction * self._angle_step)
+            looked_up = self._lengths[direction.astype(np.int64) % directions, row, column]
+            # the snap moved the ray's origin, by its projection along the ray (y axis points down)
+            lengths += direction_weight * (looked_up - (offset_x * np.cos(rad) - offset_y * np.sin(rad)))
+        max_range = self._config.max_range
+        inside = (cx >= 0) & (cx < self._width) & (cy >= 0) & (cy < self._height)
+        on_track = np.zeros(inside.shape, dtype=bool)
+        on_track[inside] = self._on_track[cy[inside], cx[inside]]
+        lengths = np.where(on_track, np.clip(np.rint(lengths), 0, max_range), 0).astype(np.int64)
+        rad = np.radians(angles)
+        points = np.stack([
+            (cx + np.cos(rad) * lengths).astype(np.int64),
+            (cy - np.sin(rad) * lengths).astype(np.int64)
+        ], axis=-1)
+        marched = np.nonzero(on_track[:, 0] & ~self._on_track[row[:, 0] * step, column[:, 0] * step])[0]
+        if marched.size:
+            lengths[marched], points[marched] = self._marching_suite().sweep_many(
+                centers[marched], np.asarray(headings, dtype=np.float64)[marched]
+            )
+
+        return lengths, points
+
+    def _marching_suite(self) -> RadarSuite:
+        """ Built on first use - most tables never need it, and it takes the track's clearance field """
+        if self._suite is None:
+            self._suite = RadarSuite(self._config, self._track)
+
+        return self._suite
+
+
+def use_radar_table(table: RadarTable) -> None:
+    """ Cars created from now on with table's radar config & track get their radars from the table """
+    install_radar_suite(table)
+
+
+def builtin_radar_table_path(map_type: MapType) -> Path:
+    return TRACKS_DIR / f"{map_type.name.lower()}{SUFFIX}"
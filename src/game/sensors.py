@@ -0,0 +1,294 @@
+from __future__ import annotations
+from math import radians, cos, sin, ceil
+from typing import Tuple, List, Sequence, Optional, Dict
+
+import numpy as np
+from pygame import Surface
+
+from .tracks import get_clearance_field
+from .utils import Point, get_track_array
+
+
+class RadarConfig:
+    """
+    Layout of the radar suite.
+
+    angles - ray angles relative to car's heading
+    max_range - ray's length in pixels
+    step - marching resolution in pixels
+    coarse_step - rays are first marched with this step, then refined with step (coarse-to-fine)
+    corrections - subtracted from the measured distance of each ray
+    """
+
+    def __init__(
+            self,
+            angles: Sequence[float] = (-60, -30, 0, 30, 60),
+            max_range: int = 200,
+            step: int = 1,
+            coarse_step: int = 1,
+            corrections: Optional[Sequence[float]] = (0, 45, 45, 45, 0)  # -30, 0, 30 degrees radars need adjusting
+    ):
+        if corrections is None:
+            corrections = (0,) * len(angles)
+        if len(corrections) != len(angles):
+            raise ValueError("Every radar needs its own correction")
+        if step < 1 or coarse_step < 1:
+            raise ValueError("Marching steps must be positive")
+        self._angles = tuple(angles)
+        self._max_range = max_range
+        self._step = step
+        self._coarse_step = coarse_step
+        self._corrections = tuple(corrections)
+
+    @classmethod
+    def evenly_spaced(
+            cls,
+            rays: int,
+            spread: float = 120.,
+            max_range: int = 200,
+            step: int = 1,
+            coarse_step: int = 1
+    ) -> RadarConfig:
+        """
+        Rays spread evenly over [-spread / 2, spread / 2] degrees. A coarse_step above 1 is faster, but rays may
+        step over borders thinner than it
+        """
+        if rays == 1:
+            angles = [0.]
+        else:
+            angles = [-spread / 2 + i * spread / (rays - 1) for i in range(rays)]
+
+        return cls(angles, max_range, step, coarse_step, corrections=None)
+
+    @property
+    def angles(self) -> Tuple[float, ...]:
+        return self._angles
+
+    @property
+    def rays(self) -> int:
+        return len(self._angles)
+
+    @property
+    def max_range(self) -> int:
+        return self._max_range
+
+    @property
+    def step(self) -> int:
+        return self._step
+
+    @property
+    def coarse_step(self) -> int:
+        return self._coarse_step
+
+    @property
+    def corrections(self) -> Tuple[float, ...]:
+        return self._corrections
+
+
+DEFAULT_RADARS = RadarConfig()
+# a sample nearer to an on-track sample than its clearance is on track too - less this margin, which covers
+# truncation of both samples' coordinates to whole pixels (under 2 pixels per axis) & clearance's float32 rounding
+_CLEARANCE_MARGIN = 3.
+# sweeps of this many rays skip certain samples too, smaller ones (or coarse-to-fine) are faster sampled whole
+_CERTAIN_RAYS = 1000
+_WINDOW = 16  # samples tested at once past the certain ones, by sweeps of many rays
+_SUITES: Dict[Tuple[int, int], RadarSuite] = {}
+
+
+def get_radar_suite(config: RadarConfig, track: Surface) -> RadarSuite:
+    """ Suites are stateless, so cars of the same layout & track share a single one """
+    suite = _SUITES.get((id(config), id(track)))
+    if suite is None or suite.config is not config or suite.track is not track:
+        suite = _SUITES[(id(config), id(track))] = RadarSuite(config, track)
+
+    return suite
+
+
+def install_radar_suite(suite) -> None:
+    """ Replaces the suite of suite's config & track, e.g. by a RadarTable, for cars created from now on """
+    _SUITES[(id(suite.config), id(suite.track))] = suite
+
+
+class RadarSuite:
+    """
+    Marches radar rays over the track until they leave it.
+
+    Rays skip samples which the track's clearance field proves to be on track - a sample within an on-track sample's
+    clearance can't be off the track - so only the few samples near the hit are tested one by one. Lengths are
+    exactly those of testing every sample, whatever the previous tick's rays were, hence teleports need no care.
+    """
+
+    def __init__(self, config: RadarConfig, track: Surface):
+        self._config = config
+        self._track = track
+        self._on_track = get_track_array(track)
+        self._clearance = get_clearance_field(track)
+        self._height, self._width = self._on_track.shape
+        if config.coarse_step > config.step:
+            self._steps = (config.coarse_step, config.step)
+        else:
+            self._steps = (config.step,)
+
+    @property
+    def config(self) -> RadarConfig:
+        return self._config
+
+    @property
+    def track(self) -> Surface:
+        return self._track
+
+    def sweep(self, center: Point, heading: float) -> List[Tuple[int, Point]]:
+        """ Returns radar's length & terminal point of every ray """
+        return [self._march(center, heading + angle) for angle in self._config.angles]
+
+    def sweep_many(self, centers: Sequence[Point], headings: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized sweep of many cars, identical to sweep of each one.
+        Returns radars' lengths (cars, rays) and terminal points (cars, rays, 2)
+        """
+        rays = self._config.rays
+        rad = [radians(heading + angle) for heading in headings for angle in self._config.angles]
+        dx = np.array([cos(r) for r in rad])  # math, not np, trigonometry - bit-identical to sweep
+        dy = np.array([sin(r) for r in rad])
+        centers = np.asarray(centers, dtype=np.int64).reshape(-1, 2)
+        cx = np.repeat(centers[:, 0], rays).astype(np.float64)
+        cy = np.repeat(centers[:, 1], rays).astype(np.float64)
+        max_range = self._config.max_range
+        on_track = self._are_on_track(cx.astype(np.int64), cy.astype(np.int64))
+        if len(rad) >= _CERTAIN_RAYS and len(self._steps) == 1:
+            lengths = self._march_certain_many(cx, cy, dx, dy, on_track)
+        else:
+            lengths = self._march_sampled_many(cx, cy, dx, dy, on_track)
+        hit = on_track & (lengths < max_range)
+        lengths[hit] = np.minimum(lengths[hit] + self._config.step, max_range)
+        points = np.stack([(cx + dx * lengths).astype(np.int64), (cy - dy * lengths).astype(np.int64)], axis=-1)
+
+        return lengths.reshape(-1, rays), points.reshape(-1, rays, 2)
+
+    def _march_sampled_many(
+            self,
+            cx: np.ndarray,
+            cy: np.ndarray,
+            dx: np.ndarray,
+            dy: np.ndarray,
+            on_track: np.ndarray
+    ) -> np.ndarray:
+        max_range = self._config.max_range
+        # first pass samples whole rays at once, the furthest length is the one before the first sample off track
+        first_step = self._steps[0]
+        candidates = np.minimum(np.arange(first_step, max_range + first_step, first_step), max_range)
+        free = self._are_on_track(
+            (cx[:, None] + dx[:, None] * candidates).astype(np.int64).ravel(),
+            (cy[:, None] - dy[:, None] * candidates).astype(np.int64).ravel()
+        ).reshape(len(cx), len(candidates))
+        reached = np.where(free.all(axis=1), len(candidates), free.argmin(axis=1))
+        lengths = np.where(on_track & (reached > 0), candidates[np.maximum(reached - 1, 0)], 0)
+        for step in self._steps[1:]:
+            running = on_track & (lengths < max_range)
+            while running.any():
+                idx = np.flatnonzero(running)
+                next_lengths = np.minimum(lengths[idx] + step, max_range)
+                free = self._are_on_track(
+                    (cx[idx] + dx[idx] * next_lengths).astype(np.int64),
+                    (cy[idx] - dy[idx] * next_lengths).astype(np.int64)
+                )
+                lengths[idx[free]] = next_lengths[free]
+                running[idx[~free]] = False
+                running[idx[free]] = next_lengths[free] < max_range
+
+        return lengths
+
+    def _march_certain_many(
+            self,
+            cx: np.ndarray,
+            cy: np.ndarray,
+            dx: np.ndarray,
+            dy: np.ndarray,
+            on_track: np.ndarray
+    ) -> np.ndarray:
+        """
+        The same march as _march, of all running rays at once - but past the certain samples every iteration
+        tests a window of the next samples, so that rays grazing a border (certain of little) take few iterations
+        """
+        max_range = self._config.max_range
+        lengths = np.zeros(len(cx), dtype=np.int64)
+        certain = np.zeros(len(cx), dtype=np.int64)
+        certain[on_track] = self._reaches(cx[on_track].astype(np.int64), cy[on_track].astype(np.int64))
+        window = np.arange(1, _WINDOW + 1)
+        for step in self._steps:
+            running = on_track & (lengths < max_range)
+            while running.any():
+                idx = np.flatnonzero(running)
+                length, ray_certain = lengths[idx], certain[idx]
+                length = np.minimum(length + np.maximum(ray_certain - length, 0) // step * step, max_range)
+                candidates = np.minimum(length[:, None] + window * step, max_range)
+                free = self._are_on_track(
+                    (cx[idx, None] + dx[idx, None] * candidates).astype(np.int64).ravel(),
+                    (cy[idx, None] - dy[idx, None] * candidates).astype(np.int64).ravel()
+                ).reshape(candidates.shape)
+                free[length >= max_range] = True  # rays certain all the way
+                passed = np.where(free.all(axis=1), _WINDOW, free.argmin(axis=1))
+                length = np.where(passed > 0, candidates[np.arange(len(idx)), np.maximum(passed - 1, 0)], length)
+                lengths[idx] = length
+                running[idx] = (passed == _WINDOW) & (length < max_range)
+                if step == 1:  # the window's samples are contiguous, certain up to its last free one
+                    ray_certain = np.where(
+                        candidates[:, 0] <= ray_certain + 1, np.maximum(ray_certain, length), ray_certain
+                    )
+                ends = np.flatnonzero(passed > 0)
+                reach = np.zeros(len(idx), dtype=np.int64)
+                reach[ends] = self._reaches(
+                    (cx[idx[ends]] + dx[idx[ends]] * length[ends]).astype(np.int64),
+                    (cy[idx[ends]] - dy[idx[ends]] * length[ends]).astype(np.int64)
+                )
+                extends = (passed > 0) & (length - reach <= ray_certain + 1)
+                certain[idx] = np.where(extends, np.maximum(ray_certain, length + reach), ray_certain)
+
+        return lengths
+
+    def _is_on_track(self, x: int, y: int) -> bool:
+        return 0 <= x < self._width and 0 <= y < self._height and bool(self._on_track[y, x])
+
+    def _are_on_track(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        inside = (x >= 0) & (x < self._width) & (y >= 0) & (y < self._height)
+        result = np.zeros(len(x), dtype=bool)
+        result[inside] = self._on_track[y[inside], x[inside]]
+
+        return result
+
+    def _reach(self, x: int, y: int) -> int:
+        """ Number of samples past (or before) the on-track sample at (x, y) certainly on track too """
+        return max(ceil(float(self._clearance[y, x]) - _CLEARANCE_MARGIN) - 1, 0)
+
+    def _reaches(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        reach = np.ceil(self._clearance[y, x] - _CLEARANCE_MARGIN).astype(np.int64) - 1
+
+        return np.maximum(reach, 0)
+
+    def _march(self, center: Point, angle: float) -> Tuple[int, Point]:
+        cx, cy = center
+        if not self._is_on_track(cx, cy):
+            return 0, (cx, cy)
+        rad = radians(angle)
+        dx, dy = cos(rad), sin(rad)
+        max_range = self._config.max_range
+        length = 0  # the furthest length known to be on track
+        certain = self._reach(cx, cy)  # every sample up to this length is on track
+        for step in self._steps:
+            while length < max_range:
+                if certain >= max_range:
+                    length = max_range
+                    break
+                length += max(certain - length, 0) // step * step
+                next_length = min(length + step, max_range)
+                x, y = int(cx + dx * next_length), int(cy - dy * next_length)
+                if not self._is_on_track(x, y):
+                    break
+                reach = self._reach(x, y)
+                if next_length - reach <= certain + 1:  # no gap of unknown samples after the certain ones
+                    certain = max(certain, next_length + reach)
+                length = next_length
+        if length < max_range:
+            length = min(length + self._config.step, max_range)
+
+        return length, (int(cx + dx * length), int(cy - dy * length))
@@ -0,0 +1,137 @@
+import json
+import os
+from collections import deque
+from pathlib import Path
+from threading import Thread, Event
+from time import time, perf_counter
+from typing import Optional, Dict, Any, Sequence, Deque, Union
+
+import numpy as np
+
+Record = Dict[str, Any]
+
+
+def _to_json(value: Any) -> Any:
+    """ NumPy scalars & arrays, e.g. a loss fetched from a tensor """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class Telemetry:
+    """
+    Structured metrics & events of a run, appended to a JSONL file - one record per line:
+    {"time": ..., "kind": "scalar" | "event" | "histogram" | "rate", "name": ..., "step": ..., ...}
+
+    Recording only appends to an in-memory buffer, which a background thread flushes every flush_interval seconds,
+    so that the simulation never waits on the disk. If the writer falls behind by max_buffered records,
+    the oldest records are dropped (and counted as such) rather than blocking the caller.
+    """
+
+    def __init__(self, path: Union[str, Path], flush_interval: float = 1., max_buffered: int = 100000):
+        self._path = Path(path)
+        self._flush_interval = flush_interval
+        self._buffer: Deque[Record] = deque(maxlen=max_buffered)
+        self._counters: Dict[str, int] = {}
+        self._counted: Dict[str, int] = {}
+        self._counted_at = perf_counter()
+        self._dropped = 0
+        self._stop = Event()
+        self._writer: Optional[Thread] = None
+
+    def __enter__(self) -> 'Telemetry':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    def scalar(self, name: str, value: float, step: Optional[int] = None) -> None:
+        self._append({'kind': 'scalar', 'name': name, 'step': step, 'value': value})
+
+    def event(self, name: str, step: Optional[int] = None, **fields: Any) -> None:
+        """ e.g. a car crossing the finish line, fields are stored as they are """
+        self._append({'kind': 'event', 'name': name, 'step': step, **fields})
+
+    def histogram(self, name: str, values: Sequence[float], step: Optional[int] = None) -> None:
+        """ Summary of a distribution, e.g. fitness of a generation """
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return
+        q1, median, q3 = np.percentile(values, (25, 50, 75))
+        self._append({
+            'kind': 'histogram',
+            'name': name,
+            'step': step,
+            'count': int(values.size),
+            'min': float(values.min()),
+            'q1': float(q1),
+            'median': float(median),
+            'q3': float(q3),
+            'max': float(values.max()),
+            'mean': float(values.mean()),
+            'std': float(values.std())
+        })
+
+    def count(self, name: str, n: int = 1) -> None:
+        """ Cheapest record of all - the writer reports counts as per second rates, e.g. of simulation steps """
+        self._counters[name] = self._counters.get(name, 0) + n
+        self._ensure_writer()
+
+    def flush(self) -> None:
+        """ Writes out everything recorded so far, in the caller's thread """
+        self._append_rates()
+        records = []
+        while self._buffer:
+            records.append(self._buffer.popleft())
+        if not records:
+            return
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._path, 'a') as fh:
+            fh.write(''.join(json.dumps(record, default=_to_json) + '\n' for record in records))
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        if self._dropped:
+            self._buffer.append({'kind': 'event', 'name': 'telemetry_dropped', 'time': time(), 'count': self._dropped})
+        self.flush()
+
+    def _append(self, record: Record) -> None:
+        record['time'] = time()
+        if len(self._buffer) == self._buffer.maxlen:
+            self._dropped += 1
+        self._buffer.append(record)
+        self._ensure_writer()
+
+    def _append_rates(self) -> None:
+        now = perf_counter()
+        elapsed = max(now - self._counted_at, 1e-9)
+        self._counted_at = now
+        for name, total in list(self._counters.items()):
+            n = total - self._counted.get(name, 0)
+            self._counted[name] = total
+            if n:
+                self._buffer.append({'kind': 'rate', 'name': name, 'time': time(), 'count': n, 'value': n / elapsed})
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None and not self._stop.is_set():
+            self._writer = Thread(target=self._write_loop, name="telemetry-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self) -> None:
+        while not self._stop.wait(self._flush_interval):
+            self.flush()
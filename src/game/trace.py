@@ -0,0 +1,350 @@
+from __future__ import annotations
+import os
+import zlib
+from struct import Struct
+from typing import List, Sequence, NamedTuple, Optional, Dict, Iterator, Tuple
+
+from .cars import Car, PlayerCar, AiCar
+from .contacts import CarContacts
+from .controls import CarMovement
+from .meta import MapMeta, MapType, Checkpoint
+from .physics import apply_keys, apply_movement
+
+
+MAGIC = b"ARTR"
+VERSION = 1
+NO_ACTION = 0xFF  # car didn't act during the tick, e.g. it was dead
+PLAYER = 0
+AI = 1
+# rules which differ between controllers
+IDLE_STAGNATION = 1  # CarMovement.NOTHING adds extra stagnation, as AiController does
+CHECKPOINT_RESETS_STAGNATION = 2  # passing a checkpoint resets car's stagnation, as DqnController does
+FINISH_KILLS = 4  # car which crossed the finish line stops, as in AiController, otherwise the segment just ends
+CAR_CONTACTS = 8  # cars collide with each other at the end of every tick, see CarContacts
+# magic, version, map type, rules, seed, cars, segments
+_HEADER = Struct("<4sHBBQHI")
+# kind, use threshold, movement threshold, max velocity, rotation velocity, acceleration
+_CAR = Struct("<BBiddd")
+# x, y, angle, velocity, stagnation, bounce count, alive
+_STATE = Struct("<ddddiHB")
+# ticks, checkpoints
+_SEGMENT = Struct("<IH")
+
+
+class CarSpec(NamedTuple):
+    kind: int
+    use_threshold: bool
+    movement_threshold: int
+    max_velocity: float
+    rotation_velocity: float
+    acceleration: float
+
+
+class CarState(NamedTuple):
+    x: float
+    y: float
+    angle: float
+    velocity: float
+    stagnation: int
+    bounce_count: int
+    alive: bool
+
+
+class Segment(NamedTuple):
+    """ Ticks between two resets of cars, e.g. a single level """
+    checkpoints: Tuple[bool, ...]  # active checkpoints at the beginning
+    initial: Tuple[CarState, ...]
+    final: Tuple[CarState, ...]
+    actions: bytes  # ticks x cars, CarMovement value of AI car or KEY_* bits of player's car
+
+
+class Trace:
+    """
+    Compact record of a run: map, cars, rules & seed, then every segment's initial state and one byte per car per tick.
+    Everything else is re-simulated by TraceReplayer, final states are kept to verify the replay.
+    """
+
+    def __init__(
+            self,
+            map_type: MapType,
+            cars: Sequence[CarSpec],
+            segments: Sequence[Segment],
+            rules: int = 0,
+            seed: int = 0
+    ):
+        self._map_type = map_type
+        self._cars = tuple(cars)
+        self._segments = tuple(segments)
+        self._rules = rules
+        self._seed = seed
+
+    @property
+    def map_type(self) -> MapType:
+        return self._map_type
+
+    @property
+    def cars(self) -> Tuple[CarSpec, ...]:
+        return self._cars
+
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        return self._segments
+
+    @property
+    def rules(self) -> int:
+        return self._rules
+
+    @property
+    def seed(self) -> int:
+        return self._seed
+
+    @property
+    def ticks(self) -> int:
+        return sum(len(segment.actions) // len(self._cars) for segment in self._segments)
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(
+            MAGIC, VERSION, self._map_type.value, self._rules, self._seed, len(self._cars), len(self._segments)
+        )
+        body = [_CAR.pack(*car) for car in self._cars]
+        for segment in self._segments:
+            body.append(_SEGMENT.pack(len(segment.actions) // len(self._cars), len(segment.checkpoints)))
+            body.append(bytes(segment.checkpoints))
+            body.extend(_STATE.pack(*state) for state in segment.initial + segment.final)
+            body.append(segment.actions)
+
+        return header + zlib.compress(b"".join(body), 9)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Trace:
+        magic, version, map_type, rules, seed, n_cars, n_segments = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a trace file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported trace version {version}, expected {VERSION}")
+        body = zlib.decompress(data[_HEADER.size:])
+        cars, offset = [], 0
+        for _ in range(n_cars):
+            kind, use_threshold, *params = _CAR.unpack_from(body, offset)
+            cars.append(CarSpec(kind, bool(use_threshold), *params))
+            offset += _CAR.size
+        segments = []
+        for _ in range(n_segments):
+            n_ticks, n_checkpoints = _SEGMENT.unpack_from(body, offset)
+            offset += _SEGMENT.size
+            checkpoints = tuple(bool(active) for active in body[offset:offset + n_checkpoints])
+            offset += n_checkpoints
+            states = []
+            for _ in range(2 * n_cars):
+                *kinematics, alive = _STATE.unpack_from(body, offset)
+                states.append(CarState(*kinematics, bool(alive)))
+                offset += _STATE.size
+            actions = body[offset:offset + n_ticks * n_cars]
+            offset += len(actions)
+            segments.append(Segment(checkpoints, tuple(states[:n_cars]), tuple(states[n_cars:]), actions))
+
+        return cls(MapType(map_type), cars, segments, rules, seed)
+
+    def save(self, path: str) -> None:
+        """ Written under a temporary name and atomically renamed """
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as fh:
+            fh.write(self.to_bytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Trace:
+        with open(path, 'rb') as fh:
+            return cls.from_bytes(fh.read())
+
+
+def _car_state(car: Car) -> CarState:
+    if isinstance(car, AiCar):
+        return CarState(car.x, car.y, car.angle, car.velocity, car.stagnation, car.bounce_count, car.alive)
+
+    return CarState(car.x, car.y, car.angle, car.velocity, 0, 0, car.alive)
+
+
+def _car_spec(car: Car) -> CarSpec:
+    if isinstance(car, AiCar):
+        return CarSpec(
+            AI, car.use_threshold, car.movement_threshold, car.max_velocity, car.rotation_velocity, car.acceleration
+        )
+
+    return CarSpec(PLAYER, False, 0, car.max_velocity, car.rotation_velocity, car.acceleration)
+
+
+class TraceRecorder:
+    """ Collects a Trace of a fixed set of cars, tick by tick. Recording costs one byte write per car per tick """
+
+    def __init__(self, map_type: MapType, cars: Sequence[Car], rules: int = 0, seed: int = 0):
+        """ seed - of any randomness driving the run, kept for reference only - the game itself is deterministic """
+        self._map_type = map_type
+        self._cars = list(cars)
+        self._specs = [_car_spec(car) for car in self._cars]
+        self._index: Dict[int, int] = {id(car): i for i, car in enumerate(self._cars)}
+        self._rules = rules
+        self._seed = seed
+        self._segments: List[Segment] = []
+        self._segment: Optional[Tuple[Tuple[bool, ...], Tuple[CarState, ...]]] = None
+        self._actions = bytearray()
+        self._row = bytearray([NO_ACTION]) * len(self._cars)
+        self._dirty = False
+
+    @property
+    def cars(self) -> List[Car]:
+        return self._cars
+
+    def begin_segment(self, checkpoints: Sequence[Checkpoint]) -> None:
+        """ Call right after cars were (re)spawned """
+        self.end_segment()
+        self._segment = (
+            tuple(checkpoint.active for checkpoint in checkpoints),
+            tuple(_car_state(car) for car in self._cars)
+        )
+
+    def record(self, car: Car, action: int) -> None:
+        """ action - CarMovement value of AI car, KEY_* bits of player's car """
+        if self._segment is not None:
+            self._row[self._index[id(car)]] = action
+            self._dirty = True
+
+    def end_tick(self) -> None:
+        # ticks in which no car acted don't change anything, hence aren't stored
+        if self._dirty:
+            self._actions += self._row
+            self._row[:] = bytes([NO_ACTION]) * len(self._row)
+            self._dirty = False
+
+    def end_segment(self) -> None:
+        """ Call before cars are reset """
+        if self._segment is None:
+            return
+        self.end_tick()
+        checkpoints, initial = self._segment
+        final = tuple(_car_state(car) for car in self._cars)
+        self._segments.append(Segment(checkpoints, initial, final, bytes(self._actions)))
+        self._segment = None
+        self._actions = bytearray()
+
+    def trace(self) -> Trace:
+        self.end_segment()
+
+        return Trace(self._map_type, self._specs, self._segments, self._rules, self._seed)
+
+
+class TraceReplayer:
+    """
+    Re-simulates a Trace headless, without any inference or rendering, thus far faster than real time.
+    Applies the same physics & collision rules as controllers do.
+    """
+
+    def __init__(self, trace: Trace, bundle: Optional[str] = None):
+        """ bundle - path of the compiled track, required by traces of MapType.CUSTOM tracks """
+        self._trace = trace
+        self._map_meta = MapMeta.from_bundle(bundle) if bundle is not None else MapMeta(trace.map_type)
+        self._cars = [self._build_car(spec) for spec in trace.cars]
+        self._contacts = CarContacts() if trace.rules & CAR_CONTACTS else None
+
+    @property
+    def cars(self) -> List[Car]:
+        return self._cars
+
+    def poses(self) -> Iterator[Tuple[int, List[Car]]]:
+        """ Yields (segment index, cars) after every tick, e.g. to draw ghost cars or render highlights """
+        for i, segment in enumerate(self._trace.segments):
+            self._start_segment(segment)
+            yield i, self._cars
+            n_cars = len(self._cars)
+            for start in range(0, len(segment.actions), n_cars):
+                self._step(segment.actions[start:start + n_cars])
+                yield i, self._cars
+
+    def run(self) -> List[Tuple[CarState, ...]]:
+        """ Returns final states of cars in every segment """
+        finals = []
+        for i, segment in enumerate(self._trace.segments):
+            self._start_segment(segment)
+            n_cars = len(self._cars)
+            for start in range(0, len(segment.actions), n_cars):
+                self._step(segment.actions[start:start + n_cars])
+            finals.append(tuple(_car_state(car) for car in self._cars))
+
+        return finals
+
+    def verify(self) -> bool:
+        """ Checks that replay ends every segment with the recorded poses """
+        for replayed, segment in zip(self.run(), self._trace.segments):
+            for state, recorded in zip(replayed, segment.final):
+                if (state.x, state.y, state.angle, state.alive) != \
+                        (recorded.x, recorded.y, recorded.angle, recorded.alive):
+                    return False
+
+        return True
+
+    def _build_car(self, spec: CarSpec) -> Car:
+        if spec.kind == PLAYER:
+            return PlayerCar(
+                max_velocity=spec.max_velocity,
+                rotation_velocity=spec.rotation_velocity,
+                track=self._map_meta.track,
+                acceleration=spec.acceleration
+            )
+
+        return AiCar(
+            max_velocity=spec.max_velocity,
+            rotation_velocity=spec.rotation_velocity,
+            track=self._map_meta.track,
+            movement_threshold=spec.movement_threshold,
+            acceleration=spec.acceleration,
+            use_threshold=spec.use_threshold
+        )
+
+    def _start_segment(self, segment: Segment) -> None:
+        for checkpoint, active in zip(self._map_meta.checkpoints, segment.checkpoints):
+            if active:
+                checkpoint.activate()
+            else:
+                checkpoint.deactivate()
+        for car, state in zip(self._cars, segment.initial):
+            car.reset(state.x, state.y, state.angle)
+            car.set_kinematics(state.x, state.y, state.angle, state.velocity)
+            car.alive = state.alive
+            if isinstance(car, AiCar):
+                car.stagnation = state.stagnation
+                car.bounce_count = state.bounce_count
+        if self._contacts is not None:
+            self._contacts.reset(self._cars)
+
+    def _step(self, actions: bytes) -> None:
+        rules = self._trace.rules
+        meta = self._map_meta
+        for car, action in zip(self._cars, actions):
+            if action == NO_ACTION:
+                continue
+            if isinstance(car, AiCar):
+                movement = CarMovement(action)
+                apply_movement(car, movement)
+                if movement == CarMovement.NOTHING and rules & IDLE_STAGNATION:
+                    car.stagnation += 5
+            else:
+                apply_keys(car, action)
+        for car, action in zip(self._cars, actions):
+            if action == NO_ACTION and not car.alive:  # dead car which didn't move can't collide differently
+                continue
+            for checkpoint in meta.checkpoints:
+                if checkpoint.active and car.is_colliding(checkpoint.mask, checkpoint.rect.left, checkpoint.rect.top):
+                    checkpoint.deactivate()
+                    if rules & CHECKPOINT_RESETS_STAGNATION and isinstance(car, AiCar):
+                        car.stagnation = 0
+            if car.is_colliding_swept(meta.borders_mask):
+                car.alive = False
+                continue
+            crossed_finish_line_poi = car.is_colliding_swept(meta.finish_line_mask)
+            if crossed_finish_line_poi and car.alive:
+                if crossed_finish_line_poi[1] > meta.finish_line_crossing_point:
+                    car.bounce()
+                elif rules & FINISH_KILLS:
+                    car.alive = False
+        if self._contacts is not None:
+            self._contacts.resolve(self._cars)
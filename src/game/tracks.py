@@ -0,0 +1,360 @@
+from __future__ import annotations
+import json
+import os
+from hashlib import sha1
+from pathlib import Path
+from struct import Struct
+from typing import Tuple, List, Optional, Sequence, Dict, Union
+
+import numpy as np
+import pygame
+from pygame import Surface, Rect
+
+from .utils import Point, get_track_array, set_track_array
+
+MAGIC = b"ATRK"
+VERSION = 2  # 2 - bundles carry a digest of their sources
+TRACKS_DIR = Path(".") / "tracks"
+SUFFIX = ".track"
+MAX_CLEARANCE = 255  # pixels, clearance field saturates there
+CHECKPOINT_SIZE = 100
+UNREACHABLE = -1.  # progress of pixels off the track or behind the finish line
+# magic, version, metadata length
+_HEADER = Struct("<4sHI")
+_ALIGNMENT = 4096  # arrays start on page boundaries, so they're mapped straight from the file
+_BUNDLES: Dict[str, TrackBundle] = {}
+_CLEARANCES: Dict[int, Tuple[Surface, np.ndarray]] = {}
+
+
+def write_arrays(path: Path, magic: bytes, version: int, metadata: Dict, arrays: Dict[str, np.ndarray]) -> None:
+    """
+    Writes metadata (JSON) & page-aligned arrays in a single file, so that they can be mapped straight from it.
+    Written under a temporary name and atomically renamed.
+    """
+    metadata = dict(metadata, arrays={})
+    start = 0
+    while True:  # offsets depend on metadata's length, which depends on offsets
+        start += _ALIGNMENT
+        offset = start
+        for name, array in arrays.items():
+            metadata['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        encoded = json.dumps(metadata).encode()
+        if _HEADER.size + len(encoded) <= start:
+            break
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as fh:
+        fh.write(_HEADER.pack(magic, version, len(encoded)) + encoded)
+        for name, array in arrays.items():
+            fh.seek(metadata['arrays'][name]['offset'])
+            fh.write(np.ascontiguousarray(array).tobytes())
+        fh.truncate(offset)
+    os.replace(tmp, path)
+
+
+def map_arrays(path: Path, magic: bytes, version: int) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """ Reads a file of write_arrays, returns its metadata & read-only memory-mapped arrays """
+    with open(path, 'rb') as fh:
+        file_magic, file_version, length = _HEADER.unpack(fh.read(_HEADER.size))
+        if file_magic != magic:
+            raise ValueError(f"Not a {magic.decode()} file")
+        if file_version != version:
+            raise ValueError(f"Unsupported {magic.decode()} file version {file_version}, expected {version}")
+        metadata = json.loads(fh.read(length))
+    arrays = {
+        name: np.memmap(path, dtype=np.dtype(spec['dtype']), mode='r', offset=spec['offset'], shape=tuple(spec['shape']))
+        for name, spec in metadata['arrays'].items()
+    }
+
+    return metadata, arrays
+
+
+def _rgba(surface: Surface) -> np.ndarray:
+    width, height = surface.get_size()
+
+    return np.frombuffer(pygame.image.tobytes(surface, 'RGBA'), dtype=np.uint8).reshape(height, width, 4)
+
+
+def clearance_field(on_track: np.ndarray) -> np.ndarray:
+    """
+    Euclidean distance (pixels) of every pixel to the nearest off-track pixel, saturated at MAX_CLEARANCE.
+    Anything outside the map is off track. Computed exactly, separably - column runs first, then rows.
+    """
+    height, width = on_track.shape
+    columns = np.zeros((height, width), dtype=np.float64)
+    run = np.zeros(width, dtype=np.float64)
+    for y in range(height):
+        run = np.where(on_track[y], run + 1, 0)
+        columns[y] = run
+    run = np.zeros(width, dtype=np.float64)
+    for y in range(height - 1, -1, -1):
+        run = np.where(on_track[y], run + 1, 0)
+        columns[y] = np.minimum(columns[y], run)
+    columns = np.minimum(columns, MAX_CLEARANCE + 1) ** 2
+    squared = columns.copy()
+    padded = np.pad(columns, ((0, 0), (width, width)))  # squared column distance of off-map pixels is 0
+    k = 1
+    while k < width and k * k < squared.max():
+        np.minimum(squared, k * k + padded[:, width - k:2 * width - k], out=squared)
+        np.minimum(squared, k * k + padded[:, width + k:2 * width + k], out=squared)
+        k += 1
+
+    return np.minimum(np.sqrt(squared), MAX_CLEARANCE).astype(np.float32)
+
+
+def get_clearance_field(track: Surface) -> np.ndarray:
+    """ clearance_field of the track, read-only. Cached per surface - bundles provide theirs, others take a second """
+    cached = _CLEARANCES.get(id(track))
+    if cached is None or cached[0] is not track:
+        clearance = clearance_field(get_track_array(track))
+        clearance.flags.writeable = False
+        cached = _CLEARANCES[id(track)] = (track, clearance)
+
+    return cached[1]
+
+
+def _finish_wall(on_track: np.ndarray, finish_line: np.ndarray) -> np.ndarray:
+    """ Finish line extended along its longest axis to the track's edges - images don't span the whole track """
+    height, width = on_track.shape
+    ys, xs = np.nonzero(finish_line)
+    points = np.stack((xs, ys), axis=1).astype(np.float64)
+    centre = points.mean(axis=0)
+    axis = np.linalg.svd(points - centre, full_matrices=False)[2][0]
+    wall = finish_line.copy()
+    for direction in (axis, -axis):
+        t = 0.
+        while True:
+            x, y = np.floor(centre + t * direction).astype(int)
+            if not (0 <= x < width and 0 <= y < height) or not on_track[y, x]:
+                break
+            wall[max(y - 1, 0):y + 2, max(x - 1, 0):x + 2] = True  # thick enough to stop a 4-connected search
+            t += .5
+
+    return wall
+
+
+def progress_field(on_track: np.ndarray, finish_line: np.ndarray, start: Point) -> np.ndarray:
+    """
+    Distance (pixels) along the track from start, with the finish line (extended to track's edges) as a wall -
+    breadth-first, 4-connected. Since the finish line can't be crossed, distance grows all the way round the lap.
+    Pixels off the track or unreachable are UNREACHABLE.
+    """
+    height, width = on_track.shape
+    passable = (on_track & ~_finish_wall(on_track, finish_line)).reshape(-1)
+    x, y = start
+    if not (0 <= x < width and 0 <= y < height) or not passable[y * width + x]:
+        raise ValueError("Start position must be on the track, off the finish line")
+    distance = np.full(height * width, -1, dtype=np.int32)
+    frontier = np.array([y * width + x], dtype=np.int64)
+    distance[frontier] = 0
+    step = 0
+    while frontier.size:
+        step += 1
+        column = frontier % width
+        neighbours = np.concatenate((
+            frontier[column > 0] - 1,
+            frontier[column < width - 1] + 1,
+            frontier[frontier >= width] - width,
+            frontier[frontier < (height - 1) * width] + width
+        ))
+        neighbours = neighbours[passable[neighbours]]
+        frontier = np.unique(neighbours[distance[neighbours] < 0])
+        distance[frontier] = step
+    progress = distance.astype(np.float32)
+    progress[distance < 0] = UNREACHABLE
+
+    return progress.reshape(height, width)
+
+
+def derive_checkpoints(progress: np.ndarray, clearance: np.ndarray, count: int) -> List[Rect]:
+    """ count checkpoints evenly spaced along the lap, each in the middle of the track (most clearance) """
+    lap_length = progress.max()
+    rects = []
+    for i in range(1, count + 1):
+        band = np.abs(progress - lap_length * i / (count + 1)) <= 2
+        if not band.any():
+            continue
+        y, x = np.unravel_index(np.argmax(np.where(band, clearance, -1)), clearance.shape)
+        half = CHECKPOINT_SIZE // 2
+        rects.append(Rect(int(x) - half, int(y) - half, CHECKPOINT_SIZE, CHECKPOINT_SIZE))
+
+    return rects
+
+
+def source_digest(
+        track: Surface,
+        finish_line: Surface,
+        name: str,
+        start_position: Point,
+        start_angle: float,
+        crossing_point: int,
+        checkpoints: Sequence[Rect]
+) -> str:
+    """ Digest of everything a bundle is compiled from - images & metadata, so that an outdated bundle can be told """
+    digest = sha1(_rgba(track).tobytes())
+    digest.update(_rgba(finish_line).tobytes())
+    digest.update(json.dumps([
+        name,
+        [int(start_position[0]), int(start_position[1])],
+        float(start_angle),
+        int(crossing_point),
+        [[rect.x, rect.y, rect.width, rect.height] for rect in map(Rect, checkpoints)]
+    ]).encode())
+
+    return digest.hexdigest()
+
+
+def compile_track(
+        track: Union[str, Path, Surface],
+        finish_line: Union[str, Path, Surface],
+        path: Union[str, Path],
+        start_position: Point,
+        start_angle: float,
+        crossing_point: Optional[int] = None,
+        checkpoints: Optional[Sequence[Rect]] = None,
+        checkpoints_count: int = 8,
+        name: Optional[str] = None
+) -> TrackBundle:
+    """
+    Writes a track bundle - both images, collision bitmap, clearance & progress fields and metadata in one file.
+
+    track, finish_line - images (or their paths) of the same size, transparent black is off the track
+    start_position, start_angle - car's spawn, it races away from the finish line
+    crossing_point - finish line's y, cars crossing it below are going the wrong way. Finish line's middle by default
+    checkpoints - rects, evenly spaced checkpoints_count ones are derived from the progress field by default
+    """
+    if not isinstance(track, Surface):
+        track = pygame.image.load(str(track))
+    if not isinstance(finish_line, Surface):
+        finish_line = pygame.image.load(str(finish_line))
+    if track.get_size() != finish_line.get_size():
+        raise ValueError("Track & finish line must be of the same size")
+    path = Path(path)
+    track_rgba, finish_line_rgba = _rgba(track), _rgba(finish_line)
+    on_track = np.array(get_track_array(track))
+    on_finish_line = finish_line_rgba[..., 3] != 0
+    if not on_finish_line.any():
+        raise ValueError("Finish line image is empty")
+    clearance = clearance_field(on_track)
+    progress = progress_field(on_track, on_finish_line, (int(start_position[0]), int(start_position[1])))
+    if crossing_point is None:
+        rows = np.nonzero(on_finish_line.any(axis=1))[0]
+        crossing_point = int(rows[0] + rows[-1]) // 2
+    if checkpoints is None:
+        checkpoints = derive_checkpoints(progress, clearance, checkpoints_count)
+    arrays = {
+        'track': track_rgba,
+        'finish_line': finish_line_rgba,
+        'on_track': on_track,
+        'clearance': clearance,
+        'progress': progress
+    }
+    metadata = {
+        'name': name or path.stem,
+        'size': list(track.get_size()),
+        'start_position': [int(start_position[0]), int(start_position[1])],
+        'start_angle': start_angle,
+        'crossing_point': int(crossing_point),
+        'checkpoints': [[rect.x, rect.y, rect.width, rect.height] for rect in map(Rect, checkpoints)],
+        'lap_length': float(progress.max())
+    }
+    metadata['source'] = source_digest(
+        track, finish_line, metadata['name'], start_position, start_angle, crossing_point, checkpoints
+    )
+    write_arrays(path, MAGIC, VERSION, metadata, arrays)
+    _BUNDLES.pop(str(path.resolve()), None)
+
+    return load_track_bundle(path)
+
+
+def load_track_bundle(path: Union[str, Path]) -> TrackBundle:
+    """ Bundles are read-only, so a process maps every one just once - processes share its pages via the OS """
+    key = str(Path(path).resolve())
+    bundle = _BUNDLES.get(key)
+    if bundle is None:
+        bundle = _BUNDLES[key] = TrackBundle(key)
+
+    return bundle
+
+
+def builtin_bundle_path(name: str) -> Path:
+    return TRACKS_DIR / f"{name.lower()}{SUFFIX}"
+
+
+class TrackBundle:
+    """
+    Compiled track, memory-mapped read-only - loading it decodes no images and derives nothing.
+    See compile_track.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self._path = Path(path)
+        self._metadata, self._arrays = map_arrays(self._path, MAGIC, VERSION)
+        size = tuple(self._metadata['size'])
+        # surfaces share the mapped pixels, they're only ever blitted
+        self._track = pygame.image.frombuffer(self._arrays['track'], size, 'RGBA')
+        self._finish_line = pygame.image.frombuffer(self._arrays['finish_line'], size, 'RGBA')
+        set_track_array(self._track, self._arrays['on_track'])
+        _CLEARANCES[id(self._track)] = (self._track, self._arrays['clearance'])
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def name(self) -> str:
+        return self._metadata['name']
+
+    @property
+    def source(self) -> str:
+        """ Digest of the images & metadata the bundle was compiled from, see source_digest """
+        return self._metadata['source']
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return tuple(self._metadata['size'])
+
+    @property
+    def start_position(self) -> Point:
+        return tuple(self._metadata['start_position'])
+
+    @property
+    def start_angle(self) -> float:
+        return self._metadata['start_angle']
+
+    @property
+    def crossing_point(self) -> int:
+        return self._metadata['crossing_point']
+
+    @property
+    def checkpoints(self) -> List[Rect]:
+        return [Rect(*rect) for rect in self._metadata['checkpoints']]
+
+    @property
+    def lap_length(self) -> float:
+        """ Progress of the furthest pixel, in pixels along the track """
+        return self._metadata['lap_length']
+
+    @property
+    def track(self) -> Surface:
+        return self._track
+
+    @property
+    def finish_line(self) -> Surface:
+        return self._finish_line
+
+    @property
+    def on_track(self) -> np.ndarray:
+        """ (height, width) bool collision bitmap, the same as get_track_array of the track """
+        return self._arrays['on_track']
+
+    @property
+    def clearance(self) -> np.ndarray:
+        """ (height, width) distance to the nearest off-track pixel, see clearance_field """
+        return self._arrays['clearance']
+
+    @property
+    def progress(self) -> np.ndarray:
+        """ (height, width) distance along the track from the start, see progress_field """
+        return self._arrays['progress']
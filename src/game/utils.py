@@ -1,7 +1,8 @@
-from typing import Union, Tuple, List
+from typing import Union, Tuple, List, Dict
 from math import sqrt
 
-from pygame import Surface, SurfaceType, Mask
+import numpy as np
+from pygame import Surface, SurfaceType, Mask, Rect, surfarray
 from pygame.mask import from_surface
 from pygame.transform import scale, rotate
 from pygame.font import SysFont
@@ -13,6 +14,10 @@ Window = Union[Surface, SurfaceType]
 Image = Union[Surface, SurfaceType]
 Point = Tuple[int, int]
 
+_TRACK_ARRAYS: Dict[int, Tuple[Surface, np.ndarray]] = {}
+_SPRITES: Dict[Tuple[int, float], Tuple[Surface, Surface, Mask]] = {}
+_DISPLAY_IMAGES: Dict[int, Tuple[Surface, Surface]] = {}
+
 
 def scale_image(img: Image, factor: float) -> Image:
     size = round(img.get_width() * factor), round(img.get_height() * factor)
@@ -20,10 +25,12 @@ def scale_image(img: Image, factor: float) -> Image:
     return scale(img, size)
 
 
-def rotate_image(window: Window, image: Image, top_left: Tuple[int, int], angle: float) -> None:
+def rotate_image(window: Window, image: Image, top_left: Tuple[int, int], angle: float) -> Rect:
+    """ Returns the area drawn over """
     rotated = rotate(image, angle)
     new_rectangle = rotated.get_rect(center=image.get_rect(topleft=top_left).center)
-    window.blit(rotated, new_rectangle.topleft)
+
+    return window.blit(rotated, new_rectangle.topleft)
 
 
 def get_mask(surface: Image, inverted: bool = False) -> Mask:
@@ -34,15 +41,52 @@ def get_mask(surface: Image, inverted: bool = False) -> Mask:
     return mask
 
 
+def get_sprite(img: Image, factor: float) -> Tuple[Image, Mask]:
+    """ Scaled image & its mask, cached - shared by every car using them, so both must be treated as immutable """
+    cached = _SPRITES.get((id(img), factor))
+    if cached is None or cached[0] is not img:
+        scaled = scale_image(img, factor)
+        cached = _SPRITES[(id(img), factor)] = (img, scaled, get_mask(scaled))
+
+    return cached[1], cached[2]
+
+
+def get_display_image(img: Image) -> Image:
+    """ Copy of img in display's pixel format, cached. Needs an initialized display """
+    cached = _DISPLAY_IMAGES.get(id(img))
+    if cached is None or cached[0] is not img:
+        cached = _DISPLAY_IMAGES[id(img)] = (img, img.convert_alpha())
+
+    return cached[1]
+
+
+def get_track_array(track: Image) -> np.ndarray:
+    """ Read-only (height, width) bool array, True where track's pixel isn't transparent black. Cached per surface """
+    cached = _TRACK_ARRAYS.get(id(track))
+    if cached is None or cached[0] is not track:
+        on_track = surfarray.array3d(track).any(axis=2) | (surfarray.array_alpha(track) != 0)
+        on_track = np.ascontiguousarray(on_track.T)  # surfarray is indexed [x, y]
+        on_track.flags.writeable = False
+        cached = _TRACK_ARRAYS[id(track)] = (track, on_track)
+
+    return cached[1]
+
+
+def set_track_array(track: Image, on_track: np.ndarray) -> None:
+    """ Provides get_track_array's result upfront, e.g. a precompiled one of a track bundle """
+    _TRACK_ARRAYS[id(track)] = (track, on_track)
+
+
 def display_text(
         window: Window,
         text: str,
         font: SysFont,
         pos: Point,
         color: Tuple[int, int, int] = (255, 255, 255)
-) -> None:
+) -> Rect:
     render = font.render(text, True, color)
-    window.blit(render, pos)
+
+    return window.blit(render, pos)
 
 
 def display_text_center(
@@ -50,11 +94,12 @@ def display_text_center(
         text: str,
         font: SysFont,
         color: Tuple[int, int, int] = (255, 255, 255)
-) -> None:
+) -> Rect:
     render = font.render(text, True, color)
     center_x = window.get_width() / 2 - render.get_width() / 2
     center_y = window.get_height() / 2 - render.get_height() / 2
-    display_text(window, text, font, (center_x, center_y), color)
+
+    return display_text(window, text, font, (center_x, center_y), color)
 
 
 def distance(a: Point, b: Point) -> float:
@@ -90,7 +135,7 @@ def get_alpha_arrows(ai_movements: List[CarMovement]) -> Tuple[bool, bool, bool,
     return arrows
 
 
-def draw_ai_controls(window: Window, ai_movements: List[CarMovement]) -> None:
+def draw_ai_controls(window: Window, ai_movements: List[CarMovement]) -> Rect:
     k_up = scale_image(K_UP, .2)
     k_down = scale_image(K_DOWN, .2)
     k_left = scale_image(K_LEFT, .2)
@@ -101,7 +146,8 @@ def draw_ai_controls(window: Window, ai_movements: List[CarMovement]) -> None:
         if should_alpha:
             arrow.set_alpha(alpha)
 
-    window.blit(k_up, (950, 10))
-    window.blit(k_down, (950, 105))
-    window.blit(k_left, (855, 105))
-    window.blit(k_right, (1045, 105))
+    return window.blit(k_up, (950, 10)).unionall([
+        window.blit(k_down, (950, 105)),
+        window.blit(k_left, (855, 105)),
+        window.blit(k_right, (1045, 105))
+    ])
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from typing import Tuple, Sequence, Optional, Dict
+
+import numpy as np
+from pygame import Surface, surfarray
+
+from .utils import get_track_array
+
+OFF_TRACK = 0
+FINISH_LINE = 128
+ON_TRACK = 255
+
+
+class VisionConfig:
+    """
+    Layout of car's top-down view - a square crop of the map centred on the car and rotated with it,
+    so that car always heads up.
+
+    size - crop's side in pixels
+    scale - map pixels per crop pixel, the map is averaged over scale x scale blocks beforehand
+    forward - fraction of the crop in front of the car
+    """
+
+    def __init__(self, size: int = 32, scale: int = 4, forward: float = .75):
+        if size < 1 or scale < 1:
+            raise ValueError("Size & scale must be positive")
+        if not 0. <= forward <= 1.:
+            raise ValueError("Forward must be a fraction of the crop")
+        self._size = size
+        self._scale = scale
+        self._forward = forward
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def scale(self) -> int:
+        return self._scale
+
+    @property
+    def forward(self) -> float:
+        return self._forward
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._size, self._size
+
+
+DEFAULT_VISION = VisionConfig()
+_VISIONS: Dict[Tuple[int, int, int], Vision] = {}
+
+
+def get_vision(config: VisionConfig, track: Surface, finish_line: Optional[Surface] = None) -> Vision:
+    """ Visions are stateless, so cars of the same layout & map share a single one """
+    key = (id(config), id(track), id(finish_line))
+    vision = _VISIONS.get(key)
+    if vision is None or vision.config is not config or vision.track is not track or \
+            vision.finish_line is not finish_line:
+        vision = _VISIONS[key] = Vision(config, track, finish_line)
+
+    return vision
+
+
+class Vision:
+    """
+    Samples cars' views from a downsampled uint8 copy of the map, never from rendered frames - a view of many cars
+    costs a single gather, about as much as sweeping their radars.
+
+    Pixels are ON_TRACK, OFF_TRACK, FINISH_LINE or averages of them along edges. Off the map is OFF_TRACK.
+    """
+
+    def __init__(self, config: VisionConfig, track: Surface, finish_line: Optional[Surface] = None):
+        self._config = config
+        self._track = track
+        self._finish_line = finish_line
+        scale = config.scale
+        pixels = np.where(get_track_array(track), ON_TRACK, OFF_TRACK).astype(np.float32)
+        if finish_line is not None:
+            pixels[surfarray.array_alpha(finish_line).T != 0] = FINISH_LINE
+        height, width = pixels.shape
+        # a block average (area downsampling) avoids aliasing of narrow borders
+        height, width = -(-height // scale), -(-width // scale)
+        padded = np.full((height * scale, width * scale), OFF_TRACK, dtype=np.float32)
+        padded[:pixels.shape[0], :pixels.shape[1]] = pixels
+        blocks = padded.reshape(height, scale, width, scale).mean(axis=(1, 3))
+        # one pixel of border, samples off the map are clipped onto it
+        self._map = np.full((height + 2, width + 2), OFF_TRACK, dtype=np.uint8)
+        self._map[1:-1, 1:-1] = np.rint(blocks).astype(np.uint8)
+        self._map.flags.writeable = False
+        self._flat = self._map.reshape(-1)
+        size = config.size
+        # crop's pixel centres in car's frame, in map pixels - rows go from the furthest ahead to behind
+        ahead = (size * config.forward - (np.arange(size) + .5)) * scale
+        lateral = (np.arange(size) + .5 - size / 2) * scale
+        self._ahead = np.repeat(ahead, size)
+        self._lateral = np.tile(lateral, size)
+
+    @property
+    def config(self) -> VisionConfig:
+        return self._config
+
+    @property
+    def track(self) -> Surface:
+        return self._track
+
+    @property
+    def finish_line(self) -> Optional[Surface]:
+        return self._finish_line
+
+    @property
+    def map(self) -> np.ndarray:
+        """ Read-only downsampled map, with a border of OFF_TRACK pixels """
+        return self._map
+
+    def look_many(
+            self,
+            centers: Sequence[Tuple[float, float]],
+            headings: Sequence[float],
+            out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Views of cars at centers heading at headings (degrees), as a (cars, size, size) uint8 array.
+        out, if given, must be C-contiguous - views are gathered straight into it
+        """
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        size = self._config.size
+        if out is None:
+            out = np.empty((len(centers), size, size), dtype=np.uint8)
+        rad = np.radians(np.asarray(headings, dtype=np.float64))[:, None]
+        forward_x, forward_y = np.cos(rad), -np.sin(rad)  # y axis points down
+        # right of the heading is forward rotated clockwise on the screen
+        x = centers[:, :1] + self._ahead * forward_x - self._lateral * forward_y
+        y = centers[:, 1:] + self._ahead * forward_y + self._lateral * forward_x
+        height, width = self._map.shape
+        scale = self._config.scale
+        columns = np.clip(np.floor(x / scale).astype(np.int64) + 1, 0, width - 1)
+        rows = np.clip(np.floor(y / scale).astype(np.int64) + 1, 0, height - 1)
+        np.take(self._flat, rows * width + columns, out=out.reshape(len(centers), size * size), mode='clip')
+
+        return out
+
+    def look(self, center: Tuple[float, float], heading: float, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """ View of a single car, as a (size, size) uint8 array """
+        view = self.look_many([center], [heading], None if out is None else out[None])[0]
+
+        return view if out is None else out
@@ -0,0 +1,41 @@
+import sys
+from subprocess import check_output
+
+MODES = {
+    "One player": "from src.game import OnePlayerController",
+    "Player vs NEAT": "from src.game import PlayerVersusNeatController, CompactNetwork",
+    "Player vs DQN": "\n".join([
+        "from src.game import PlayerVersusDqnController",
+        "from src.ai.dqn import CarRacingEnv",
+        "from src.ai import get_ann, get_agent",
+        "from tf_agents.utils.common import Checkpointer"
+    ])
+}
+# runs in a fresh interpreter, so that every mode pays its own import cost
+PROBE = """
+import resource
+import sys
+from time import perf_counter
+
+start = perf_counter()
+{imports}
+elapsed = perf_counter() - start
+max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, max_rss / 1024 if sys.platform == "darwin" else max_rss)
+"""
+
+
+def measure(imports: str, repeats: int = 3):
+    """ Returns (import seconds, max RSS in MB), best of repeats """
+    samples = []
+    for _ in range(repeats):
+        elapsed, max_rss_kb = check_output([sys.executable, "-c", PROBE.format(imports=imports)]).split()[-2:]
+        samples.append((float(elapsed), float(max_rss_kb) / 1024))
+
+    return min(samples)
+
+
+if __name__ == "__main__":
+    for mode, imports in MODES.items():
+        seconds, rss = measure(imports)
+        print(f"{mode:<16} import: {seconds:6.2f}s   max RSS: {rss:7.1f} MB")
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from src.ai.neat import SweepRunner, grid, random_search, uniform, log_uniform
+from src.game import MapType
+
+
+if __name__ == "__main__":
+    CONFIGS_PATH = Path("src/ai/neat") / "configs"
+    RANDOM_TRIALS = 0  # 0 - grid search
+    runner = SweepRunner(
+        config_path=str(CONFIGS_PATH / "pwr.ini"),
+        map_type=MapType.PWR,
+        out_dir="sweeps/pwr",
+        generations=30,
+        seeds=(0, 1),
+        max_workers=4
+    )
+    if RANDOM_TRIALS:
+        trials = random_search({
+            'pop_size': [50, 100, 200],
+            'conn_add_prob': uniform(.1, .7),
+            'node_add_prob': uniform(.05, .5),
+            'weight_mutate_power': log_uniform(.1, 2.),
+            'activation_default': ['relu', 'tanh', 'sigmoid']
+        }, trials=RANDOM_TRIALS)
+    else:
+        trials = grid({
+            'pop_size': [100, 200],
+            'conn_add_prob': [.3, .5],
+            'activation_default': ['relu', 'tanh']
+        })
+    results = runner.run(trials)
+    print(f"Results in {results}")
@@ -1,53 +1,107 @@
 import tensorflow as tf
-from tf_agents.utils.common import function, Checkpointer
+from tf_agents.utils.common import function
 
 from src.ai.dqn import (
     CarRacingEnv,
-    compute_avg_return,
+    PolicyEvaluator,
+    ActorLearner,
     get_replay_buffer,
     collect_step
 )
-from src.ai import get_ann, get_agent
+from src.ai import get_ann, get_agent, AsyncCheckpointer
+from src.game import MapType, Telemetry
+
+# actor processes collecting experience while the learner trains, 0 collects & trains in turns in a single process
+ACTORS = 0
+
+
+def train_actor_learner(
+        agent,
+        model,
+        evaluator: PolicyEvaluator,
+        checkpointer: AsyncCheckpointer,
+        telemetry: Telemetry
+) -> None:
+    learner = ActorLearner(agent, map_type=MapType.PWR, num_actors=ACTORS)
+
+    def on_update(step: int, loss: float) -> None:
+        checkpointer.maybe_save(step)
+        telemetry.scalar('loss', loss, step)
+        if step % 10 == 0:
+            evaluator.submit(step, model.get_weights())
+        if step % 100 == 0:
+            actor_rate, learner_rate = learner.rates()
+            telemetry.scalar('actor_steps_per_s', actor_rate, step)
+            telemetry.scalar('updates_per_s', learner_rate, step)
+            if step % 1000 == 0:
+                print(
+                    f"Step = {step}, Loss = {loss}, "
+                    f"Actors = {actor_rate:.0f} steps/s, Learner = {learner_rate:.0f} updates/s"
+                )
+        for eval_step, avg_return in evaluator.results():
+            telemetry.scalar('average_return', avg_return, eval_step)
+
+    learner.start()
+    try:
+        with tf.device('/GPU:0'):
+            learner.train(5 * 10_000, on_update=on_update)
+    finally:
+        learner.close()
 
 
 if __name__ == "__main__":
     batch_size = 1
+    telemetry = Telemetry('telemetry/dqn.jsonl')
     # env = CarRacingEnv.tf_batched_environment(batch_size)
-    env = CarRacingEnv.tf_environment()
+    env = CarRacingEnv.tf_environment(with_gui=ACTORS == 0, telemetry=telemetry)
+    # headless greedy episodes are deterministic, a single one is the average of any number of them
+    evaluator = PolicyEvaluator(map_type=MapType.PWR, num_episodes=1, temperature=None)
     model = get_ann(5, 9)
     agent = get_agent(model, env.time_step_spec(), env.action_spec())
-    num_iterations = 10_000
-    collect_steps_per_iteration = 12
-    replay_buffer = get_replay_buffer(agent, batch_size=env.batch_size)
-    for _ in range(10):
-        collect_step(env, agent.policy, replay_buffer)
-
-    checkpointer = Checkpointer(
+    checkpointer = AsyncCheckpointer(
         ckpt_dir='pwr_shaped',
-        max_to_keep=50,
         agent=agent,
-        policy=agent.policy,
-        global_step=agent.train_step_counter
+        max_to_keep=10,
+        step_interval=500,
+        time_interval_seconds=300
     )
     checkpointer.initialize_or_restore()
-    dataset = replay_buffer.as_dataset(
-        num_parallel_calls=3,
-        sample_batch_size=64,
-        num_steps=2,
-        single_deterministic_pass=False
-    ).prefetch(3)
-    iterator = iter(dataset)
-    env.reset()
-    agent.train = function(agent.train)  # optimizations
-    for _ in range(5):
-        with tf.device('/GPU:0'):
-            for _ in range(num_iterations):
-                for __ in range(collect_steps_per_iteration):
-                    collect_step(env, agent.policy, replay_buffer)
-                # Sample data from buffer and feed to network
-                experience, unused_info = next(iterator)
-                train_loss = agent.train(experience).loss
-                step = agent.train_step_counter.numpy()
-                checkpointer.save(step)
-                if step % 10 == 0:
-                    print(f"Step = {step}, Loss = {train_loss}, Average Return = {compute_avg_return(env, agent.policy)}")
+    if ACTORS > 0:
+        train_actor_learner(agent, model, evaluator, checkpointer, telemetry)
+    else:
+        num_iterations = 10_000
+        collect_steps_per_iteration = 12
+        replay_buffer = get_replay_buffer(agent, batch_size=env.batch_size)
+        for _ in range(10):
+            collect_step(env, agent.policy, replay_buffer)
+        dataset = replay_buffer.as_dataset(
+            num_parallel_calls=3,
+            sample_batch_size=64,
+            num_steps=2,
+            single_deterministic_pass=False
+        ).prefetch(3)
+        iterator = iter(dataset)
+        env.reset()
+        agent.train = function(agent.train)  # optimizations
+        for _ in range(5):
+            with tf.device('/GPU:0'):
+                for _ in range(num_iterations):
+                    for __ in range(collect_steps_per_iteration):
+                        collect_step(env, agent.policy, replay_buffer)
+                    # Sample data from buffer and feed to network
+                    experience, unused_info = next(iterator)
+                    train_loss = agent.train(experience).loss
+                    step = agent.train_step_counter.numpy()
+                    checkpointer.maybe_save(step)
+                    telemetry.scalar('loss', float(train_loss), int(step))
+                    telemetry.count('updates')
+                    if step % 10 == 0:
+                        evaluator.submit(step, model.get_weights())
+                    if step % 1000 == 0:
+                        print(f"Step = {step}, Loss = {train_loss}")
+                    for eval_step, avg_return in evaluator.results():
+                        telemetry.scalar('average_return', avg_return, eval_step)
+    checkpointer.save(agent.train_step_counter.numpy())
+    checkpointer.close()
+    evaluator.close()
+    telemetry.close()
@@ -3,12 +3,23 @@ from pathlib import Path
 import neat
 from dill import dumps
 
-from src.ai.neat import NeatController
-from src.game import MapType
+from src.ai.neat import (
+    NeatController, FitnessCache, TelemetryReporter, StreamingStatisticsReporter, PopulationCheckpointer, IslandRunner,
+    export_genome
+)
+from src.game import MapType, Telemetry, load_radar_table, use_radar_table
+from src.game.radar_table import builtin_radar_table_path
+
+# radars looked up in a table built by build_radar_tables.py instead of marched - far cheaper, slightly approximate
+RADAR_TABLE = False
+# memoized fitness of already evaluated networks - needs fixed episodes (no early generation end), which changes
+# what NEAT optimizes, see NeatController
+FITNESS_CACHE = False
+# populations evolved in parallel processes exchanging their best genomes, 0 evolves a single population in this one
+ISLANDS = 0
 
 
 if __name__ == "__main__":
-    controller = NeatController(MapType.W_SHAPED)
     CONFIGS_PATH = Path("src/ai/neat") / "configs"
     config_path = str((CONFIGS_PATH / "w_shaped.ini").resolve())
     config = neat.config.Config(
@@ -18,13 +29,31 @@ if __name__ == "__main__":
         neat.DefaultStagnation,
         config_path
     )
-    population = neat.Population(config)
-    population.add_reporter(neat.StdOutReporter(show_species_detail=True))
-    stats = neat.StatisticsReporter()
-    population.add_reporter(stats)
-    population.add_reporter(neat.Checkpointer(generation_interval=10, time_interval_seconds=None))
-    best_genome = population.run(controller.run, 100)
+    if ISLANDS > 0:
+        best_genome = IslandRunner(config_path, [MapType.W_SHAPED] * ISLANDS, 'islands').run(100)
+    else:
+        if RADAR_TABLE:
+            use_radar_table(load_radar_table(builtin_radar_table_path(MapType.W_SHAPED)))
+        telemetry = Telemetry('telemetry/neat.jsonl')
+        controller = NeatController(
+            MapType.W_SHAPED,
+            fitness_cache=FitnessCache(path='fitness_cache.json') if FITNESS_CACHE else None,
+            fixed_episodes=FITNESS_CACHE,
+            telemetry=telemetry
+        )
+        checkpointer = PopulationCheckpointer('checkpoints', generation_interval=10)
+        # resumes the latest checkpoint of an interrupted run
+        population = checkpointer.restore(config)
+        if population is None:
+            population = neat.Population(config)
+            checkpointer.watch(population)
+        population.add_reporter(neat.StdOutReporter(show_species_detail=True))
+        # appended every generation, plot_stats('statistics') plots it even mid-run
+        population.add_reporter(StreamingStatisticsReporter('statistics'))
+        population.add_reporter(TelemetryReporter(telemetry))
+        best_genome = population.run(controller.run, 100 - population.generation)
+        checkpointer.close()
+        telemetry.close()
     with open('best_genome', 'wb') as tf:
         tf.write(dumps(best_genome))
-    with open('statistics', 'wb') as tf:
-        tf.write(dumps(stats))
+    export_genome(best_genome, config, 'best_genome.net')